@@ -0,0 +1,183 @@
+"""
+Асинхронный движок: несколько альянсов в одном процессе.
+
+Все альянсы делят одну авторизованную requests.Session (общий пул
+соединений, один вход). Блокирующие запросы выполняются в ограниченном
+пуле потоков, asyncio отвечает только за расписание опросов.
+"""
+
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import Config
+from cluster import open_cluster
+from events import EventBus, MonitorStopped, add_sinks
+from monitor import MangaBuffMonitor, USER_AGENT
+import startup
+from transport import make_session
+
+
+class AsyncAllianceMonitor:
+    def __init__(self, alliance_ids=None):
+        self.config = Config()
+        self.alliance_ids = [str(a) for a in (alliance_ids or self.config.ALLIANCE_IDS)]
+        self.concurrency = max(1, min(self.config.MAX_CONCURRENT_POLLS, len(self.alliance_ids)))
+
+        # Общая сессия: пул соединений рассчитан на одновременные опросы
+        self.session = make_session(
+            'mangabuff', self.concurrency + 2, http2=self.config.HTTP2,
+            headers={"User-Agent": USER_AGENT},
+        )
+
+        # Одна шина на все альянсы: по потоку на приёмник, а не на альянс.
+        # В кластерном режиме шина — узел кластера (общий outbox)
+        self.cluster = open_cluster(self.config)
+        self.bus = self.cluster or EventBus()
+        multi = len(self.alliance_ids) > 1
+        # Вход и общие сообщения — через первый монитор
+        self.primary = self._make_monitor(self.alliance_ids[0], multi)
+        # Сессия общая — и следит за ней один SessionHealth первого монитора
+        self.monitors = [self.primary] + [
+            self._make_monitor(alliance_id, multi, health=self.primary.health)
+            for alliance_id in self.alliance_ids[1:]
+        ]
+        add_sinks(self.bus, self.config, {m.alliance_id: m.telegram for m in self.monitors})
+
+        self._stopped = None
+
+    def _make_monitor(self, alliance_id, multi, health=None):
+        return MangaBuffMonitor(
+            alliance_id,
+            session=self.session,
+            log_prefix=f"[{alliance_id}] " if multi else "",
+            bus=self.bus,
+            health=health,
+        )
+
+    def log(self, message, level=logging.INFO):
+        self.primary.log(message, level)
+
+    # ------------------------------------------------------------------
+    # Опрос одного альянса
+    # ------------------------------------------------------------------
+
+    async def _watch(self, monitor, phase):
+        # Разносим опросы по времени, чтобы не бить по сайту пачкой
+        await asyncio.sleep(phase)
+        try:
+            await asyncio.to_thread(monitor.announce_current)
+        except Exception as e:
+            # Сбой старта одного альянса не должен останавливать остальные:
+            # тайтл подхватит первый же опрос цикла
+            monitor.log(f"⚠️ Стартовый анонс не удался: {e}", logging.WARNING)
+            monitor.log(traceback.format_exc(), logging.DEBUG)
+
+        check_count = 0
+        while not self._stopped.is_set():
+            check_count += 1
+            try:
+                if check_count % 60 == 0:
+                    monitor.log(
+                        f"🔍 #{check_count} тайтл: {monitor.current_manga} | "
+                        f"разобрано {monitor.page_stats['parsed']}/{monitor.page_stats['polls']} | "
+                        f"интервал {monitor.scheduler.describe()} | "
+                        f"{monitor._telegram_status()}"
+                    )
+                await asyncio.to_thread(monitor.check_once, check_count)
+                monitor.watch_auth()
+
+            except requests.exceptions.RequestException as e:
+                # Потерю сессии ловит SessionHealth по ответам, здесь — только сеть
+                monitor.log(f"⚠️ Ошибка сети: {e}", logging.WARNING)
+                monitor.scheduler.on_error('network')
+                await asyncio.sleep(monitor.scheduler.next_delay())
+                continue
+
+            except Exception as e:
+                monitor.log(f"⚠️ Непредвиденная ошибка: {e}", logging.WARNING)
+                monitor.log(traceback.format_exc(), logging.ERROR)
+                monitor.scheduler.on_error('exception')
+                await asyncio.sleep(monitor.scheduler.next_delay())
+                continue
+
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=monitor.next_poll_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        self._stopped = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="poll")
+        )
+
+        self.log("🔧 Проверка конфигурации...")
+        self.config.validate()
+
+        if not await asyncio.to_thread(self.primary.ensure_session):
+            self.log("❌ Не удалось авторизоваться", logging.ERROR)
+            return
+        startup.mark('session')
+        self.primary.health.start()
+
+        self.log(
+            f"👀 Альянсов: {len(self.monitors)} | Интервал: "
+            f"{self.primary.scheduler.min_interval:g}–{self.primary.scheduler.max_interval:g} сек | "
+            f"Параллельно: {self.concurrency}"
+        )
+
+        step = self.primary.scheduler.min_interval / len(self.monitors)
+        tasks = [
+            asyncio.create_task(self._watch(monitor, i * step), name=f"alliance-{monitor.alliance_id}")
+            for i, monitor in enumerate(self.monitors)
+        ]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for monitor, result in zip(self.monitors, results):
+                if isinstance(result, Exception):
+                    monitor.log(f"❌ Опрос альянса остановлен: {result!r}", logging.ERROR)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def start(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            self.log("⏹️ Остановка...")
+            for monitor in self.monitors:
+                self.bus.publish(MonitorStopped(monitor.alliance_id))
+        except ValueError as e:
+            self.log(f"❌ Конфигурация: {e}", logging.ERROR)
+        except Exception as e:
+            self.log(f"❌ Критическая ошибка: {e}", logging.ERROR)
+            self.log(traceback.format_exc(), logging.ERROR)
+        finally:
+            self.primary.health.close()
+            self.primary.save_session()
+            self.bus.flush()
+            for monitor in self.monitors:
+                monitor.telegram.flush()
+                monitor.exp_series.close()
+            self.bus.close()
+            for monitor in self.monitors:
+                monitor.snapshot()
+            if self.primary.snapshots:
+                self.primary.snapshots.close()
+            if self.primary.archive:
+                self.primary.archive.close()
+            for monitor in self.monitors:
+                report = monitor.sources.report()
+                if report:
+                    monitor.log(f"📊 Источники: {report}")
+            report = self.primary.executor.report()
+            if report:
+                self.log(f"📊 Запросы: {report}")
+            self.primary.executor.close()
+            self.log("✅ Мониторинг завершён")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сверка и микробенчмарк экстракторов страницы альянса.
+
+    python bench/bench_extractors.py            # сверка + замеры
+    python bench/bench_extractors.py --check    # только сверка, код 1 при расхождении
+    python bench/bench_extractors.py -n 500     # число прогонов на фикстуру
+
+Эталон — bs4-бэкенд. Фикстуры лежат в bench/fixtures/*.html.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extractors import EXTRACTORS, get_extractor  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, 'bench', 'fixtures')
+
+
+def load_fixtures(pattern='*.html'):
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, pattern))):
+        with open(path, encoding='utf-8') as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def check_parity(fixtures):
+    """Сравнивает все бэкенды с bs4. Возвращает список расхождений."""
+    reference = get_extractor('bs4')
+    mismatches = []
+    for name, html in fixtures.items():
+        expected = reference.extract(html)
+        for backend in EXTRACTORS:
+            if backend == 'bs4':
+                continue
+            got = get_extractor(backend).extract(html)
+            if got != expected:
+                mismatches.append((name, backend, expected, got))
+    return mismatches
+
+
+def measure(extractor, html, runs):
+    """(мкс на разбор, КБ, оставшихся после разбора, пик КБ за разбор)"""
+    extractor.extract(html)  # прогрев
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        extractor.extract(html)
+    per_call_us = (time.perf_counter() - start) / runs * 1e6
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshot_start = tracemalloc.take_snapshot()
+    extractor.extract(html)
+    snapshot_end = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    retained = sum(
+        stat.size_diff for stat in snapshot_end.compare_to(snapshot_start, 'filename')
+        if stat.size_diff > 0
+    )
+    return per_call_us, retained / 1024, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=200)
+    parser.add_argument('--check', action='store_true', help="только сверка с bs4")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"❌ Нет фикстур в {FIXTURES_DIR}")
+        return 1
+
+    mismatches = check_parity(fixtures)
+    for name, backend, expected, got in mismatches:
+        print(f"❌ {name} [{backend}]\n   bs4:  {expected}\n   {backend}: {got}")
+    if not mismatches:
+        print(f"✅ Сверка: {len(fixtures)} фикстур, все бэкенды совпадают с bs4")
+    if args.check:
+        return 1 if mismatches else 0
+
+    print()
+    print(f"{'фикстура':<28} {'бэкенд':<6} {'мкс/разбор':>11} {'осталось КБ':>12} {'пик КБ':>8}")
+    for name, html in fixtures.items():
+        for backend in EXTRACTORS:
+            us, retained_kb, peak_kb = measure(get_extractor(backend), html, args.runs)
+            print(f"{name:<28} {backend:<6} {us:>11.1f} {retained_kb:>12.1f} {peak_kb:>8.1f}")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк монитора целиком на локальном стенде (bench/fake_mangabuff.py).
+
+    python bench/bench_monitor.py                       # все сценарии
+    python bench/bench_monitor.py -s churn -d 20        # один сценарий, 20 с
+    python bench/bench_monitor.py --write-baseline bench/baseline.json
+    python bench/bench_monitor.py --baseline bench/baseline.json   # код 1 при регрессии
+
+Каждый сценарий идёт в отдельном процессе: стенд, MangaBuffMonitor и
+TelegramNotifier работают с нуля, CPU и RSS считаются только для
+процесса монитора. Сеть наружу не нужна.
+
+Отчёт: опросов в секунду, p50/p99 задержки «изменение на сайте →
+подпись получена Telegram», CPU на опрос, пиковый RSS и сколько
+соединений открыто на сколько запросов.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'bench')
+FAKE_SERVER = os.path.join(BENCH_DIR, 'fake_mangabuff.py')
+
+sys.path.insert(0, BENCH_DIR)
+
+from fake_mangabuff import SCENARIOS  # noqa: E402
+
+# Что сравнивается с эталоном: метрика → больше ли — лучше
+CHECKED = {
+    'polls_per_sec': True,
+    'p99_ms': False,
+    'cpu_ms_per_poll': False,
+    'rss_mb': False,
+}
+# Абсолютный допуск для мелких значений, где относительный шум велик
+SLACK = {'p99_ms': 50.0, 'cpu_ms_per_poll': 0.2, 'rss_mb': 5.0}
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — КБ, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# ---------------------------------------------------------------------------
+# Прогон одного сценария (дочерний процесс)
+# ---------------------------------------------------------------------------
+
+def run_scenario(args):
+    server = subprocess.Popen(
+        [sys.executable, FAKE_SERVER, '--port', '0', '--scenario', args.child, '--seed', str(args.seed)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        base_url = server.stdout.readline().strip()
+        workdir = tempfile.mkdtemp(prefix='mangabuff-bench-')
+        os.environ.update({
+            'MANGABUFF_BASE_URL': base_url,
+            'TELEGRAM_API_URL': base_url,
+            'MANGABUFF_EMAIL': 'bench@example.com',
+            'MANGABUFF_PASSWORD': 'bench',
+            'TELEGRAM_BOT_TOKEN': '123456:bench',
+            'TELEGRAM_CHAT_ID': '-1001',
+            'ALLIANCE_IDS': '10',
+            'POLL_MIN_INTERVAL': str(args.interval),
+            'POLL_MAX_INTERVAL': str(args.max_interval),
+            'POLL_BACKOFF_MAX': str(args.backoff_max),
+            # Всё состояние — во временном каталоге или только в памяти
+            'HISTORY_DB': os.path.join(workdir, 'history.db'),
+            'SESSION_FILE': '',
+            'STATE_FILE': '',
+            # Задержка доставки меряется без интервала между правками
+            'TELEGRAM_EDIT_MIN_INTERVAL': '0',
+            'POSTER_CACHE_FILE': '',
+            'MANGA_CACHE_FILE': '',
+            'EXP_SERIES_DIR': '',
+            'LOG_CONSOLE_LEVEL': 'DEBUG' if args.verbose else 'CRITICAL',
+            'LOG_FILE_LEVEL': 'CRITICAL',
+        })
+        os.chdir(workdir)
+        sys.path.insert(0, ROOT)
+
+        import requests
+        from config import Config
+        from logsetup import setup_logging
+        from monitor import MangaBuffMonitor
+        from transport import pool_stats
+
+        setup_logging(Config)
+        monitor = MangaBuffMonitor()
+        if not monitor.ensure_session():
+            raise RuntimeError("стенд не принял вход")
+        monitor.announce_current()
+        monitor.bus.flush()
+        monitor.telegram.flush()
+
+        urlopen(Request(f"{base_url}/_bench/start?duration={args.duration}", method='POST'), timeout=5).read()
+        cpu_start = time.process_time()
+        started = time.monotonic()
+        deadline = started + args.duration
+        check_count = 0
+        while time.monotonic() < deadline:
+            check_count += 1
+            try:
+                monitor.check_once(check_count)
+            except requests.exceptions.RequestException:
+                monitor.scheduler.on_error('network')
+            time.sleep(monitor.scheduler.next_delay())
+        elapsed = time.monotonic() - started
+        monitor.bus.flush(timeout=30)
+        monitor.telegram.flush(timeout=30)
+        cpu = time.process_time() - cpu_start
+
+        report = json.loads(urlopen(f"{base_url}/_bench/report", timeout=5).read())
+        polls = monitor.page_stats['polls']
+        report.update({
+            'duration_s': round(elapsed, 2),
+            'polls': polls,
+            'polls_per_sec': round(polls / elapsed, 2),
+            'parsed': monitor.page_stats['parsed'],
+            'kb_per_poll': round(monitor.page_stats['bytes'] / polls / 1024, 1) if polls else None,
+            'p50_ms': report['latency_ms']['p50'],
+            'p99_ms': report['latency_ms']['p99'],
+            'cpu_percent': round(cpu / elapsed * 100, 1),
+            'cpu_ms_per_poll': round(cpu / polls * 1000, 3) if polls else None,
+            'rss_mb': round(_peak_rss_mb(), 1),
+            'telegram': monitor.telegram.stats(),
+            'connections': {f"{client} {host}": entry for (client, host), entry in pool_stats().items()},
+        })
+        monitor.exp_series.close()
+        monitor.bus.close()
+        return report
+    finally:
+        server.terminate()
+        server.wait(timeout=5)
+
+
+# ---------------------------------------------------------------------------
+# Сравнение с эталоном
+# ---------------------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Список регрессий: (сценарий, метрика, эталон, сейчас)."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric, higher_is_better in CHECKED.items():
+            base, got = expected.get(metric), result.get(metric)
+            if base is None or got is None:
+                continue
+            slack = SLACK.get(metric, 0.0)
+            if higher_is_better:
+                bad = got < base * (1 - tolerance)
+            else:
+                bad = got > base * (1 + tolerance) + slack
+            if bad:
+                regressions.append((name, metric, base, got))
+    return regressions
+
+
+def _fmt(value, digits=1):
+    return '—' if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="сценарий (можно несколько раз); по умолчанию все")
+    parser.add_argument('-d', '--duration', type=float, default=8.0, help="секунд на сценарий")
+    parser.add_argument('--interval', type=float, default=0.05, help="POLL_MIN_INTERVAL")
+    parser.add_argument('--max-interval', type=float, default=0.5, help="POLL_MAX_INTERVAL")
+    parser.add_argument('--backoff-max', type=float, default=2.0, help="POLL_BACKOFF_MAX")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="вывести результаты в JSON")
+    parser.add_argument('--baseline', help="сравнить с эталоном, код 1 при регрессии")
+    parser.add_argument('--write-baseline', help="сохранить результаты как эталон")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="допустимое ухудшение, доля")
+    parser.add_argument('-v', '--verbose', action='store_true', help="журнал монитора в консоль")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args), ensure_ascii=False))
+        return 0
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        cmd = [
+            sys.executable, os.path.abspath(__file__), '--child', name,
+            '--duration', str(args.duration), '--interval', str(args.interval),
+            '--max-interval', str(args.max_interval), '--backoff-max', str(args.backoff_max),
+            '--seed', str(args.seed),
+        ] + (['--verbose'] if args.verbose else [])
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            print(f"❌ {name}: прогон завершился с кодом {proc.returncode}")
+            return 1
+        results[name] = json.loads(lines[-1])
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'сценарий':<14} {'опрос/с':>8} {'p50 мс':>8} {'p99 мс':>8} {'CPU %':>6} "
+              f"{'CPU мс/опрос':>13} {'КБ/опрос':>9} {'RSS МБ':>7} {'доставлено':>11} {'429':>4} {'соед/запр':>10}")
+        for name, r in results.items():
+            delivered = sum(r['delivered'].values())
+            total = sum(r['events'].values())
+            conns = sum(c['connections'] for c in r['connections'].values())
+            reqs = sum(c['requests'] for c in r['connections'].values())
+            print(f"{name:<14} {r['polls_per_sec']:>8.1f} {_fmt(r['p50_ms']):>8} {_fmt(r['p99_ms']):>8} "
+                  f"{r['cpu_percent']:>6.1f} {_fmt(r['cpu_ms_per_poll'], 3):>13} {_fmt(r.get('kb_per_poll')):>9} "
+                  f"{r['rss_mb']:>7.1f} "
+                  f"{f'{delivered}/{total}':>11} {r['telegram']['rate_limited']:>4} {f'{conns}/{reqs}':>10}")
+
+    if args.write_baseline:
+        with open(args.write_baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                name: {metric: r.get(metric) for metric in CHECKED}
+                for name, r in results.items()
+            }, f, ensure_ascii=False, indent=2)
+        print(f"💾 Эталон сохранён: {args.write_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, base, got in regressions:
+            print(f"❌ {name}: {metric} {base} → {got}")
+        if regressions:
+            return 1
+        print(f"✅ Регрессий нет (допуск {args.tolerance:.0%})")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальный стенд: MangaBuff и Telegram Bot API на одном http.server.
+
+    python bench/fake_mangabuff.py --port 8080 --scenario churn
+
+Монитор направляется на стенд переменными окружения:
+    MANGABUFF_BASE_URL=http://127.0.0.1:8080
+    TELEGRAM_API_URL=http://127.0.0.1:8080
+
+Маршруты сайта: /, /login (GET/POST), /alliances/{id}/boost,
+/manga/{slug}. Telegram: /bot{token}/{method}. Управление стендом:
+  POST /_bench/start   — запустить сценарий (изменения на «сайте»)
+  GET  /_bench/report  — события, доставки и задержки в JSON
+
+Задержка «изменение → уведомление» считается целиком на стенде: время
+изменения и время, когда Telegram получил подпись с новым значением,
+берутся по одним часам.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Параметры сценариев, секунды. None — такого изменения в сценарии нет.
+SCENARIOS = {
+    # Ничего не меняется: чистая стоимость опроса
+    'steady': {},
+    # Частая смена тайтла и опыта
+    'churn': {'title_every': 1.0, 'exp_every': 0.25},
+    # Опыт растёт, сайт периодически отвечает 503
+    'storm_5xx': {'exp_every': 0.5, 'storm_every': 2.0, 'storm_length': 1.0},
+    # Смена тайтла и опыта, Telegram отвечает 429 на часть запросов
+    'telegram_429': {'title_every': 1.5, 'exp_every': 0.5, 'tg_429_rate': 0.3, 'retry_after': 1},
+    # Опыт растёт, сайт время от времени сбрасывает все сессии
+    'session_expiry': {'exp_every': 0.5, 'expire_every': 2.0},
+}
+
+_CODE_RE = re.compile(r'<code>(.*?)</code>')
+_EXP_RE = re.compile(r'Опыт: ([\d ]+) /')
+
+
+def _fmt(number):
+    return f"{number:,}".replace(",", " ")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class SiteState:
+    """Состояние «сайта», расписание изменений и журнал доставок."""
+
+    def __init__(self, scenario='steady', seed=1):
+        self.scenario = dict(SCENARIOS[scenario])
+        self.scenario_name = scenario
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.title_no = 1
+        self.level = 27
+        self.exp = 184520
+        self.exp_total = 250000
+        self.chance = 12
+        self.storm = False
+        self.tg_429_rate = 0.0
+        self.session_gen = 0
+
+        self.message_id = 1000
+        self.events = []        # (ts, kind, ключ)
+        self.arrivals = []      # (ts, method, текст)
+        self.requests = {}      # 'маршрут статус' → число
+        self.started_at = None
+        self._stop = threading.Event()
+
+        self.boost_template = _read_fixture('boost_basic.html')
+        self.login_page = _read_fixture('login_page.html')
+
+    @property
+    def slug(self):
+        return f"bench-manga-{self.title_no}"
+
+    @property
+    def title(self):
+        return f"Bench Manga {self.title_no}"
+
+    # ------------------------------------------------------------------
+    # Страницы
+    # ------------------------------------------------------------------
+
+    def boost_data(self):
+        """То же, что на странице, как отдал бы XHR-эндпоинт (DATA_SOURCE=auto)."""
+        with self.lock:
+            return {
+                'alliance': {
+                    'level': self.level, 'exp': self.exp, 'exp_total': self.exp_total,
+                    'chance_change_manga': self.chance, 'manga': {'slug': self.slug, 'title': self.title},
+                },
+            }
+
+    def boost_page(self, alliance_id):
+        with self.lock:
+            slug, level, exp, total, chance = self.slug, self.level, self.exp, self.exp_total, self.chance
+        # Токен в <meta> меняется на каждом запросе, как на настоящем сайте
+        token = f"{self.rng.getrandbits(64):016x}"
+        return (
+            self.boost_template
+            .replace('content="Xq9"', f'content="{token}"')
+            .replace('one-piece', slug)
+            .replace('Уровень 27', f'Уровень {level}')
+            .replace('>184 520<', f'>{_fmt(exp)}<')
+            .replace('>250 000<', f'>{_fmt(total)}<')
+            .replace('chance-change-manga">12<', f'chance-change-manga">{chance}<')
+            .replace('</body>', f'<div data-url="/alliances/{alliance_id}/boost/data"></div></body>')
+        )
+
+    def manga_page(self, slug):
+        m = re.fullmatch(r'bench-manga-(\d+)', slug)
+        if not m:
+            return None
+        return (
+            '<!DOCTYPE html><html lang="ru"><head><meta charset="UTF-8">'
+            f'<title>Bench Manga {m.group(1)}</title></head><body>'
+            f'<div class="manga"><div class="manga__img"><img src="/img/posters/{slug}.jpg" alt=""></div>'
+            f'<h1 class="manga__name">Bench Manga {m.group(1)}</h1></div></body></html>'
+        )
+
+    # ------------------------------------------------------------------
+    # Сценарий
+    # ------------------------------------------------------------------
+
+    def start(self, duration):
+        with self.lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.time()
+            self.tg_429_rate = self.scenario.get('tg_429_rate', 0.0)
+        threading.Thread(target=self._run, args=(duration,), name="scenario", daemon=True).start()
+
+    def _timeline(self, duration):
+        actions = []
+        for key, action in (('title_every', 'title'), ('exp_every', 'exp')):
+            every = self.scenario.get(key)
+            if every:
+                t = every
+                while t < duration:
+                    actions.append((t, action))
+                    t += every
+        every = self.scenario.get('expire_every')
+        if every:
+            t = every
+            while t < duration:
+                actions.append((t, 'expire'))
+                t += every
+        every = self.scenario.get('storm_every')
+        if every:
+            t = every
+            while t < duration:
+                actions.append((t, 'storm_on'))
+                actions.append((t + self.scenario.get('storm_length', every / 2), 'storm_off'))
+                t += every
+        return sorted(actions)
+
+    def _run(self, duration):
+        for offset, action in self._timeline(duration):
+            if self._stop.wait(max(0.0, self.started_at + offset - time.time())):
+                return
+            with self.lock:
+                now = time.time()
+                if action == 'title':
+                    self.title_no += 1
+                    self.events.append((now, 'title', self.title))
+                elif action == 'exp':
+                    self.exp += self.rng.randint(10, 500)
+                    if self.exp >= self.exp_total:
+                        self.level += 1
+                        self.exp -= self.exp_total
+                    self.events.append((now, 'stats', _fmt(self.exp)))
+                elif action == 'expire':
+                    self.session_gen += 1
+                elif action == 'storm_on':
+                    self.storm = True
+                elif action == 'storm_off':
+                    self.storm = False
+        with self.lock:
+            self.storm = False
+
+    def stop(self):
+        self._stop.set()
+
+    # ------------------------------------------------------------------
+    # Отчёт
+    # ------------------------------------------------------------------
+
+    def record_arrival(self, method, text):
+        with self.lock:
+            self.arrivals.append((time.time(), method, text or ''))
+
+    def count(self, route, status):
+        key = f"{route} {status}"
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def report(self):
+        with self.lock:
+            events, arrivals = list(self.events), list(self.arrivals)
+            requests = dict(self.requests)
+
+        latencies = {'title': [], 'stats': []}
+        unmatched = {'title': 0, 'stats': 0}
+        for ts, kind, key in events:
+            delivered = None
+            for arrived, method, text in arrivals:
+                if arrived < ts:
+                    continue
+                if kind == 'title':
+                    if method in ('sendPhoto', 'sendMessage') and key in _CODE_RE.findall(text):
+                        delivered = arrived
+                        break
+                elif key in _EXP_RE.findall(text):
+                    delivered = arrived
+                    break
+            if delivered is None:
+                # Промежуточное значение опыта могло не попасть ни в один
+                # опрос или быть схлопнуто следующей правкой
+                unmatched[kind] += 1
+            else:
+                latencies[kind].append(delivered - ts)
+
+        combined = latencies['title'] + latencies['stats']
+        return {
+            'scenario': self.scenario_name,
+            'events': {k: sum(1 for e in events if e[1] == k) for k in ('title', 'stats')},
+            'delivered': {k: len(v) for k, v in latencies.items()},
+            'unmatched': unmatched,
+            'latency_ms': {
+                'p50': _ms(_percentile(combined, 50)),
+                'p99': _ms(_percentile(combined, 99)),
+                'title_p50': _ms(_percentile(latencies['title'], 50)),
+                'stats_p50': _ms(_percentile(latencies['stats'], 50)),
+            },
+            'telegram_calls': len(arrivals),
+            'requests': requests,
+        }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 1)
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        # --------------------------------------------------------------
+        # Ответы
+        # --------------------------------------------------------------
+
+        def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None, route=None):
+            data = body.encode('utf-8') if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or []):
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            if route:
+                state.count(route, status)
+
+        def _json(self, status, payload, route=None):
+            self._send(status, json.dumps(payload, ensure_ascii=False), 'application/json', route=route)
+
+        def _cookies(self):
+            return self.headers.get('Cookie', '')
+
+        def _authed(self):
+            m = re.search(r'mangabuff_session=([^;\s]+)', self._cookies())
+            return bool(m) and m.group(1) == f"authed{state.session_gen}"
+
+        def _read_form(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length).decode('utf-8') if length else ''
+            return {k: v[-1] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+        def log_message(self, format, *args):
+            pass
+
+        # --------------------------------------------------------------
+        # Маршруты
+        # --------------------------------------------------------------
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            xsrf = [('Set-Cookie', 'XSRF-TOKEN=bench-xsrf; Path=/')]
+
+            if path == '/_bench/report':
+                self._json(200, state.report())
+            elif path == '/':
+                auth = 1 if self._authed() else 0
+                self._send(200, (
+                    '<!DOCTYPE html><html><head><meta name="csrf-token" content="bench-csrf">'
+                    f'<script>window.isAuth = {auth}; window.user_id = {104233 if auth else 0};</script>'
+                    '</head><body></body></html>'
+                ), headers=xsrf, route='/')
+            elif path == '/login':
+                self._send(200, state.login_page, headers=xsrf, route='/login')
+            elif re.fullmatch(r'/alliances/\d+/boost(/data)?', path):
+                route = 'boost_json' if path.endswith('/data') else 'boost'
+                if state.storm:
+                    self._send(503, 'Service Unavailable', 'text/plain', route=route)
+                elif not self._authed():
+                    self._send(302, '', headers=[('Location', '/login')], route=route)
+                elif route == 'boost_json':
+                    if self.headers.get('X-Requested-With') != 'XMLHttpRequest':
+                        self._send(404, 'Not Found', 'text/plain', route=route)
+                    else:
+                        self._json(200, state.boost_data(), route=route)
+                else:
+                    self._send(200, state.boost_page(path.split('/')[2]), route=route)
+            elif path.startswith('/manga/'):
+                page = state.manga_page(path[len('/manga/'):])
+                if page is None:
+                    self._send(404, 'Not Found', 'text/plain', route='manga')
+                else:
+                    self._send(200, page, route='manga')
+            else:
+                self._send(404, 'Not Found', 'text/plain')
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+
+            if path == '/_bench/start':
+                query = parse_qs(urlsplit(self.path).query)
+                state.start(float(query.get('duration', ['10'])[0]))
+                self._json(200, {'ok': True})
+            elif path == '/login':
+                self._read_form()
+                self._send(
+                    200, json.dumps({'status': 'ok'}), 'application/json',
+                    headers=[('Set-Cookie', f'mangabuff_session=authed{state.session_gen}; Path=/; HttpOnly')],
+                    route='/login POST',
+                )
+            elif path.startswith('/bot'):
+                self._telegram(path.rsplit('/', 1)[-1], self._read_form())
+            else:
+                self._send(404, 'Not Found', 'text/plain')
+
+        def _telegram(self, method, form):
+            if state.tg_429_rate and state.rng.random() < state.tg_429_rate:
+                retry_after = state.scenario.get('retry_after', 1)
+                self._json(429, {
+                    'ok': False, 'error_code': 429,
+                    'description': f"Too Many Requests: retry after {retry_after}",
+                    'parameters': {'retry_after': retry_after},
+                }, route=f"tg {method}")
+                return
+
+            state.record_arrival(method, form.get('caption') or form.get('text'))
+            with state.lock:
+                state.message_id += 1
+                message_id = state.message_id
+            if method == 'sendPhoto':
+                result = {'message_id': message_id, 'photo': [{'file_id': f"bench-file-{message_id}"}]}
+            elif method == 'editMessageCaption':
+                result = {'message_id': int(form.get('message_id') or 0)}
+            else:
+                result = {'message_id': message_id}
+            self._json(200, {'ok': True, 'result': result}, route=f"tg {method}")
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент вправе закрыть соединение, не дочитав тело (STREAM_FETCH)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def serve(port=0, scenario='steady', seed=1, host='127.0.0.1'):
+    """Поднимает стенд в фоновом потоке. Возвращает (server, state)."""
+    state = SiteState(scenario, seed=seed)
+    server = _Server((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-mangabuff", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд MangaBuff + Telegram")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='steady')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server, state = serve(args.port, args.scenario, args.seed, args.host)
+    # Первая строка — адрес: по ней bench_monitor.py находит стенд
+    print(f"http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        state.stop()
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
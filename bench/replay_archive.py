@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Прогон экстракторов по архиву страниц (page_archive.py).
+
+    python bench/replay_archive.py                      # PAGE_ARCHIVE_DIR, все бэкенды
+    python bench/replay_archive.py archive/ -e regex    # один бэкенд
+    python bench/replay_archive.py --kind manga         # только страницы манги
+    python bench/replay_archive.py --check              # код 1 при расхождении
+
+Для каждой страницы бэкенд сравнивается с записанным при опросе
+результатом (если версия схемы та же) и с bs4 на той же странице.
+Записанная ошибка разбора считается результатом None.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extractors import KINDS, SCHEMA_VERSION, get_extractor  # noqa: E402
+from page_archive import read_archive  # noqa: E402
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Totals:
+    def __init__(self):
+        self.pages = 0
+        self.errors = 0
+        self.vs_recorded = 0
+        self.vs_bs4 = 0
+        self.timings = []
+
+
+def replay(entries, kinds, backends=None, limit=None):
+    """
+    (итоги по (вид, бэкенд), расхождения, пропущено записей другой схемы).
+    Расхождение — (запись, бэкенд, с чем сравнивали, ожидалось, получено).
+    """
+    extractors = {
+        kind: {name: get_extractor(name, kind=kind) for name in KINDS[kind] if not backends or name in backends}
+        for kind in kinds
+    }
+    references = {kind: get_extractor('bs4', kind=kind) for kind in kinds}
+    totals = defaultdict(Totals)
+    mismatches = []
+    other_schema = 0
+    seen = 0
+
+    for entry in entries:
+        kind = entry.get('kind')
+        if kind not in extractors:
+            continue
+        if limit is not None and seen >= limit:
+            break
+        seen += 1
+        html = entry['html']
+        same_schema = entry.get('schema') == SCHEMA_VERSION
+        if not same_schema:
+            other_schema += 1
+
+        results = {}
+        for name, extractor in extractors[kind].items():
+            t = totals[(kind, name)]
+            t.pages += 1
+            start = time.perf_counter()
+            try:
+                got = extractor.extract(html)
+            except Exception as e:
+                t.timings.append(time.perf_counter() - start)
+                t.errors += 1
+                mismatches.append((entry, name, 'error', entry.get('error'), f"{type(e).__name__}: {e}"))
+                continue
+            t.timings.append(time.perf_counter() - start)
+            results[name] = got
+
+            if same_schema and got != entry.get('record'):
+                t.vs_recorded += 1
+                mismatches.append((entry, name, 'recorded', entry.get('record'), got))
+
+        if 'bs4' in results:
+            reference = results['bs4']
+        else:
+            try:
+                reference = references[kind].extract(html)
+            except Exception:
+                reference = None
+        for name, got in results.items():
+            if name != 'bs4' and got != reference:
+                totals[(kind, name)].vs_bs4 += 1
+                mismatches.append((entry, name, 'bs4', reference, got))
+
+    return totals, mismatches, other_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', help="каталоги архива или файлы сегментов")
+    parser.add_argument('-e', '--extractor', action='append', dest='backends',
+                        help="бэкенд (можно несколько раз; по умолчанию все)")
+    parser.add_argument('--kind', choices=sorted(KINDS), action='append', dest='kinds')
+    parser.add_argument('--limit', type=int, help="не больше N страниц")
+    parser.add_argument('--show', type=int, default=5, help="сколько расхождений показать")
+    parser.add_argument('--check', action='store_true', help="код 1 при любом расхождении")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        from config import Config
+        if not Config.PAGE_ARCHIVE_DIR:
+            print("❌ Укажите каталог архива или PAGE_ARCHIVE_DIR")
+            return 1
+        paths = [Config.PAGE_ARCHIVE_DIR]
+
+    started = time.perf_counter()
+    totals, mismatches, other_schema = replay(
+        read_archive(paths), args.kinds or list(KINDS), set(args.backends or ()), args.limit
+    )
+    elapsed = time.perf_counter() - started
+
+    if not totals:
+        print(f"❌ В архиве нет страниц: {', '.join(paths)}")
+        return 1
+
+    print(f"{'вид':<9} {'бэкенд':<6} {'страниц':>8} {'мкс p50':>9} {'мкс p99':>9} "
+          f"{'стр/с':>8} {'≠запись':>8} {'≠bs4':>6} {'ошибок':>7}")
+    for (kind, name), t in sorted(totals.items()):
+        rate = t.pages / sum(t.timings) if sum(t.timings) else 0.0
+        print(f"{kind:<9} {name:<6} {t.pages:>8} {_percentile(t.timings, 0.5) * 1e6:>9.1f} "
+              f"{_percentile(t.timings, 0.99) * 1e6:>9.1f} {rate:>8.0f} "
+              f"{t.vs_recorded:>8} {t.vs_bs4:>6} {t.errors:>7}")
+    if other_schema:
+        print(f"ℹ️ Записей другой версии схемы (без сверки с записанным): {other_schema}")
+
+    for entry, name, against, expected, got in mismatches[:args.show]:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.get('ts', 0)))
+        print(f"\n❌ {entry.get('url')} ({when}) [{name} ≠ {against}]")
+        print(f"   {against}: {expected}\n   {name}: {got}")
+    if len(mismatches) > args.show:
+        print(f"\n… ещё расхождений: {len(mismatches) - args.show}")
+    if not mismatches:
+        print("✅ Расхождений нет")
+    print(f"\nВсего {elapsed:.1f} с")
+
+    if args.check:
+        return 1 if mismatches else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
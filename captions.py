@@ -0,0 +1,106 @@
+"""
+Подписи к постам манги.
+
+Статичные части подписи (название, ссылка на альянс) собираются один
+раз на мангу и хранятся в небольшом LRU; при каждом изменении опыта
+подставляются только числа.
+
+caption_key() — то, что в подписи действительно видно как изменение:
+подпись без строки со временем. По нему уведомитель понимает, что правка
+ничего не поменяет и её можно не отправлять.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+CLOCK_PREFIX = "🕐 "
+TEMPLATE_CACHE_SIZE = 64
+
+
+def _spaced(number):
+    return f"{number:,}".replace(",", " ")
+
+
+def format_duration(seconds):
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} д {hours} ч"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    return f"{minutes} мин"
+
+
+class CaptionTemplate:
+    """Подпись одной манги: заголовок и ссылка готовы, числа подставляются."""
+
+    def __init__(self, title, alliance_url):
+        # Название копируемое + пустая строка после
+        self.head = f"📚 <code>{title}</code>\n"
+        # Ссылка скрыта под текстом
+        self.link = f'\n🔗 <a href="{alliance_url}">Перейти к вкладке альянса</a>\n'
+
+    def render(self, page_data=None, exp_gain_today=None, exp_stats=None, now=None):
+        lines = [self.head]
+
+        if page_data:
+            exp_cur = page_data.get('exp_current')
+            exp_tot = page_data.get('exp_total')
+            chance = page_data.get('chance')
+
+            if exp_cur is not None and exp_tot is not None:
+                lines.append(f"⭐ Опыт: {_spaced(exp_cur)} / {_spaced(exp_tot)}")
+            elif exp_cur is not None:
+                lines.append(f"⭐ Опыт: {_spaced(exp_cur)}")
+
+            if chance is not None:
+                lines.append(f"🎲 Шанс смены: {chance}%")
+
+        lines.append(self.link)
+        lines.append(f"{CLOCK_PREFIX}{(now or datetime.now()).strftime('%d.%m.%Y %H:%M:%S')}")
+
+        if exp_gain_today is not None:
+            lines.append(f"📈 Прирост за сегодня: +{_spaced(exp_gain_today)} опыта")
+        else:
+            lines.append("📈 Прирост за сегодня: —")
+
+        if exp_stats:
+            rate = exp_stats.get('rate_per_hour')
+            if rate:
+                lines.append(f"⚡ Темп: +{_spaced(round(rate))} опыта/ч")
+            eta = exp_stats.get('eta_seconds')
+            if eta is not None:
+                lines.append(f"⏳ До уровня: ~{format_duration(eta)}")
+
+        return "\n".join(lines)
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def template_for(title, alliance_url):
+    key = (title, alliance_url)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = CaptionTemplate(title, alliance_url)
+            if len(_templates) > TEMPLATE_CACHE_SIZE:
+                _templates.popitem(last=False)
+        else:
+            _templates.move_to_end(key)
+        return template
+
+
+def render_caption(manga_info, alliance_url, page_data=None, exp_gain_today=None, exp_stats=None):
+    template = template_for(manga_info.get('title', '—'), alliance_url)
+    return template.render(page_data, exp_gain_today, exp_stats)
+
+
+def caption_key(caption):
+    """Подпись без строки времени — для сравнения «изменилось ли что-то видимое»."""
+    if not caption or CLOCK_PREFIX not in caption:
+        return caption
+    return "\n".join(line for line in caption.split("\n") if not line.startswith(CLOCK_PREFIX))
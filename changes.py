@@ -0,0 +1,147 @@
+"""
+Определение изменений статистики альянса: дельты по полям и пороги значимости.
+
+Каждый опрос сравнивается с last_page_data — данными последнего
+опубликованного StatsChanged. diff() даёт дельты по полям:
+
+    {'exp_current': {'old': 1200, 'new': 1201, 'diff': 1}, 'chance': {...}}
+
+diff — разность для чисел (опыт, уровень, шанс в процентах), None — если
+значение не число. Дельта значима, если |diff| не меньше порога поля
+(CHANGE_THRESHOLDS, например "exp_current=500,chance=0"); порог 0 или
+отсутствие порога — значимо любое изменение. Нечисловое изменение значимо
+всегда.
+
+Незначимые дельты не публикуются, а копятся относительно той же базы:
+событие уйдёт, когда накопленная разность дорастёт до порога или когда
+с первой отложенной дельты пройдёт batch_window секунд (0 — только по
+порогу). В событие попадает весь набор дельт — приёмники по нему решают,
+стоит ли править подпись, писать в журнал и т.п.
+
+По умолчанию порогов нет — поведение как раньше: любое изменение опыта,
+шанса или уровня сразу публикуется.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+from metrics import STAT_CHANGES_TOTAL
+
+# Поля статистики; slug (смена тайтла) обрабатывается отдельно
+STAT_FIELDS = ('exp_current', 'exp_total', 'chance', 'level')
+
+
+def _number(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).replace(',', '.').strip().rstrip('%'))
+    except ValueError:
+        return None
+
+
+def parse_thresholds(text):
+    """'exp_current=500, chance=0' → {'exp_current': 500.0, 'chance': 0.0}."""
+    thresholds = {}
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, value = part.partition('=')
+        name = name.strip()
+        if not sep or name not in STAT_FIELDS:
+            raise ValueError(f"CHANGE_THRESHOLDS: ожидалось поле=число из {', '.join(STAT_FIELDS)}: {part!r}")
+        thresholds[name] = float(value)
+    return thresholds
+
+
+def diff(old, new, fields=STAT_FIELDS):
+    """Дельты полей, значения которых различаются."""
+    deltas = {}
+    for name in fields:
+        before, after = old.get(name), new.get(name)
+        if before == after:
+            continue
+        a, b = _number(before), _number(after)
+        delta = b - a if a is not None and b is not None else None
+        deltas[name] = {'old': before, 'new': after, 'diff': delta}
+    return deltas
+
+
+def merge_deltas(older, newer):
+    """
+    Дельты двух последовательных событий как одно: база — из первого,
+    значение — из второго. Поля, вернувшиеся к исходному значению, выпадают.
+    """
+    merged = {}
+    for name in (*older, *(n for n in newer if n not in older)):
+        before = older[name]['old'] if name in older else newer[name]['old']
+        after = newer[name]['new'] if name in newer else older[name]['new']
+        if before != after:
+            merged.update(diff({name: before}, {name: after}, (name,)))
+    return merged
+
+
+@dataclass(frozen=True)
+class ChangeSet:
+    deltas: dict
+    # significant — дельта дошла до порога, batch — истекло окно накопления
+    reason: str
+    # Поля, из-за которых событие опубликовано (для batch — пусто)
+    significant: tuple = field(default=())
+
+
+class ChangeDetector:
+    def __init__(self, thresholds=None, batch_window=60.0, fields=STAT_FIELDS):
+        self.thresholds = dict(thresholds or {})
+        self.batch_window = batch_window
+        self.fields = tuple(fields)
+        self.pending_since = None
+
+    def diff(self, old, new):
+        return diff(old, new, self.fields)
+
+    def is_significant(self, name, delta):
+        threshold = self.thresholds.get(name)
+        if not threshold or delta['diff'] is None:
+            return True
+        return abs(delta['diff']) >= threshold
+
+    def observe(self, baseline, new, now=None):
+        """
+        ChangeSet, если изменения относительно baseline пора публиковать,
+        иначе None (изменений нет или они отложены).
+        """
+        if not baseline:
+            return None
+        deltas = self.diff(baseline, new)
+        if not deltas:
+            self.pending_since = None
+            return None
+        now = time.monotonic() if now is None else now
+        significant = tuple(name for name, delta in deltas.items() if self.is_significant(name, delta))
+        if significant:
+            reason = 'significant'
+        elif self.pending_since is None:
+            self.pending_since = now
+            for name in deltas:
+                STAT_CHANGES_TOTAL.labels(name, 'deferred').inc()
+            return None
+        elif self.batch_window and now - self.pending_since >= self.batch_window:
+            reason = 'batch'
+        else:
+            return None
+        self.pending_since = None
+        for name in deltas:
+            STAT_CHANGES_TOTAL.labels(name, reason).inc()
+        return ChangeSet(deltas, reason, significant)
+
+    def reset(self):
+        """Смена тайтла: отложенные дельты старой подписи больше не нужны."""
+        self.pending_since = None
+
+    @property
+    def pending(self):
+        return self.pending_since is not None
@@ -0,0 +1,556 @@
+"""
+Кластерный режим: несколько узлов следят за одними альянсами, пишет в
+Telegram только один.
+
+Узлы делят SQLite-файл (CLUSTER_DB) на одной машине или общем диске:
+
+  lease  — аренда ведущего. Узел продлевает её каждую треть срока;
+           если ведущий упал или завис, аренду через CLUSTER_LEASE_TTL
+           забирает резервный узел.
+  nodes  — живые узлы; по ним считается сдвиг фазы опросов, чтобы узлы
+           опрашивали сайт по очереди, а не одновременно.
+  state  — общее состояние: снимок монитора (slug, данные страницы,
+           учёт опыта), message_id постов и «заявки» на события.
+  outbox — события, замеченные любым узлом. Доставляет их только
+           ведущий, через свои приёмники.
+
+Одно изменение, замеченное двумя узлами, записывается один раз: узел
+заявляет событие (новый slug, новая статистика, новые сутки) в одной
+транзакции с записью в outbox, и вторая заявка того же изменения
+отбрасывается как дубль.
+
+Каждому узлу нужен свой EXP_SERIES_DIR: ряд опыта — файл одного процесса.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from events import (
+    AuthLost, DayRollover, EventBus, MonitorStopped, StatsChanged, TitleChanged, event_from_dict,
+)
+from logsetup import get_logger
+from metrics import CLUSTER_EVENTS_TOTAL, CLUSTER_LEADER
+
+log = get_logger('cluster')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lease (
+    name    TEXT PRIMARY KEY,
+    holder  TEXT NOT NULL,
+    expires REAL NOT NULL,
+    term    INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    seen    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key     TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data    TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL NOT NULL,
+    alliance_id TEXT,
+    node_id     TEXT,
+    data        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+LEADER_LEASE = 'leader'
+STATS_KEYS = ('exp_current', 'exp_total', 'chance', 'level')
+# Доставленные события храним час — для разбора, потом удаляем
+OUTBOX_KEEP = 3600
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ClusterStore:
+    """Таблицы кластера в одном SQLite-файле (WAL, транзакции BEGIN IMMEDIATE)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _tx(self):
+        with self._lock:
+            # IMMEDIATE: блокировка записи сразу, чтение-проверка-запись атомарны между узлами
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ------------------------------------------------------------------
+    # Аренда и узлы
+    # ------------------------------------------------------------------
+
+    def acquire_lease(self, node_id, ttl, name=LEADER_LEASE):
+        """Берёт или продлевает аренду. Возвращает (ведущий ли, срок до, term)."""
+        now = time.time()
+        with self._tx() as c:
+            row = c.execute("SELECT holder, expires, term FROM lease WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                c.execute("INSERT INTO lease VALUES (?, ?, ?, 1)", (name, node_id, now + ttl))
+                return True, now + ttl, 1
+            if row['holder'] == node_id or row['expires'] < now:
+                term = row['term'] if row['holder'] == node_id else row['term'] + 1
+                c.execute(
+                    "UPDATE lease SET holder = ?, expires = ?, term = ? WHERE name = ?",
+                    (node_id, now + ttl, term, name),
+                )
+                return True, now + ttl, term
+            return False, row['expires'], row['term']
+
+    def release_lease(self, node_id, name=LEADER_LEASE):
+        with self._tx() as c:
+            c.execute("UPDATE lease SET expires = 0 WHERE name = ? AND holder = ?", (name, node_id))
+
+    def heartbeat(self, node_id):
+        now = time.time()
+        with self._tx() as c:
+            c.execute(
+                "INSERT INTO nodes VALUES (?, ?, ?) ON CONFLICT(node_id) DO UPDATE SET seen = excluded.seen",
+                (node_id, now, now),
+            )
+
+    def leave(self, node_id):
+        with self._tx() as c:
+            c.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def live_nodes(self, ttl):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT node_id FROM nodes WHERE seen >= ? ORDER BY node_id", (time.time() - ttl,)
+            ).fetchall()
+        return [r['node_id'] for r in rows]
+
+    # ------------------------------------------------------------------
+    # Общее состояние
+    # ------------------------------------------------------------------
+
+    def get_state(self, key):
+        """(version, data) или (0, None)."""
+        with self._lock:
+            row = self._conn.execute("SELECT version, data FROM state WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return 0, None
+        return row['version'], json.loads(row['data'])
+
+    def _put_state(self, c, key, data):
+        c.execute(
+            "INSERT INTO state (key, version, data, updated) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET version = version + 1, data = excluded.data, "
+            "updated = excluded.updated",
+            (key, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+        return c.execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()[0]
+
+    def put_state(self, key, data):
+        """Записывает состояние (последний пишущий побеждает). Возвращает версию."""
+        with self._tx() as c:
+            return self._put_state(c, key, data)
+
+    def claim(self, key, decide, record, alliance_id, node_id):
+        """
+        Заявка на событие: decide(текущая заявка или {}) возвращает новую
+        заявку или None (дубль). Новая заявка и запись в outbox — одной
+        транзакцией. Возвращает id записи outbox или None.
+        """
+        with self._tx() as c:
+            row = c.execute("SELECT data FROM state WHERE key = ?", (key,)).fetchone()
+            claimed = decide(json.loads(row['data']) if row else {})
+            if claimed is None:
+                return None
+            self._put_state(c, key, claimed)
+            return self._append(c, record, alliance_id, node_id)
+
+    def _append(self, c, record, alliance_id, node_id):
+        return c.execute(
+            "INSERT INTO outbox (ts, alliance_id, node_id, data) VALUES (?, ?, ?, ?)",
+            (time.time(), alliance_id, node_id, json.dumps(record, ensure_ascii=False)),
+        ).lastrowid
+
+    def append(self, record, alliance_id, node_id):
+        with self._tx() as c:
+            return self._append(c, record, alliance_id, node_id)
+
+    # ------------------------------------------------------------------
+    # Очередь событий
+    # ------------------------------------------------------------------
+
+    def pending(self, after_id, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM outbox WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+        return [(r['id'], json.loads(r['data'])) for r in rows]
+
+    def cursor(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'delivered_id'").fetchone()
+        if row is not None:
+            return int(row['value'])
+        # Новый кластер: всё, что уже лежит в outbox, считаем новым
+        return 0
+
+    def set_cursor(self, delivered_id):
+        with self._tx() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('delivered_id', ?)", (str(delivered_id),)
+            )
+            c.execute(
+                "DELETE FROM outbox WHERE id <= ? AND ts < ?", (delivered_id, time.time() - OUTBOX_KEEP)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Заявки: одно изменение — одно событие на весь кластер
+# ---------------------------------------------------------------------------
+
+def _stats(page_data):
+    return [(page_data or {}).get(k) for k in STATS_KEYS]
+
+
+def _claim_title(event):
+    def decide(claimed):
+        if claimed.get('slug') == event.slug:
+            return None
+        return {**claimed, 'slug': event.slug, 'stats': _stats(event.page_data)}
+    return decide
+
+
+def _claim_stats(event):
+    def decide(claimed):
+        # Статистика старого тайтла после смены уже не нужна
+        if claimed.get('slug') not in (None, event.slug):
+            return None
+        stats = _stats(event.page_data)
+        if claimed.get('stats') == stats:
+            return None
+        return {**claimed, 'slug': event.slug, 'stats': stats}
+    return decide
+
+
+def _claim_day(event):
+    def decide(claimed):
+        if claimed.get('day') == event.day:
+            return None
+        return {**claimed, 'day': event.day}
+    return decide
+
+
+CLAIMS = {TitleChanged: _claim_title, StatsChanged: _claim_stats, DayRollover: _claim_day}
+
+
+# ---------------------------------------------------------------------------
+# Узел
+# ---------------------------------------------------------------------------
+
+class ClusterNode:
+    """
+    Узел кластера. Для монитора выглядит как EventBus: publish() пишет
+    событие в общий outbox, а приёмники (subscribe) получают события
+    всего кластера, пока узел — ведущий.
+    """
+
+    def __init__(self, path, node_id=None, lease_ttl=10.0, outbox_poll=0.2):
+        self.store = ClusterStore(path)
+        self.node_id = node_id or default_node_id()
+        self.lease_ttl = lease_ttl
+        self.outbox_poll = outbox_poll
+
+        self.local = EventBus()
+        self.monitors = {}          # alliance_id → MangaBuffMonitor
+        self._seen_versions = {}    # ключ state → версия, уже применённая/записанная узлом
+        self._pushed = {}           # ключ state → последний записанный JSON
+
+        self.is_leader = False
+        self.term = 0
+        self._lease_until = 0.0
+        self._cursor = 0
+        self._state_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._drained = 0           # число проходов по outbox — для flush()
+        self._delivered = threading.Condition()
+
+        self._tick()
+        self._threads = [
+            threading.Thread(target=self._lease_loop, name="cluster-lease", daemon=True),
+            threading.Thread(target=self._outbox_loop, name="cluster-outbox", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ------------------------------------------------------------------
+    # Аренда ведущего
+    # ------------------------------------------------------------------
+
+    def _tick(self):
+        try:
+            self.store.heartbeat(self.node_id)
+            leader, until, term = self.store.acquire_lease(self.node_id, self.lease_ttl)
+        except sqlite3.Error as e:
+            log.warning(f"⚠️ Кластер: {e}")
+            leader, until, term = False, 0.0, self.term
+        if leader and not self.is_leader:
+            self._take_over()
+            log.info(f"👑 Узел {self.node_id} стал ведущим (term {term})")
+        elif not leader and self.is_leader:
+            log.warning(f"⚠️ Узел {self.node_id} больше не ведущий")
+        self._lease_until = until if leader else 0.0
+        self.term = term
+        self.is_leader = leader
+        CLUSTER_LEADER.labels(self.node_id).set(1 if leader else 0)
+        self._wake.set()
+
+    def _leading(self):
+        # Запас в треть срока: зависший узел перестаёт слать раньше, чем аренду заберут
+        return self.is_leader and time.time() < self._lease_until - self.lease_ttl / 3
+
+    def _lease_loop(self):
+        while not self._stop.wait(self.lease_ttl / 3):
+            self._tick()
+
+    def _take_over(self):
+        """Новый ведущий: message_id постов — из общего состояния, события — с курсора."""
+        for alliance_id, monitor in list(self.monitors.items()):
+            _, data = self.store.get_state(f"telegram:{alliance_id}")
+            if data:
+                monitor.telegram.restore_state(data)
+        self._cursor = self.store.cursor()
+
+    # ------------------------------------------------------------------
+    # Фаза опросов
+    # ------------------------------------------------------------------
+
+    def phase(self):
+        """(номер узла, число живых узлов)."""
+        nodes = self.store.live_nodes(self.lease_ttl)
+        if self.node_id not in nodes:
+            return 0, 1
+        return nodes.index(self.node_id), len(nodes)
+
+    def align(self, delay):
+        """
+        Сдвигает задержку до ближайшего своего слота: узел k из n опрашивает
+        в моменты k/n·delay по сетке с шагом delay (часы у узлов общие).
+        """
+        if delay <= 0:
+            return delay
+        rank, count = self.phase()
+        if count <= 1:
+            return delay
+        offset = rank / count * delay
+        shift = (offset - (time.time() + delay)) % delay
+        if shift > delay / 2:
+            shift -= delay
+        return max(0.0, delay + shift)
+
+    # ------------------------------------------------------------------
+    # Состояние мониторов
+    # ------------------------------------------------------------------
+
+    def register(self, monitor):
+        self.monitors[monitor.alliance_id] = monitor
+        if self.is_leader:
+            _, data = self.store.get_state(f"telegram:{monitor.alliance_id}")
+            if data:
+                monitor.telegram.restore_state(data)
+
+    def pull(self, monitor):
+        """Применяет к монитору более свежий снимок другого узла."""
+        key = f"monitor:{monitor.alliance_id}"
+        version, data = self.store.get_state(key)
+        with self._state_lock:
+            if not data or version <= self._seen_versions.get(key, 0):
+                return False
+            self._seen_versions[key] = version
+            self._pushed[key] = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        monitor.restore_state(data)
+        return True
+
+    def push(self, monitor):
+        """Пишет снимок монитора, если он изменился."""
+        self._push(f"monitor:{monitor.alliance_id}", monitor.export_state())
+
+    def _push(self, key, data):
+        encoded = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        with self._state_lock:
+            if self._pushed.get(key) == encoded:
+                return
+        version = self.store.put_state(key, data)
+        with self._state_lock:
+            self._pushed[key] = encoded
+            self._seen_versions[key] = version
+
+    # ------------------------------------------------------------------
+    # Шина событий
+    # ------------------------------------------------------------------
+
+    def subscribe(self, sink, max_size=100, policy='drop_oldest'):
+        return self.local.subscribe(sink, max_size=max_size, policy=policy)
+
+    def _record(self, event):
+        record = event.to_dict(internal=True)
+        # monotonic-время не переносится между процессами — пишем настенное
+        observed = record.pop('observed_at', None)
+        if observed is not None:
+            record['observed_wall'] = time.time() - (time.monotonic() - observed)
+        return record
+
+    def publish(self, event):
+        claim = CLAIMS.get(type(event))
+        try:
+            if claim is not None:
+                outbox_id = self.store.claim(
+                    f"claim:{event.alliance_id}", claim(event), self._record(event),
+                    event.alliance_id, self.node_id,
+                )
+            elif self._lifecycle_allowed(event):
+                outbox_id = self.store.append(self._record(event), event.alliance_id, self.node_id)
+            else:
+                outbox_id = None
+        except sqlite3.Error as e:
+            log.error(f"❌ Кластер: событие {type(event).__name__} не записано: {e}")
+            return
+        CLUSTER_EVENTS_TOTAL.labels('claimed' if outbox_id else 'duplicate').inc()
+        if outbox_id and self.is_leader:
+            self._wake.set()
+
+    def _lifecycle_allowed(self, event):
+        """Служебные сообщения — только от ведущего; об остановке — если он последний."""
+        if not self.is_leader:
+            return False
+        if isinstance(event, (AuthLost, MonitorStopped)):
+            others = [n for n in self.store.live_nodes(self.lease_ttl) if n != self.node_id]
+            if others:
+                log.info(f"🔁 Работу продолжат узлы: {', '.join(others)}")
+                return False
+        return True
+
+    def _outbox_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.outbox_poll)
+            self._wake.clear()
+            if self._leading():
+                try:
+                    self._drain()
+                except sqlite3.Error as e:
+                    log.warning(f"⚠️ Кластер: outbox: {e}")
+
+    def _drain(self):
+        with self._drain_lock:
+            self._drain_locked()
+        with self._delivered:
+            self._drained += 1
+            self._delivered.notify_all()
+
+    def _drain_locked(self):
+        delivered = self._cursor
+        for outbox_id, record in self.store.pending(self._cursor):
+            observed = record.pop('observed_wall', None)
+            if observed is not None:
+                record['observed_at'] = time.monotonic() - (time.time() - observed)
+            try:
+                event = event_from_dict(record)
+            except (KeyError, TypeError) as e:
+                log.warning(f"⚠️ Кластер: пропущено событие #{outbox_id}: {e}")
+            else:
+                self.local.publish(event)
+                CLUSTER_EVENTS_TOTAL.labels('delivered').inc()
+            delivered = outbox_id
+        if delivered != self._cursor:
+            self._cursor = delivered
+            self.store.set_cursor(delivered)
+        # message_id постов меняет поток доставки Telegram — сохраняем после него
+        for alliance_id, monitor in list(self.monitors.items()):
+            self._push(f"telegram:{alliance_id}", monitor.telegram.export_state())
+
+    # ------------------------------------------------------------------
+
+    def flush(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        if self._leading():
+            with self._delivered:
+                seen = self._drained
+                self._wake.set()
+                self._delivered.wait_for(lambda: self._drained > seen, timeout)
+        return self.local.flush(max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        if self.is_leader:
+            try:
+                self._drain()
+            except sqlite3.Error:
+                pass
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(5)
+        self.local.close()
+        if self.is_leader:
+            # Свежие message_id — после того как приёмники всё отправили
+            for alliance_id, monitor in list(self.monitors.items()):
+                self._push(f"telegram:{alliance_id}", monitor.telegram.export_state())
+        try:
+            # Отпускаем аренду сразу, чтобы резервный узел не ждал её истечения
+            self.store.release_lease(self.node_id)
+            self.store.leave(self.node_id)
+        except sqlite3.Error:
+            pass
+        self.is_leader = False
+        CLUSTER_LEADER.labels(self.node_id).set(0)
+        self.store.close()
+
+    def stats(self):
+        return {'node': self.node_id, 'leader': self.is_leader, 'term': self.term, 'sinks': self.local.stats()}
+
+
+_nodes = {}
+_nodes_lock = threading.Lock()
+
+
+def open_cluster(config):
+    """Один узел на файл кластера для всех мониторов процесса; None — режим выключен."""
+    if not config.CLUSTER_DB:
+        return None
+    with _nodes_lock:
+        if config.CLUSTER_DB not in _nodes:
+            _nodes[config.CLUSTER_DB] = ClusterNode(
+                config.CLUSTER_DB,
+                node_id=config.CLUSTER_NODE_ID or None,
+                lease_ttl=config.CLUSTER_LEASE_TTL,
+                outbox_poll=config.CLUSTER_OUTBOX_POLL,
+            )
+        return _nodes[config.CLUSTER_DB]
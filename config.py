@@ -4,24 +4,182 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    # MangaBuff
+    # MangaBuff (адрес переопределяется для локального стенда bench/fake_mangabuff.py)
+    MANGABUFF_BASE_URL = os.getenv('MANGABUFF_BASE_URL', 'https://mangabuff.ru').rstrip('/')
     MANGABUFF_EMAIL = os.getenv('MANGABUFF_EMAIL')
     MANGABUFF_PASSWORD = os.getenv('MANGABUFF_PASSWORD')
-    ALLIANCE_URL = f"https://mangabuff.ru/alliances/{os.getenv('ALLIANCE_ID', '10')}/boost"
+    # Список альянсов через запятую: ALLIANCE_IDS=10,42,77
+    # (для совместимости поддерживается одиночный ALLIANCE_ID)
+    ALLIANCE_IDS = [
+        a.strip()
+        for a in os.getenv('ALLIANCE_IDS', os.getenv('ALLIANCE_ID', '10')).split(',')
+        if a.strip()
+    ]
+    # Пустой ALLIANCE_IDS не должен ронять импорт — о нём сообщит validate()
+    ALLIANCE_URL = f"{MANGABUFF_BASE_URL}/alliances/{ALLIANCE_IDS[0]}/boost" if ALLIANCE_IDS else None
     
     # Telegram
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
     TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    # Темы по умолчанию: "none,3" (none = General). Пусто — TOPIC_IDS из telegram_bot
+    TELEGRAM_TOPIC_IDS = os.getenv('TELEGRAM_TOPIC_IDS')
+    # Фоновая доставка: очередь заданий и пул соединений к Bot API
+    TELEGRAM_BACKGROUND = os.getenv('TELEGRAM_BACKGROUND', 'true').lower() == 'true'
+    TELEGRAM_QUEUE_SIZE = int(os.getenv('TELEGRAM_QUEUE_SIZE', 100))
+    TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 8))
+    # Правка подписи одного поста — не чаще чем раз в N секунд (0 — без ограничения)
+    TELEGRAM_EDIT_MIN_INTERVAL = float(os.getenv('TELEGRAM_EDIT_MIN_INTERVAL', 3))
+    
+    # Приёмники событий (events.py): telegram, webhook, file, stdout
+    SINKS = [s.strip().lower() for s in os.getenv('SINKS', 'telegram').split(',') if s.strip()]
+    SINK_WEBHOOK_URL = os.getenv('SINK_WEBHOOK_URL')
+    SINK_FILE = os.getenv('SINK_FILE', 'events.jsonl')
+    # Очередь каждого приёмника и что делать при переполнении: drop_oldest, drop_new, block
+    SINK_QUEUE_SIZE = int(os.getenv('SINK_QUEUE_SIZE', 100))
+    SINK_POLICY = os.getenv('SINK_POLICY', 'drop_oldest')
+    
+    # Кластер (cluster.py): общий SQLite-файл узлов на одной машине/общем диске.
+    # Пусто — обычный одиночный режим
+    CLUSTER_DB = os.getenv('CLUSTER_DB', '')
+    CLUSTER_NODE_ID = os.getenv('CLUSTER_NODE_ID', '')
+    # Аренда ведущего: срок (сек); продлевается каждую треть срока
+    CLUSTER_LEASE_TTL = float(os.getenv('CLUSTER_LEASE_TTL', 10))
+    # Как часто ведущий забирает события других узлов (сек)
+    CLUSTER_OUTBOX_POLL = float(os.getenv('CLUSTER_OUTBOX_POLL', 0.2))
     
     # Мониторинг
     CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', 1))
+    # Адаптивный интервал (scheduler.AdaptiveScheduler)
+    POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', CHECK_INTERVAL))
+    POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', 15))
+    POLL_BACKOFF_MAX = float(os.getenv('POLL_BACKOFF_MAX', 300))
+    POLL_JITTER = float(os.getenv('POLL_JITTER', 0.1))
+    POLL_IDLE_AFTER = int(os.getenv('POLL_IDLE_AFTER', 30))
+    POLL_RELAX_FACTOR = float(os.getenv('POLL_RELAX_FACTOR', 1.5))
+    POLL_CHANCE_FAST = float(os.getenv('POLL_CHANCE_FAST', 50))
     HEADLESS_MODE = os.getenv('HEADLESS_MODE', 'false').lower() == 'true'
+    # Асинхронный движок включается сам при нескольких альянсах
+    ASYNC_MODE = os.getenv('ASYNC_MODE', 'false').lower() == 'true'
+    # Сколько альянсов опрашивается одновременно (потоки + размер пула соединений)
+    MAX_CONCURRENT_POLLS = int(os.getenv('MAX_CONCURRENT_POLLS', 8))
+    # HTTP: соединений в пуле к сайту на монитор; HTTP/2 — при установленных httpx и h2
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 4))
+    HTTP2 = os.getenv('HTTP2', 'false').lower() == 'true'
+    # Разбор страницы альянса: auto (regex с откатом на bs4), regex, bs4
+    EXTRACTOR = os.getenv('EXTRACTOR', 'auto')
+    # Потоковое чтение /boost: разбор по мере скачивания, остаток тела не читается.
+    # Остаток не больше STREAM_DRAIN_BYTES дочитывается, чтобы сохранить
+    # keep-alive соединение; больший — соединение закрывается (0 — всегда закрывать)
+    STREAM_FETCH = os.getenv('STREAM_FETCH', 'false').lower() == 'true'
+    # Источник данных альянса: html — страница; auto — найти JSON-эндпоинт
+    # (DATA_SOURCE_JSON_URLS, '{id}' — id альянса, и адреса чтения данных из самой
+    # страницы — /alliances/{id}/data и т.п., ссылки-действия не запрашиваются)
+    # и опрашивать его, при сбое — страницу; повторный поиск раз в DATA_SOURCE_RETRY сек
+    DATA_SOURCE = os.getenv('DATA_SOURCE', 'html')
+    DATA_SOURCE_JSON_URLS = [u.strip() for u in os.getenv('DATA_SOURCE_JSON_URLS', '').split(',') if u.strip()]
+    DATA_SOURCE_RETRY = float(os.getenv('DATA_SOURCE_RETRY', 3600))
+    STREAM_DRAIN_BYTES = int(os.getenv('STREAM_DRAIN_BYTES', 16 * 1024))
+    # Запросы к сайту (executor.py): таймаут одной попытки и бюджет на вызов (сек).
+    # Опрос альянса — одна попытка (повторы — дело планировщика), детали манги —
+    # до MANGA_FETCH_ATTEMPTS попыток, но всё вместе не дольше MANGA_FETCH_DEADLINE
+    REQUEST_ATTEMPT_TIMEOUT = float(os.getenv('REQUEST_ATTEMPT_TIMEOUT', 15))
+    POLL_DEADLINE = float(os.getenv('POLL_DEADLINE', 15))
+    MANGA_FETCH_DEADLINE = float(os.getenv('MANGA_FETCH_DEADLINE', 20))
+    MANGA_FETCH_ATTEMPTS = int(os.getenv('MANGA_FETCH_ATTEMPTS', 3))
+    # Предохранитель: после N сбоев подряд эндпоинт не опрашивается BREAKER_OPEN_SECONDS сек
+    BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+    # Хеджирование GET: вторая попытка, если первая не ответила за квантиль
+    # HEDGE_QUANTILE задержки эндпоинта (но не раньше HEDGE_MIN_DELAY сек)
+    HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'
+    HEDGE_QUANTILE = float(os.getenv('HEDGE_QUANTILE', 0.95))
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.2))
     
+    # Пороги значимости изменений статистики: "поле=N,..." (exp_current, exp_total,
+    # chance, level); изменение меньше N не правит пост сразу, а копится до порога
+    # или до CHANGE_BATCH_WINDOW сек (0 — только до порога). Пусто — любое изменение
+    CHANGE_THRESHOLDS = os.getenv('CHANGE_THRESHOLDS', '')
+    CHANGE_BATCH_WINDOW = float(os.getenv('CHANGE_BATCH_WINDOW', 60))
+
+    # Быстрый старт: стартовый пост (детали манги, постер) готовится в фоне,
+    # опрос начинается сразу после первых данных альянса
+    FAST_START = os.getenv('FAST_START', 'false').lower() == 'true'
+
+    # Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
     # Пути
+    HISTORY_DB = os.getenv('HISTORY_DB', 'manga_history.db')
+    # Старый JSON-файл истории: импортируется в HISTORY_DB при первом запуске
     HISTORY_FILE = 'manga_history.json'
+    # Хранить историю N дней (0 — бессрочно)
+    HISTORY_KEEP_DAYS = int(os.getenv('HISTORY_KEEP_DAYS', 0))
+    # Куки и токены авторизованной сессии (пусто — не сохранять)
+    SESSION_FILE = os.getenv('SESSION_FILE', '.session.json')
+    # Плановая проверка сессии и обновление CSRF/XSRF в фоне (сек, 0 — выключено)
+    SESSION_REFRESH_INTERVAL = float(os.getenv('SESSION_REFRESH_INTERVAL', 600))
+    # Отказов во входе подряд, после которых в чат уходит предупреждение (вход
+    # повторяется и дальше, реже); недоступность сайта отказом не считается
+    SESSION_RELOGIN_ATTEMPTS = int(os.getenv('SESSION_RELOGIN_ATTEMPTS', 3))
+    # Сколько опрос ждёт фоновый вход, прежде чем повторить запрос (сек)
+    SESSION_LOGIN_WAIT = float(os.getenv('SESSION_LOGIN_WAIT', 20))
+    # Снимок состояния мониторов для тёплого перезапуска (пусто — не сохранять)
+    STATE_FILE = os.getenv('STATE_FILE', 'monitor_state.json')
+    # Не чаще чем раз в N секунд и только при изменениях
+    STATE_SNAPSHOT_INTERVAL = float(os.getenv('STATE_SNAPSHOT_INTERVAL', 5))
+    # file_id постеров в Telegram по slug (пусто — только в памяти)
+    POSTER_CACHE_FILE = os.getenv('POSTER_CACHE_FILE', 'poster_cache.json')
+    POSTER_CACHE_SIZE = int(os.getenv('POSTER_CACHE_SIZE', 500))
+    # Детали манги по slug: срок жизни записи и записи о 404 (сек)
+    MANGA_CACHE_FILE = os.getenv('MANGA_CACHE_FILE', 'manga_cache.json')
+    MANGA_CACHE_TTL = int(os.getenv('MANGA_CACHE_TTL', 7 * 86400))
+    MANGA_CACHE_NEGATIVE_TTL = int(os.getenv('MANGA_CACHE_NEGATIVE_TTL', 3600))
+    MANGA_CACHE_SIZE = int(os.getenv('MANGA_CACHE_SIZE', 1000))
+    # Ряд опыта по альянсам (пусто — только в памяти) и число хранимых выборок
+    EXP_SERIES_DIR = os.getenv('EXP_SERIES_DIR', 'exp_series')
+    EXP_SERIES_CAPACITY = int(os.getenv('EXP_SERIES_CAPACITY', 4096))
+    # Архив сырых страниц с результатом разбора для bench/replay_archive.py
+    # (пусто — выключен); сегменты .jsonl.gz ротируются по размеру
+    PAGE_ARCHIVE_DIR = os.getenv('PAGE_ARCHIVE_DIR', '')
+    PAGE_ARCHIVE_MAX_BYTES = int(os.getenv('PAGE_ARCHIVE_MAX_BYTES', 16 * 1024 * 1024))
+    PAGE_ARCHIVE_FILES = int(os.getenv('PAGE_ARCHIVE_FILES', 20))
     LOG_DIR = 'logs'
     LOG_FILE = os.path.join(LOG_DIR, 'monitor.log')
+    # Журнал (logsetup): уровни для консоли и файла, ротация по размеру и по суткам
+    LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'DEBUG')
+    LOG_FILE_LEVEL = os.getenv('LOG_FILE_LEVEL', 'INFO')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 5 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 7))
+    LOG_ROTATE_DAILY = os.getenv('LOG_ROTATE_DAILY', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
     
+    @staticmethod
+    def parse_topic_ids(raw):
+        """'none,3' → [None, 3]; пустая строка → None"""
+        if not raw:
+            return None
+        topics = []
+        for part in raw.split(','):
+            part = part.strip().lower()
+            if not part:
+                continue
+            topics.append(None if part in ('none', 'general') else int(part))
+        return topics or None
+
+    @classmethod
+    def alliance_route(cls, alliance_id):
+        """
+        Маршрут уведомлений для альянса: (chat_id, topic_ids).
+        Переопределяется через ALLIANCE_<ID>_CHAT_ID и ALLIANCE_<ID>_TOPIC_IDS.
+        """
+        chat_id = os.getenv(f'ALLIANCE_{alliance_id}_CHAT_ID') or cls.TELEGRAM_CHAT_ID
+        topic_ids = cls.parse_topic_ids(
+            os.getenv(f'ALLIANCE_{alliance_id}_TOPIC_IDS', cls.TELEGRAM_TOPIC_IDS)
+        )
+        return chat_id, topic_ids
+
     @classmethod
     def validate(cls):
         """Проверка наличия всех необходимых настроек"""
@@ -36,5 +194,8 @@ class Config:
         
         if missing:
             raise ValueError(f"Отсутствуют настройки: {', '.join(missing)}")
+
+        if not cls.ALLIANCE_IDS:
+            raise ValueError("Не задан ни один альянс (ALLIANCE_IDS)")
         
         return True
\ No newline at end of file
@@ -0,0 +1,418 @@
+"""
+Шина событий монитора и приёмники (sinks).
+
+Определение изменений публикует типизированные события, приёмники
+обрабатывают их в своих потоках. У каждого приёмника своя ограниченная
+очередь, поэтому медленный вебхук не задерживает ни опрос, ни Telegram.
+
+Переполнение очереди (policy):
+  drop_oldest — выбрасывается самое старое событие (по умолчанию)
+  drop_new    — выбрасывается новое
+  block       — публикация ждёт место не дольше block_timeout, затем drop_new
+Выбрасываются в первую очередь StatsChanged и DayRollover. TitleChanged и
+AuthLost не выбрасываются никогда: ради них вытесняется другое событие,
+а если вытеснять нечего, очередь временно превышает max_size.
+Неотправленный StatsChanged заменяется более свежим того же альянса —
+устаревшая статистика никому не нужна; дельты (changes.py) при этом
+сливаются, чтобы отсчитываться от того, что приёмник видел последним.
+
+Приёмники (SINKS=telegram,webhook,file,stdout):
+  telegram — TelegramNotifier альянса (подпись форматируется здесь же)
+  webhook  — POST JSON на SINK_WEBHOOK_URL
+  file     — строка JSON на событие в SINK_FILE
+  stdout   — строка JSON на событие в stdout
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional
+
+from changes import merge_deltas
+from logsetup import get_logger
+from metrics import SINK_EVENTS_TOTAL, SINK_QUEUE_DEPTH
+
+log = get_logger('events')
+
+POLICIES = ('drop_oldest', 'drop_new', 'block')
+
+
+# ---------------------------------------------------------------------------
+# События
+# ---------------------------------------------------------------------------
+
+def _internal(default=None):
+    """Поле только для процесса (в JSON не попадает)."""
+    return field(default=default, repr=False, compare=False, metadata={'internal': True})
+
+
+@dataclass
+class Event:
+    alliance_id: str
+    ts: float = field(default_factory=time.time, kw_only=True)
+
+    def to_dict(self, internal=False):
+        data = {'type': type(self).__name__}
+        for f in fields(self):
+            if internal or not f.metadata.get('internal'):
+                data[f.name] = getattr(self, f.name)
+        return data
+
+
+@dataclass
+class TitleChanged(Event):
+    slug: Optional[str]
+    previous_slug: Optional[str] = None
+    manga_info: Optional[dict] = None
+    page_data: dict = field(default_factory=dict)
+    exp_gain_today: Optional[int] = None
+    exp_stats: Optional[dict] = None
+    startup: bool = False
+    # monotonic-время получения страницы — для метрики задержки доставки
+    observed_at: Optional[float] = _internal()
+
+
+@dataclass
+class StatsChanged(Event):
+    slug: Optional[str]
+    manga_info: Optional[dict]
+    page_data: dict = field(default_factory=dict)
+    previous: dict = field(default_factory=dict)
+    # Дельты по полям относительно previous: {поле: {'old', 'new', 'diff'}}
+    deltas: dict = field(default_factory=dict)
+    # significant — изменение дошло до порога, batch — накопилось за окно, resume — после перезапуска
+    reason: str = 'significant'
+    exp_gain_today: Optional[int] = None
+    exp_stats: Optional[dict] = None
+    observed_at: Optional[float] = _internal()
+
+
+@dataclass
+class DayRollover(Event):
+    day: str
+    exp_at_day_start: Optional[int] = None
+
+
+@dataclass
+class AuthLost(Event):
+    reason: str = ''
+    # Мониторинг после потери авторизации остановлен
+    fatal: bool = True
+
+
+@dataclass
+class MonitorStopped(Event):
+    reason: str = 'interrupted'
+
+
+@dataclass
+class Notice(Event):
+    """Служебное сообщение оператору (например, не удалось получить тайтл)."""
+    text: str = ''
+
+
+EVENT_TYPES = {
+    cls.__name__: cls
+    for cls in (TitleChanged, StatsChanged, DayRollover, AuthLost, MonitorStopped, Notice)
+}
+
+
+def event_from_dict(data):
+    """Обратно к to_dict(internal=True); неизвестные поля отбрасываются."""
+    cls = EVENT_TYPES[data['type']]
+    names = {f.name for f in fields(cls)}
+    return cls(**{k: v for k, v in data.items() if k in names})
+
+
+# ---------------------------------------------------------------------------
+# Очередь и поток приёмника
+# ---------------------------------------------------------------------------
+
+# Вытесняются из полной очереди первыми
+_EXPENDABLE = (StatsChanged, DayRollover)
+# Не вытесняются никогда — ради этих уведомлений монитор и работает
+_ESSENTIAL = (TitleChanged, AuthLost)
+
+
+class SinkWorker:
+    def __init__(self, sink, max_size=100, policy='drop_oldest', block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика очереди: {policy} (есть: {', '.join(POLICIES)})")
+        self.sink = sink
+        self.name = sink.name
+        self.max_size = max_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self.stats = {'delivered': 0, 'failed': 0, 'dropped': 0, 'coalesced': 0}
+        self._thread = threading.Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _count(self, result):
+        self.stats[result] += 1
+        SINK_EVENTS_TOTAL.labels(self.name, result).inc()
+
+    def offer(self, event):
+        """Ставит событие в очередь, не блокируя (кроме политики block)."""
+        with self._cond:
+            if self._closed:
+                return False
+            if isinstance(event, StatsChanged):
+                for i in range(len(self._items) - 1, -1, -1):
+                    queued = self._items[i]
+                    if queued.alliance_id != event.alliance_id:
+                        continue
+                    if isinstance(queued, TitleChanged):
+                        # За сменой тайтла — новая подпись, порядок не меняем
+                        break
+                    if isinstance(queued, StatsChanged):
+                        # Задержку доставки считаем от первого, дольше всех ждавшего изменения
+                        event = replace(
+                            event,
+                            previous=queued.previous,
+                            deltas=merge_deltas(queued.deltas, event.deltas),
+                            observed_at=queued.observed_at if queued.observed_at is not None else event.observed_at,
+                        )
+                        self._items[i] = event
+                        self._count('coalesced')
+                        return True
+            if len(self._items) >= self.max_size:
+                if self.policy == 'block':
+                    self._cond.wait_for(lambda: len(self._items) < self.max_size, self.block_timeout)
+                if len(self._items) >= self.max_size:
+                    essential = isinstance(event, _ESSENTIAL)
+                    victim = self._victim() if essential or self.policy == 'drop_oldest' else None
+                    if victim is not None:
+                        del self._items[victim]
+                        self._count('dropped')
+                    elif not essential:
+                        self._count('dropped')
+                        return False
+            self._items.append(event)
+            SINK_QUEUE_DEPTH.labels(self.name).set(len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def _victim(self):
+        """Индекс события, которое можно вытеснить из очереди, или None."""
+        fallback = None
+        for i, queued in enumerate(self._items):
+            if isinstance(queued, _EXPENDABLE):
+                return i
+            if fallback is None and not isinstance(queued, _ESSENTIAL):
+                fallback = i
+        return fallback
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._items or self._closed)
+                if not self._items:
+                    return
+                event = self._items.popleft()
+                self._busy = True
+                SINK_QUEUE_DEPTH.labels(self.name).set(len(self._items))
+                self._cond.notify_all()
+            try:
+                self.sink.handle(event)
+                self._count('delivered')
+            except Exception as e:
+                self._count('failed')
+                log.error(f"❌ Приёмник {self.name}: {type(event).__name__}: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._items and not self._busy, timeout)
+
+    def close(self, timeout=5):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.sink.close()
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+
+class EventBus:
+    def __init__(self):
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, sink, max_size=100, policy='drop_oldest'):
+        worker = SinkWorker(sink, max_size=max_size, policy=policy)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def publish(self, event):
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.offer(event)
+
+    def flush(self, timeout=10):
+        """Ждёт, пока приёмники разберут очереди. False — не успели."""
+        deadline = time.monotonic() + timeout
+        ok = True
+        for worker in list(self._workers):
+            ok &= worker.flush(max(0.0, deadline - time.monotonic()))
+        return ok
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+    def stats(self):
+        return {w.name: {**w.stats, 'queue_depth': w.depth()} for w in self._workers}
+
+
+# ---------------------------------------------------------------------------
+# Приёмники
+# ---------------------------------------------------------------------------
+
+class Sink:
+    name = 'sink'
+
+    def handle(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TelegramSink(Sink):
+    """Уведомления в Telegram: у каждого альянса свой TelegramNotifier."""
+
+    name = 'telegram'
+
+    def __init__(self, notifiers):
+        self.notifiers = dict(notifiers)
+
+    def _caption(self, notifier, event):
+        return notifier.format_manga_caption(
+            event.manga_info,
+            event.page_data,
+            event.exp_gain_today,
+            is_startup=getattr(event, 'startup', False),
+            exp_stats=event.exp_stats,
+        )
+
+    def handle(self, event):
+        notifier = self.notifiers.get(event.alliance_id)
+        if notifier is None:
+            return
+
+        if isinstance(event, TitleChanged):
+            info = event.manga_info
+            if info:
+                caption = self._caption(notifier, event)
+                if info.get('image'):
+                    notifier.send_photo_to_all_topics(
+                        info['image'], caption, slug=info.get('slug'), observed_at=event.observed_at
+                    )
+                else:
+                    notifier.send_message_to_all_topics(caption, observed_at=event.observed_at)
+            elif not event.startup:
+                notifier.send_message_to_all_topics(
+                    f"🔔 <b>Смена тайтла!</b>\n\n{event.slug}\n(детали недоступны)",
+                    observed_at=event.observed_at,
+                )
+
+        elif isinstance(event, StatsChanged):
+            if event.manga_info:
+                notifier.update_caption_in_all_topics(
+                    self._caption(notifier, event), observed_at=event.observed_at
+                )
+
+        elif isinstance(event, AuthLost):
+            if event.fatal:
+                notifier.send_message_to_all_topics("❌ Ошибка сети. Мониторинг остановлен.")
+            else:
+                notifier.send_message_to_all_topics(
+                    "⚠️ Сайт отклоняет вход. Мониторинг продолжает попытки."
+                )
+
+        elif isinstance(event, MonitorStopped):
+            notifier.send_message_to_all_topics("⏹️ Мониторинг остановлен")
+
+        elif isinstance(event, Notice):
+            notifier.send_message_to_all_topics(event.text)
+
+    def close(self):
+        for notifier in self.notifiers.values():
+            notifier.flush()
+
+
+class WebhookSink(Sink):
+    name = 'webhook'
+
+    def __init__(self, url, timeout=10):
+        from transport import make_session
+        self.url = url
+        self.timeout = timeout
+        self.session = make_session('webhook', 2)
+
+    def handle(self, event):
+        response = self.session.post(self.url, json=event.to_dict(), timeout=self.timeout)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+
+class FileSink(Sink):
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def handle(self, event):
+        self._file.write(json.dumps(event.to_dict(), ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class StdoutSink(Sink):
+    name = 'stdout'
+
+    def handle(self, event):
+        sys.stdout.write(json.dumps(event.to_dict(), ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+
+def add_sinks(bus, config, notifiers):
+    """
+    Подключает к шине приёмники из config.SINKS. Возвращает bus.
+    notifiers — {alliance_id: TelegramNotifier} для приёмника telegram.
+    """
+    for name in config.SINKS:
+        if name == 'telegram':
+            sink = TelegramSink(notifiers)
+        elif name == 'webhook':
+            if not config.SINK_WEBHOOK_URL:
+                raise ValueError("Приёмник webhook требует SINK_WEBHOOK_URL")
+            sink = WebhookSink(config.SINK_WEBHOOK_URL)
+        elif name == 'file':
+            sink = FileSink(config.SINK_FILE)
+        elif name == 'stdout':
+            sink = StdoutSink()
+        else:
+            raise ValueError(f"Неизвестный приёмник: {name}")
+        bus.subscribe(sink, max_size=config.SINK_QUEUE_SIZE, policy=config.SINK_POLICY)
+    return bus
@@ -0,0 +1,357 @@
+"""
+Общий исполнитель запросов к mangabuff.ru: бюджет по времени, повторы,
+предохранитель (circuit breaker) и хеджирование.
+
+    executor = open_executor(config)
+    response = executor.call('manga', lambda timeout: session.get(url, timeout=timeout),
+                             deadline=20, attempts=3)
+
+send(timeout) делает одну попытку и возвращает ответ. Исполнитель:
+  - даёт вызову не больше deadline секунд: таймаут каждой попытки — остаток
+    бюджета, повтор (короткая пауза с джиттером, Retry-After — если влезает)
+    начинается, только если на него хватает времени;
+  - повторяет сетевые ошибки, 5xx и 429; прочие ответы (в т.ч. 404)
+    возвращаются как есть. Если бюджет кончился на 5xx/429, возвращается
+    последний ответ — вызывающий сам решает, что с ним делать;
+  - считает подряд идущие неудачные вызовы (один вызов — один сбой,
+    сколько бы попыток в нём ни было) по эндпоинту: после breaker_failures
+    предохранитель размыкается на breaker_open секунд, и вызовы сразу
+    получают CircuitOpenError, не тратя время на заведомо лежащий сайт.
+    По истечении паузы проходит один пробный запрос (half-open);
+  - при hedge=True, если попытка не ответила за p95 задержки эндпоинта,
+    отправляет ту же попытку второй раз и берёт первый успешный ответ.
+    Только для идемпотентных GET; до hedge_min_samples замеров не хеджирует.
+
+Худший случай одного вызова — deadline плюс точность таймаута requests
+(таймаут ограничивает каждое ожидание сокета, а не весь ответ).
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from logsetup import get_logger
+from metrics import CIRCUIT_STATE, HEDGED_REQUESTS_TOTAL, RETRIES_TOTAL
+
+log = get_logger('executor')
+
+# Замеров задержки на эндпоинт для p50/p95
+STATS_WINDOW = 200
+# Попытка короче этого не начинается — ответа за такое время всё равно не будет
+MIN_ATTEMPT = 0.5
+# Пауза перед повтором: BACKOFF_BASE · 2^n с джиттером, но не дольше BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4.0
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Предохранитель эндпоинта разомкнут; retry_in — сколько секунд до пробного запроса."""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"{endpoint}: предохранитель разомкнут, пробный запрос через {retry_in:.0f} с")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def _retryable(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After') if response is not None else None
+    if value and value.strip().isdigit():
+        return float(value)
+    return None
+
+
+def _discard(future):
+    """Ответ проигравшей хедж-попытки: закрыть, чтобы соединение вернулось в пул."""
+    try:
+        response = future.result()
+    except Exception:
+        return
+    close = getattr(response, 'close', None)
+    if close is not None:
+        close()
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint, failures=5, open_seconds=30.0):
+        self.endpoint = endpoint
+        self.failures = failures
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.streak = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """(можно ли идти в сеть, секунд до пробного запроса)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True, 0.0
+            if self.state == OPEN:
+                left = self.opened_at + self.open_seconds - time.monotonic()
+                if left > 0:
+                    return False, left
+                self._set(HALF_OPEN)
+            # Полуоткрыт: проходит один пробный запрос, остальные ждут его исхода
+            if self._trial:
+                return False, 0.0
+            self._trial = True
+            return True, 0.0
+
+    def success(self):
+        with self._lock:
+            self.streak = 0
+            self._trial = False
+            if self.state != CLOSED:
+                log.info(f"✅ {self.endpoint}: предохранитель замкнут")
+                self._set(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.streak += 1
+            self._trial = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.streak >= self.failures):
+                log.warning(f"⚡ {self.endpoint}: {self.streak} неудачных вызовов подряд, "
+                            f"запросы приостановлены на {self.open_seconds:.0f} с")
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def _set(self, state):
+        self.state = state
+        CIRCUIT_STATE.labels(self.endpoint).set(_STATE_VALUES[state])
+
+
+class EndpointStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timings = deque(maxlen=STATS_WINDOW)
+
+    def quantile(self, q):
+        timings = sorted(self.timings)
+        return timings[min(len(timings) - 1, int(len(timings) * q))] if timings else None
+
+    def summary(self):
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'p50_ms': p50 * 1000 if p50 is not None else None,
+            'p95_ms': p95 * 1000 if p95 is not None else None,
+        }
+
+
+class _Endpoint:
+    def __init__(self, name, breaker_failures, breaker_open):
+        self.breaker = CircuitBreaker(name, breaker_failures, breaker_open)
+        self.stats = EndpointStats(name)
+
+
+class RequestExecutor:
+    def __init__(self, attempt_timeout=15.0, breaker_failures=5, breaker_open=30.0,
+                 hedge=False, hedge_quantile=0.95, hedge_min_delay=0.2, hedge_min_samples=20,
+                 hedge_workers=8):
+        self.attempt_timeout = attempt_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_open = breaker_open
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._pool = ThreadPoolExecutor(hedge_workers, thread_name_prefix="hedge") if hedge else None
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name):
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            with self._lock:
+                endpoint = self._endpoints.setdefault(
+                    name, _Endpoint(name, self.breaker_failures, self.breaker_open)
+                )
+        return endpoint
+
+    def call(self, name, send, deadline=None, attempts=1, hedge=True):
+        """
+        Запрос к эндпоинту name в пределах deadline секунд (None — один
+        attempt_timeout на попытку). Возвращает ответ или бросает исключение
+        requests (CircuitOpenError — предохранитель разомкнут).
+        hedge=False — не хеджировать этот вызов (например, не-GET).
+        """
+        endpoint = self._endpoint(name)
+        stats = endpoint.stats
+        allowed, retry_in = endpoint.breaker.allow()
+        if not allowed:
+            stats.rejected += 1
+            raise CircuitOpenError(name, retry_in)
+        stats.calls += 1
+
+        budget = deadline if deadline is not None else self.attempt_timeout * attempts
+        try:
+            response = self._call(endpoint, name, send, budget, attempts, hedge)
+        except BaseException:
+            endpoint.breaker.failure()
+            raise
+        if _retryable(response):
+            endpoint.breaker.failure()
+        else:
+            endpoint.breaker.success()
+        return response
+
+    def _call(self, endpoint, name, send, budget, attempts, hedge):
+        """Попытки с паузами в пределах budget; предохранитель не трогает."""
+        stats = endpoint.stats
+        deadline_at = time.monotonic() + budget
+        response = None
+        error = None
+        for attempt in range(attempts):
+            remaining = deadline_at - time.monotonic()
+            if remaining < MIN_ATTEMPT:
+                break
+            if attempt:
+                RETRIES_TOTAL.labels(name).inc()
+            stats.attempts += 1
+            if response is not None:
+                response.close()
+            try:
+                response = self._attempt(endpoint, send, min(self.attempt_timeout, remaining), hedge)
+                error = None
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                response, error = None, e
+            else:
+                if not _retryable(response):
+                    return response
+            stats.failures += 1
+            if attempt == attempts - 1:
+                break
+            delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            delay = max(delay, _retry_after(response) or 0.0)
+            if time.monotonic() + delay + MIN_ATTEMPT > deadline_at:
+                break
+            time.sleep(delay)
+
+        if response is not None:
+            return response
+        if error is not None:
+            raise error
+        raise requests.exceptions.Timeout(f"{name}: бюджет {budget:.1f} с исчерпан")
+
+    def _hedge_delay(self, endpoint, timeout):
+        if self._pool is None or len(endpoint.stats.timings) < self.hedge_min_samples:
+            return None
+        delay = max(endpoint.stats.quantile(self.hedge_quantile), self.hedge_min_delay)
+        # Второй попытке должно остаться время на ответ
+        return delay if delay + MIN_ATTEMPT < timeout else None
+
+    def _attempt(self, endpoint, send, timeout, hedge):
+        stats = endpoint.stats
+        delay = self._hedge_delay(endpoint, timeout) if hedge else None
+        start = time.monotonic()
+        if delay is None:
+            response = send(timeout)
+            stats.timings.append(time.monotonic() - start)
+            return response
+
+        first = self._pool.submit(send, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            response = first.result()
+            stats.timings.append(time.monotonic() - start)
+            return response
+
+        stats.hedged += 1
+        HEDGED_REQUESTS_TOTAL.labels(stats.name, 'fired').inc()
+        hedge_start = time.monotonic()
+        second = self._pool.submit(send, timeout - delay)
+        started = {first: start, second: hedge_start}
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                stats.timings.append(time.monotonic() - started[future])
+                if future is second:
+                    stats.hedge_wins += 1
+                    HEDGED_REQUESTS_TOTAL.labels(stats.name, 'won').inc()
+                for other in pending:
+                    other.add_done_callback(_discard)
+                for other in done - {future}:
+                    _discard(other)
+                return response
+        raise error
+
+    def stats(self):
+        """Сводка по эндпоинтам: задержка, сбои, хеджи, состояние предохранителя."""
+        with self._lock:
+            endpoints = dict(self._endpoints)
+        return {
+            name: {**e.stats.summary(), 'state': e.breaker.state}
+            for name, e in sorted(endpoints.items())
+        }
+
+    def report(self):
+        """Строка для журнала или None, если запросов не было."""
+        parts = []
+        for name, s in self.stats().items():
+            if not s['calls']:
+                continue
+            line = f"{name}: {s['calls']} вызовов"
+            if s['p50_ms'] is not None:
+                line += f", p50 {s['p50_ms']:.0f} мс, p95 {s['p95_ms']:.0f} мс"
+            line += f", повторов {s['attempts'] - s['calls']}, сбоев {s['failures']}"
+            if s['hedged']:
+                line += f", хеджей {s['hedged']} (выиграли {s['hedge_wins']})"
+            if s['rejected']:
+                line += f", отбито предохранителем {s['rejected']}"
+            parts.append(line)
+        return "; ".join(parts) or None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def open_executor(config):
+    """Один исполнитель на процесс: предохранители общие для всех альянсов."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RequestExecutor(
+                attempt_timeout=config.REQUEST_ATTEMPT_TIMEOUT,
+                breaker_failures=config.BREAKER_FAILURES,
+                breaker_open=config.BREAKER_OPEN_SECONDS,
+                hedge=config.HEDGE_REQUESTS,
+                hedge_quantile=config.HEDGE_QUANTILE,
+                hedge_min_delay=config.HEDGE_MIN_DELAY,
+            )
+        return _executor
@@ -0,0 +1,328 @@
+"""
+Временной ряд опыта альянса.
+
+Хранит выборки (ts, exp_current, exp_total, level, chance) в кольцевых
+массивах фиксированного размера и поддерживает накопительный прирост
+опыта с учётом смены уровня. По нему за O(1) (амортизированно)
+считаются:
+  - темп за скользящее окно (опыт/час)
+  - прогноз времени до следующего уровня
+  - агрегаты по часам и по дням (старые выборки отбрасываются,
+    в агрегатах остаётся только прирост)
+
+На диск ряд дописывается по одной записи (бинарный журнал), а при
+разрастании журнал сжимается: агрегаты уходят в JSON-снимок, в журнале
+остаются только последние выборки.
+"""
+
+import json
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime
+
+# ts, exp_current, exp_total, level, chance, cumulative gain
+_RECORD = struct.Struct('<dqqqdq')
+_NONE = -1
+
+# Не пишем выборку, если ничего не изменилось, — но не реже раза в минуту,
+# чтобы темп в простое честно падал
+HEARTBEAT = 60
+
+
+def _hour_key(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:00')
+
+
+def _day_key(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+
+
+def _chance_value(chance):
+    if chance is None:
+        return math.nan
+    try:
+        return float(str(chance).replace(',', '.').strip().rstrip('%'))
+    except ValueError:
+        return math.nan
+
+
+def _int_or_none(value):
+    return None if value == _NONE else value
+
+
+class ExpSeries:
+    def __init__(self, path=None, capacity=4096, window=3600, max_hours=24 * 31, max_days=400):
+        self.path = path
+        self.capacity = capacity
+        self.window = window
+        self.max_hours = max_hours
+        self.max_days = max_days
+
+        # Кольцевые массивы выборок
+        self._ts = array('d', [0.0] * capacity)
+        self._exp = array('q', [0] * capacity)
+        self._total = array('q', [0] * capacity)
+        self._level = array('q', [0] * capacity)
+        self._chance = array('d', [0.0] * capacity)
+        self._cum = array('q', [0] * capacity)
+        self._head = 0      # куда писать следующую выборку
+        self._size = 0
+
+        # Окно для скользящего темпа: (ts, cum)
+        self._window = deque()
+
+        self.cum = 0                    # накопленный прирост с начала наблюдений
+        self.hourly = OrderedDict()     # 'YYYY-MM-DD HH:00' → прирост
+        self.daily = OrderedDict()      # 'YYYY-MM-DD' → прирост
+
+        self._lock = threading.Lock()
+        self._log = None
+        self._log_records = 0
+        self._load()
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def add(self, page_data, ts=None):
+        """Добавляет выборку из page_data. Возвращает True, если она сохранена."""
+        exp_current = page_data.get('exp_current')
+        if exp_current is None:
+            return False
+        ts = time.time() if ts is None else ts
+        exp_total = page_data.get('exp_total')
+        level = page_data.get('level')
+        level = int(level) if level not in (None, '') else None
+        chance = _chance_value(page_data.get('chance'))
+
+        with self._lock:
+            last = self._last()
+            if last is not None:
+                same = (
+                    last[1] == exp_current and last[2] == exp_total
+                    and last[3] == level and (last[4] == chance or (math.isnan(last[4]) and math.isnan(chance)))
+                )
+                if same and ts - last[0] < HEARTBEAT:
+                    return False
+                gain = self._gain(last, exp_current, level)
+            else:
+                gain = 0
+
+            self.cum += gain
+            if gain:
+                self._bump(self.hourly, _hour_key(ts), gain, self.max_hours)
+                self._bump(self.daily, _day_key(ts), gain, self.max_days)
+            record = (ts, exp_current, exp_total, level, chance, self.cum)
+            self._push(record)
+            self._append_log(record)
+        return True
+
+    @staticmethod
+    def _gain(last, exp_current, level):
+        _, prev_exp, prev_total, prev_level, _, _ = last
+        if prev_level is not None and level is not None and level > prev_level and prev_total is not None:
+            # Новый уровень: добрали остаток прошлого и набрали exp_current нового
+            return max(0, prev_total - prev_exp) + exp_current
+        return max(0, exp_current - prev_exp)
+
+    @staticmethod
+    def _bump(buckets, key, gain, limit):
+        buckets[key] = buckets.get(key, 0) + gain
+        buckets.move_to_end(key)
+        while len(buckets) > limit:
+            buckets.popitem(last=False)
+
+    def _push(self, record):
+        ts, exp_current, exp_total, level, chance, cum = record
+        i = self._head
+        self._ts[i] = ts
+        self._exp[i] = exp_current
+        self._total[i] = _NONE if exp_total is None else exp_total
+        self._level[i] = _NONE if level is None else level
+        self._chance[i] = chance
+        self._cum[i] = cum
+        self._head = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+        self._window.append((ts, cum))
+        while self._window and self._window[0][0] < ts - self.window:
+            self._window.popleft()
+
+    def _last(self):
+        if not self._size:
+            return None
+        i = (self._head - 1) % self.capacity
+        return (
+            self._ts[i], self._exp[i], _int_or_none(self._total[i]),
+            _int_or_none(self._level[i]), self._chance[i], self._cum[i],
+        )
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def rate_per_hour(self):
+        """Темп за скользящее окно (опыт/час) или None, если данных мало."""
+        with self._lock:
+            if len(self._window) < 2:
+                return None
+            (t0, c0), (t1, c1) = self._window[0], self._window[-1]
+        if t1 - t0 < 60:
+            return None
+        return (c1 - c0) / (t1 - t0) * 3600
+
+    def eta_seconds(self):
+        """Сколько секунд до следующего уровня при текущем темпе."""
+        rate = self.rate_per_hour()
+        with self._lock:
+            last = self._last()
+        if not rate or last is None or last[2] is None:
+            return None
+        remaining = last[2] - last[1]
+        if remaining <= 0:
+            return 0
+        return remaining / rate * 3600
+
+    def gain_today(self):
+        with self._lock:
+            if not self._size:
+                return None
+            return self.daily.get(_day_key(time.time()), 0)
+
+    def gain_for_hours(self, hours=24):
+        """[(час, прирост)] за последние часы, только часы с приростом."""
+        with self._lock:
+            return list(self.hourly.items())[-hours:]
+
+    def gain_for_days(self, days=30):
+        with self._lock:
+            return list(self.daily.items())[-days:]
+
+    def samples(self, limit=None):
+        """Последние выборки от старых к новым."""
+        with self._lock:
+            n = self._size if limit is None else min(limit, self._size)
+            start = (self._head - n) % self.capacity
+            out = []
+            for k in range(n):
+                i = (start + k) % self.capacity
+                out.append({
+                    'ts': self._ts[i],
+                    'exp_current': self._exp[i],
+                    'exp_total': _int_or_none(self._total[i]),
+                    'level': _int_or_none(self._level[i]),
+                    'chance': None if math.isnan(self._chance[i]) else self._chance[i],
+                })
+            return out
+
+    def summary(self):
+        """Всё, что нужно для подписи, без пересчёта истории."""
+        return {
+            'rate_per_hour': self.rate_per_hour(),
+            'eta_seconds': self.eta_seconds(),
+            'gain_today': self.gain_today(),
+        }
+
+    # ------------------------------------------------------------------
+    # Хранение
+    # ------------------------------------------------------------------
+
+    def _rollups_path(self):
+        return f"{self.path}.json"
+
+    def _load(self):
+        if not self.path:
+            return
+        upto = -math.inf
+        try:
+            with open(self._rollups_path(), 'r', encoding='utf-8') as f:
+                snap = json.load(f)
+            self.hourly.update(snap.get('hourly', []))
+            self.daily.update(snap.get('daily', []))
+            upto = snap.get('upto_ts', upto)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            pass
+
+        records = []
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % _RECORD.size  # хвост от оборванной записи
+            records = [
+                (ts, exp, _int_or_none(tot), _int_or_none(lvl), ch, cum)
+                for ts, exp, tot, lvl, ch, cum in _RECORD.iter_unpack(data[:usable])
+            ]
+        except FileNotFoundError:
+            pass
+
+        prev_cum = None
+        for record in records:
+            ts, cum = record[0], record[5]
+            # Агрегаты до upto_ts уже в снимке, дальше — досчитываем
+            if ts > upto and prev_cum is not None and cum > prev_cum:
+                self._bump(self.hourly, _hour_key(ts), cum - prev_cum, self.max_hours)
+                self._bump(self.daily, _day_key(ts), cum - prev_cum, self.max_days)
+            prev_cum = cum
+            self._push(record)
+        if records:
+            self.cum = records[-1][5]
+        self._log_records = len(records)
+
+    def _append_log(self, record):
+        if not self.path:
+            return
+        ts, exp_current, exp_total, level, chance, cum = record
+        if self._log is None:
+            self._log = open(self.path, 'ab')
+        self._log.write(_RECORD.pack(
+            ts, exp_current,
+            _NONE if exp_total is None else exp_total,
+            _NONE if level is None else level,
+            chance, cum,
+        ))
+        self._log.flush()
+        self._log_records += 1
+        if self._log_records > self.capacity * 4:
+            self._compact()
+
+    def _compact(self):
+        """Агрегаты — в JSON-снимок, в журнале — только последние выборки."""
+        last = self._last()
+        snap = {
+            'upto_ts': last[0] if last else 0,
+            'hourly': list(self.hourly.items()),
+            'daily': list(self.daily.items()),
+        }
+        tmp = f"{self._rollups_path()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f)
+        os.replace(tmp, self._rollups_path())
+
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        tmp = f"{self.path}.tmp"
+        start = (self._head - self._size) % self.capacity
+        with open(tmp, 'wb') as f:
+            for k in range(self._size):
+                i = (start + k) % self.capacity
+                f.write(_RECORD.pack(
+                    self._ts[i], self._exp[i], self._total[i], self._level[i], self._chance[i], self._cum[i],
+                ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._log_records = self._size
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
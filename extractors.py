@@ -0,0 +1,425 @@
+"""
+Извлечение данных альянса из HTML страницы /alliances/{id}/boost.
+
+Бэкенды:
+  bs4    — полный разбор BeautifulSoup (эталон, медленно)
+  regex  — предкомпилированные шаблоны, один проход, останавливается,
+           как только найдены все поля
+  auto   — regex с откатом на bs4, если разметка изменилась
+
+Страница манги (/manga/{slug}) — MangaPageExtractor.
+
+StreamFeed — разбор страницы альянса по мере скачивания: сообщает, когда
+все поля уже получены и остаток тела читать незачем.
+
+SCHEMA_VERSION — версия набора и типов полей записей. Её пишет архив
+страниц (page_archive.py); при изменении полей её нужно увеличить, чтобы
+старые записи архива не сравнивались с новыми как с эталоном.
+"""
+
+import codecs
+import html as html_lib
+import re
+
+
+SCHEMA_VERSION = 1
+
+ALLIANCE_FIELDS = ('slug', 'level', 'exp_current', 'exp_total', 'chance')
+MANGA_FIELDS = ('title', 'image')
+
+
+def make_soup(html):
+    """
+    BeautifulSoup с html.parser. bs4 импортируется при первом полном
+    разборе: regex-бэкенду он не нужен, а импорт занимает ~40 мс старта.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
+
+
+def parse_number(text):
+    if not text:
+        return None
+    cleaned = re.sub(r'[^\d]', '', text.strip())
+    return int(cleaned) if cleaned else None
+
+
+def _slug_from_href(href):
+    if href.startswith('/manga/'):
+        return href.replace('/manga/', '')
+    return None
+
+
+def _slug_from_style(style):
+    if 'background-image: url(' not in style:
+        return None
+    try:
+        img_url = style.split("url('")[1].split("'")[0]
+        return img_url.split('/posters/')[-1].replace('.jpg', '')
+    except Exception:
+        return None
+
+
+def level_from_text(text):
+    """Номер уровня из текста вида «Уровень 31» (строкой) или None."""
+    m = re.search(r'\d+', text)
+    return m.group(0) if m else None
+
+
+# ---------------------------------------------------------------------------
+# BeautifulSoup
+# ---------------------------------------------------------------------------
+
+class BeautifulSoupExtractor:
+    name = 'bs4'
+
+    def extract(self, html):
+        soup = make_soup(html)
+        result = {}
+
+        # Slug манги
+        manga_link = soup.find('a', class_='card-show__placeholder')
+        if manga_link:
+            slug = _slug_from_href(manga_link.get('href', ''))
+            if slug is not None:
+                result['slug'] = slug
+
+        if 'slug' not in result:
+            poster = soup.find('div', class_='card-show__header')
+            if poster:
+                slug = _slug_from_style(poster.get('style', ''))
+                if slug is not None:
+                    result['slug'] = slug
+
+        # Уровень
+        lv = soup.find('div', class_='alliance__level-value')
+        if lv:
+            result['level'] = level_from_text(lv.text)
+
+        # Текущий опыт
+        exp_elem = soup.find('div', class_='alliance__level-exp')
+        if exp_elem:
+            result['exp_current'] = parse_number(exp_elem.text)
+
+        # Опыт до следующего уровня
+        tot_elem = soup.find('div', class_='alliance__level-total-exp')
+        if tot_elem:
+            result['exp_total'] = parse_number(tot_elem.text)
+
+        # Шанс смены манги
+        chance_elem = soup.find('span', class_='alliance__chance-change-manga')
+        if chance_elem:
+            result['chance'] = chance_elem.text.strip()
+
+        return result or None
+
+
+# ---------------------------------------------------------------------------
+# Предкомпилированные шаблоны
+# ---------------------------------------------------------------------------
+
+# класс → тег, в котором его ищет bs4-бэкенд
+_CLASS_TAGS = {
+    'card-show__placeholder': 'a',
+    'card-show__header': 'div',
+    'alliance__level-value': 'div',
+    'alliance__level-exp': 'div',
+    'alliance__level-total-exp': 'div',
+    'alliance__chance-change-manga': 'span',
+}
+
+_CLASS_RE = re.compile(
+    r'''\bclass\s*=\s*(["'])(?:[^"']*\s)?('''
+    + '|'.join(re.escape(c) for c in _CLASS_TAGS)
+    + r''')(?=[\s"'])'''
+)
+_TAG_NAME_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)')
+_TAGS_RE = re.compile(r'<[^>]*>')
+# Открывающие и закрывающие теги каждого имени из _CLASS_TAGS — для поиска
+# парного закрывающего тега, если внутри поля есть вложенный тег того же имени
+_OPEN_CLOSE_RES = {
+    tag: re.compile(r'<(/?)' + tag + r'\b[^>]*>', re.IGNORECASE) for tag in set(_CLASS_TAGS.values())
+}
+
+
+def _matching_close(html, tag, pos):
+    """Начало закрывающего тега, парного открытому до pos, или -1."""
+    depth = 1
+    for m in _OPEN_CLOSE_RES[tag].finditer(html, pos):
+        if not m.group(1):
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            return m.start()
+    return -1
+
+
+def _attr_re(name):
+    return re.compile(r'''\b''' + name + r'''\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+
+
+_FIELD_BY_CLASS = {
+    'alliance__level-value': 'level',
+    'alliance__level-exp': 'exp_current',
+    'alliance__level-total-exp': 'exp_total',
+    'alliance__chance-change-manga': 'chance',
+}
+_FIELD_PARSERS = {
+    'level': level_from_text,
+    'exp_current': parse_number,
+    'exp_total': parse_number,
+    'chance': str.strip,
+}
+
+_HREF_RE = _attr_re('href')
+_STYLE_RE = _attr_re('style')
+
+
+def _attr(regex, tag):
+    m = regex.search(tag)
+    if not m:
+        return ''
+    return html_lib.unescape(m.group(1) if m.group(1) is not None else m.group(2))
+
+
+_META_RE = re.compile(r'<meta\b[^>]*>', re.IGNORECASE)
+_INPUT_RE = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+# Не data-name и т.п.
+_NAME_RE = re.compile(r'''(?<![\w-])name\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+_CONTENT_RE = _attr_re('content')
+_VALUE_RE = _attr_re('value')
+
+
+def extract_csrf(html):
+    """
+    CSRF-токен страницы: <meta name="csrf-token" content>, иначе
+    <input name="_token" value>. Регулярками, чтобы вход и проверка
+    сессии на старте не тянули bs4.
+    """
+    for tags, name, value in ((_META_RE, 'csrf-token', _CONTENT_RE), (_INPUT_RE, '_token', _VALUE_RE)):
+        for m in tags.finditer(html):
+            tag = m.group(0)
+            if _attr(_NAME_RE, tag) == name:
+                token = _attr(value, tag).strip()
+                if token:
+                    return token
+    return None
+
+
+class RegexExtractor:
+    """
+    Один проход по классам нужных элементов. Разбирает только найденные
+    теги и останавливается, как только собраны все поля.
+    """
+
+    name = 'regex'
+
+    def extract(self, html):
+        result = {}
+        # Как и bs4, учитываем только первый элемент каждого класса
+        placeholder_seen = False
+        header_slug = None
+
+        for m in _CLASS_RE.finditer(html):
+            cls = m.group(2)
+            tag_start = html.rfind('<', 0, m.start())
+            tag_end = html.find('>', m.end())
+            if tag_start < 0 or tag_end < 0:
+                continue
+            tag = html[tag_start:tag_end + 1]
+            name = _TAG_NAME_RE.match(tag)
+            if not name or name.group(1).lower() != _CLASS_TAGS[cls]:
+                continue
+
+            if cls == 'card-show__placeholder':
+                if placeholder_seen:
+                    continue
+                placeholder_seen = True
+                slug = _slug_from_href(_attr(_HREF_RE, tag))
+                if slug is not None:
+                    result['slug'] = slug
+            elif cls == 'card-show__header':
+                if header_slug is None:
+                    header_slug = _slug_from_style(_attr(_STYLE_RE, tag)) or ''
+            else:
+                field = _FIELD_BY_CLASS[cls]
+                if field in result:
+                    continue
+                close = _matching_close(html, _CLASS_TAGS[cls], tag_end + 1)
+                if close < 0:
+                    continue
+                text = html_lib.unescape(_TAGS_RE.sub('', html[tag_end + 1:close]))
+                result[field] = _FIELD_PARSERS[field](text)
+
+            if (
+                placeholder_seen
+                and ('slug' in result or header_slug is not None)
+                and all(f in result for f in _FIELD_BY_CLASS.values())
+            ):
+                break
+
+        if 'slug' not in result and header_slug:
+            result['slug'] = header_slug
+
+        return result or None
+
+
+# ---------------------------------------------------------------------------
+# Быстрый бэкенд с откатом
+# ---------------------------------------------------------------------------
+
+class FallbackExtractor:
+    """
+    Сначала быстрый бэкенд; если он не нашёл хотя бы одно поле —
+    полный разбор. Счётчик fallbacks показывает дрейф разметки.
+    """
+
+    name = 'auto'
+
+    def __init__(self, primary=None, fallback=None):
+        self.primary = primary or RegexExtractor()
+        self.fallback = fallback or BeautifulSoupExtractor()
+        self.fallbacks = 0
+
+    def extract(self, html):
+        result = self.primary.extract(html)
+        if result and all(result.get(f) is not None for f in ALLIANCE_FIELDS):
+            return result
+        self.fallbacks += 1
+        return self.fallback.extract(html)
+
+
+# ---------------------------------------------------------------------------
+# Разбор по мере скачивания
+# ---------------------------------------------------------------------------
+
+# Классы, без которых префикс страницы точно неполон. card-show__header
+# не нужен: slug из placeholder важнее, и тот идёт после заголовка.
+_STREAM_CLASSES = tuple(c for c in _CLASS_TAGS if c != 'card-show__header')
+_STREAM_OVERLAP = max(len(c) for c in _STREAM_CLASSES) - 1
+
+
+class StreamFeed:
+    """
+    Страница альянса по кускам. feed() возвращает True, когда в уже
+    полученном префиксе есть все поля вместе с закрывающими тегами —
+    значения не обрезаны и дальше читать незачем.
+
+    Пока не пришли все классы, ищется только их появление в новом куске;
+    полный проход regex-бэкендом — лишь после этого. result — разбор
+    префикса выбранным бэкендом.
+    """
+
+    def __init__(self, extractor, encoding='utf-8'):
+        self.extractor = extractor
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._chunks = []
+        self._parts = []
+        self._missing = set(_STREAM_CLASSES)
+        self._tail = ''
+        self._probe = RegexExtractor()
+        self.result = None
+        self.done = False
+        self._html = None
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        text = self._decoder.decode(chunk)
+        self._parts.append(text)
+        if self._missing:
+            window = self._tail + text
+            self._missing = {c for c in self._missing if c not in window}
+            self._tail = window[-_STREAM_OVERLAP:]
+            if self._missing:
+                return False
+
+        # Префикс обрезается по концу последнего тега: bs4 принял бы
+        # недописанный «</span» за текст поля
+        html = ''.join(self._parts)
+        html = html[:html.rfind('>') + 1]
+        probe = self._probe.extract(html)
+        if not probe or any(probe.get(f) is None for f in ALLIANCE_FIELDS):
+            return False
+        # auto при полном результате regex вернул бы то же самое
+        if type(self.extractor) in (RegexExtractor, FallbackExtractor):
+            self.result = probe
+        else:
+            self.result = self.extractor.extract(html)
+        self._html = html
+        self.done = True
+        return True
+
+    def finish(self):
+        """Тело дочитано до конца без раннего выхода."""
+        self._parts.append(self._decoder.decode(b'', final=True))
+
+    @property
+    def content(self):
+        return b''.join(self._chunks)
+
+    @property
+    def text(self):
+        """Разобранный префикс (после раннего выхода) или всё прочитанное."""
+        return self._html if self.done else ''.join(self._parts)
+
+
+# ---------------------------------------------------------------------------
+# Страница манги
+# ---------------------------------------------------------------------------
+
+class MangaPageExtractor:
+    """Название и постер со страницы /manga/{slug} (мобильная и обычная вёрстка)."""
+
+    name = 'bs4'
+
+    def extract(self, html):
+        soup = make_soup(html)
+        result = {}
+
+        for cls in ('manga-mobile__name', 'manga__name'):
+            elem = soup.find('h1', class_=cls)
+            if elem:
+                result['title'] = elem.text.strip()
+                break
+
+        img_src = None
+        img_elem = soup.find('img', class_='manga-mobile__image')
+        if img_elem:
+            img_src = img_elem.get('src')
+        if not img_src:
+            wrapper = soup.find('div', class_='manga__img')
+            if wrapper:
+                img = wrapper.find('img')
+                if img:
+                    img_src = img.get('src')
+        if img_src:
+            result['image'] = img_src
+
+        return result or None
+
+
+EXTRACTORS = {
+    'bs4': BeautifulSoupExtractor,
+    'regex': RegexExtractor,
+    'auto': FallbackExtractor,
+}
+
+
+MANGA_EXTRACTORS = {
+    'bs4': MangaPageExtractor,
+}
+
+# Вид страницы → бэкенды (для архива страниц и его прогона)
+KINDS = {
+    'alliance': EXTRACTORS,
+    'manga': MANGA_EXTRACTORS,
+}
+
+
+def get_extractor(name='auto', kind='alliance'):
+    backends = KINDS[kind]
+    try:
+        return backends[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестный экстрактор: {name} (есть: {', '.join(backends)})")
@@ -0,0 +1,201 @@
+"""
+История смен тайтлов в SQLite (режим WAL).
+
+Каждая смена — одна INSERT-транзакция: запись дописывается, а не
+переписывает весь файл, и переживает падение процесса. Индексы по slug
+и времени позволяют искать без полного просмотра. Старый
+manga_history.json один раз импортируется при первом открытии.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL NOT NULL,
+    alliance_id TEXT,
+    slug        TEXT NOT NULL,
+    title       TEXT,
+    image       TEXT,
+    data        TEXT
+);
+CREATE INDEX IF NOT EXISTS history_slug_ts ON history (slug, ts);
+CREATE INDEX IF NOT EXISTS history_ts ON history (ts);
+CREATE INDEX IF NOT EXISTS history_alliance_ts ON history (alliance_id, ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _entry_ts(entry):
+    raw = entry.get('timestamp')
+    if raw:
+        try:
+            return datetime.strptime(raw, TIMESTAMP_FORMAT).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return time.time()
+
+
+def _row_to_entry(row):
+    entry = json.loads(row['data']) if row['data'] else {}
+    entry.update({
+        'slug': row['slug'],
+        'title': row['title'],
+        'image': row['image'],
+        'alliance_id': row['alliance_id'],
+        'ts': row['ts'],
+    })
+    return entry
+
+
+class HistoryStore:
+    def __init__(self, path, legacy_json=None, keep_days=0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # В WAL-режиме NORMAL не теряет согласованность при падении процесса
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        if legacy_json:
+            self.migrate_json(legacy_json)
+        if keep_days:
+            self.compact(keep_days=keep_days)
+
+    # ------------------------------------------------------------------
+    # Запись
+    # ------------------------------------------------------------------
+
+    def append(self, entry):
+        """Добавляет запись одной транзакцией. Возвращает id."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO history (ts, alliance_id, slug, title, image, data) VALUES (?, ?, ?, ?, ?, ?)",
+                self._row_values(entry),
+            )
+            return cur.lastrowid
+
+    def _row_values(self, entry):
+        return (
+            _entry_ts(entry),
+            entry.get('alliance_id'),
+            entry.get('slug') or '',
+            entry.get('title'),
+            entry.get('image'),
+            json.dumps(entry, ensure_ascii=False),
+        )
+
+    def migrate_json(self, path):
+        """
+        Импорт старого manga_history.json (список записей). Выполняется
+        один раз; после импорта файл переименовывается в *.migrated.
+        """
+        if not os.path.exists(path):
+            return 0
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+            if done:
+                return 0
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                entries = []
+
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO history (ts, alliance_id, slug, title, image, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._row_values(e) for e in entries if isinstance(e, dict)],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                    (path,),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        os.replace(path, f"{path}.migrated")
+        return len(entries)
+
+    def compact(self, keep_days=None, keep_last=None):
+        """Удаляет записи старше keep_days и/или всё, кроме keep_last последних."""
+        with self._lock:
+            deleted = 0
+            if keep_days:
+                cutoff = time.time() - keep_days * 86400
+                deleted += self._conn.execute("DELETE FROM history WHERE ts < ?", (cutoff,)).rowcount
+            if keep_last:
+                deleted += self._conn.execute(
+                    "DELETE FROM history WHERE id NOT IN "
+                    "(SELECT id FROM history ORDER BY ts DESC, id DESC LIMIT ?)",
+                    (keep_last,),
+                ).rowcount
+            if deleted:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return deleted
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def recent(self, limit=100, alliance_id=None):
+        return self._select("", (), alliance_id, limit)
+
+    def by_slug(self, slug, limit=100, alliance_id=None):
+        return self._select("slug = ?", (slug,), alliance_id, limit)
+
+    def between(self, start_ts, end_ts, alliance_id=None, limit=None):
+        return self._select("ts >= ? AND ts < ?", (start_ts, end_ts), alliance_id, limit)
+
+    def _select(self, where, params, alliance_id, limit):
+        clauses = [where] if where else []
+        if alliance_id is not None:
+            clauses.append("alliance_id = ?")
+            params = (*params, str(alliance_id))
+        sql = "SELECT * FROM history"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params = (*params, limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [_row_to_entry(r) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_history(path, legacy_json=None, keep_days=0):
+    """Одно соединение на файл для всех мониторов процесса."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = HistoryStore(path, legacy_json=legacy_json, keep_days=keep_days)
+        return _stores[path]
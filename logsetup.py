@@ -0,0 +1,242 @@
+"""
+Журналирование без блокировок опроса.
+
+Записи идут через стандартный logging в ограниченную очередь; фоновый
+поток забирает их пачками, пишет в консоль и в файл и сбрасывает буферы
+один раз на пачку. Если очередь переполнена, запись отбрасывается (опрос
+не ждёт диска), а число пропущенных записей попадает в журнал позже.
+
+Файл ротируется по размеру и при смене суток; хранится не больше
+backup_count старых файлов.
+
+    from logsetup import get_logger
+    log = get_logger('monitor')
+    log.warning("⚠️ Таймаут")
+
+Строка прогресса ("\\r🔍 Проверка #N...") передаётся как запись с
+extra={'progress': True}: она выводится только в консоль, без перевода
+строки, и затирается следующей записью.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import date, datetime
+
+ROOT_LOGGER = 'mangabuff'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_STOP = object()
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def _parse_level(level):
+    if isinstance(level, int):
+        return level
+    return logging.getLevelName(str(level).upper())
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не ждёт места в очереди, а считает потери."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _RotatingFile:
+    """Файл журнала с ротацией по размеру и по суткам: name, name.1 … name.N."""
+
+    def __init__(self, path, max_bytes, backup_count, daily):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.daily = daily
+        self._stream = None
+        self._day = None
+        self._size = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            st = os.stat(self.path)
+            self._size = st.st_size
+            self._day = date.fromtimestamp(st.st_mtime)
+        except FileNotFoundError:
+            self._size = 0
+            self._day = date.today()
+        self._stream = open(self.path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, lines):
+        if self._stream is None:
+            self._open()
+        today = date.today()
+        data = ''.join(lines)
+        size = len(data.encode('utf-8'))
+        if (self.daily and self._day != today) or (
+            self.max_bytes and self._size and self._size + size > self.max_bytes
+        ):
+            self._rotate()
+            self._open()
+        self._stream.write(data)
+        self._size += size
+        self._day = today
+
+    def flush(self):
+        if self._stream is not None:
+            self._stream.flush()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class LogPipeline:
+    def __init__(self, path=None, console_level=logging.DEBUG, file_level=logging.INFO,
+                 max_bytes=5 * 1024 * 1024, backup_count=5, daily=True,
+                 queue_size=10000, batch_size=256, console=None):
+        self.console = console or sys.stdout
+        self.console_level = _parse_level(console_level)
+        self.file_level = _parse_level(file_level)
+        self.batch_size = batch_size
+        self.file = _RotatingFile(path, max_bytes, backup_count, daily) if path else None
+
+        self._records = queue.Queue(maxsize=queue_size)
+        self.handler = _DroppingQueueHandler(self._records)
+        self._reported_drops = 0
+        self._progress_pending = False
+        self._file_error = None
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Поток записи
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            record = self._records.get()
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(r is _STOP for r in batch)
+            self._write([r for r in batch if r is not _STOP])
+            if stop:
+                break
+
+    def _write(self, records):
+        console, lines = [], []
+        for record in records:
+            if getattr(record, 'progress', False):
+                console.append(f"\r{record.getMessage()}")
+                self._progress_pending = True
+                continue
+            text = f"[{datetime.fromtimestamp(record.created).strftime(TIME_FORMAT)}] {record.getMessage()}"
+            if record.levelno >= self.console_level:
+                if self._progress_pending:
+                    console.append('\n')
+                    self._progress_pending = False
+                console.append(text + '\n')
+            if self.file is not None and record.levelno >= self.file_level:
+                lines.append(f"{text}\n")
+
+        dropped = self.handler.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops += dropped
+            note = f"[{datetime.now().strftime(TIME_FORMAT)}] ⚠️ Очередь журнала переполнена, пропущено записей: {dropped}\n"
+            console.append(note)
+            lines.append(note)
+
+        if console:
+            try:
+                self.console.write(''.join(console))
+                self.console.flush()
+            except (OSError, ValueError):
+                pass
+        if lines and self.file is not None:
+            try:
+                self.file.write(lines)
+                self.file.flush()
+                self._file_error = None
+            except OSError as e:
+                # Ошибку диска сообщаем один раз, пока она не пройдёт
+                if str(e) != self._file_error:
+                    self._file_error = str(e)
+                    sys.stderr.write(f"⚠️ Не удалось записать журнал: {e}\n")
+
+    # ------------------------------------------------------------------
+
+    def close(self, timeout=5):
+        try:
+            self._records.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self.file is not None:
+            self.file.close()
+
+
+def setup_logging(config=None):
+    """
+    Подключает фоновый журнал к логгеру 'mangabuff'. Повторные вызовы
+    возвращают уже созданный конвейер.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+        if config is None:
+            from config import Config as config
+
+        _pipeline = LogPipeline(
+            path=config.LOG_FILE,
+            console_level=config.LOG_CONSOLE_LEVEL,
+            file_level=config.LOG_FILE_LEVEL,
+            max_bytes=config.LOG_MAX_BYTES,
+            backup_count=config.LOG_BACKUP_COUNT,
+            daily=config.LOG_ROTATE_DAILY,
+            queue_size=config.LOG_QUEUE_SIZE,
+        )
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(logging.DEBUG)
+        root.addHandler(_pipeline.handler)
+        root.propagate = False
+        atexit.register(_pipeline.close)
+        return _pipeline
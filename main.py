@@ -6,7 +6,14 @@ MangaBuff Alliance Monitor
 Мониторинг смены тайтла в альянсе
 """
 
+import startup  # первым: от этого момента считается время старта
+
+from config import Config
+startup.mark('import_config')
+from logsetup import setup_logging
 from monitor import MangaBuffMonitor
+startup.mark('import_monitor')
+from metrics import start_metrics_server
 
 def main():
     print("""
@@ -15,8 +22,22 @@ def main():
 ║   Мониторинг смены тайтла в альянсе       ║
 ╚═══════════════════════════════════════════╝
     """)
-    
-    monitor = MangaBuffMonitor()
+
+    # Один раз и до мониторов: их транспорт, кластер, хранилища пишут в журнал уже при создании
+    setup_logging(Config)
+
+    if Config.METRICS_PORT:
+        start_metrics_server(Config.METRICS_PORT, Config.METRICS_HOST)
+        print(f"📊 Метрики: http://{Config.METRICS_HOST}:{Config.METRICS_PORT}/metrics")
+
+    if Config.ASYNC_MODE or len(Config.ALLIANCE_IDS) > 1:
+        # asyncio нужен только асинхронному движку
+        from async_monitor import AsyncAllianceMonitor
+        startup.mark('import_async')
+        monitor = AsyncAllianceMonitor()
+    else:
+        monitor = MangaBuffMonitor()
+    startup.mark('init')
     monitor.start()
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+Кэш деталей манги ({title, image}) по slug: память + файл на диске.
+
+Тайтлы в альянсе часто возвращаются, поэтому повторное объявление
+обходится без запроса /manga/{slug}. Страницы, ответившие 404,
+запоминаются отдельно (negative caching) на более короткий срок.
+
+put() только меняет память и помечает кэш изменённым; файл пишет фоновый
+поток не чаще раза в interval секунд, последние изменения — close()
+(при выходе из процесса). Запись атомарная: временный файл, os.replace.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from logsetup import get_logger
+
+log = get_logger('manga_cache')
+
+# Результат get() для slug, о котором ничего не известно
+MISS = object()
+
+
+class MangaCache:
+    def __init__(self, path=None, ttl=7 * 86400, negative_ttl=3600, max_size=1000, interval=5.0):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.interval = interval
+        # slug → (expires_at, info или None для 404)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+        self._thread = None
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="manga-cache-writer", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return
+        now = time.time()
+        for slug, expires_at, info in data.get('items', []):
+            if expires_at > now:
+                self._items[slug] = (expires_at, info)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """Пишет файл, если с прошлой записи кэш менялся (вне блокировки)."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return False
+            data = {'items': [[slug, exp, info] for slug, (exp, info) in self._items.items()]}
+            self._dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            log.warning(f"⚠️ Кэш манги не сохранён: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def close(self):
+        """Останавливает поток записи и дописывает последние изменения."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        self.save()
+
+    def get(self, slug):
+        """
+        dict с деталями — попадание; None — страница не существует (404);
+        MISS — в кэше нет или запись устарела.
+        """
+        with self._lock:
+            item = self._items.get(slug)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._items[slug]
+                self.misses += 1
+                return MISS
+            self._items.move_to_end(slug)
+            self.hits += 1
+            return dict(item[1]) if item[1] is not None else None
+
+    def put(self, slug, info):
+        self._store(slug, {k: info.get(k) for k in ('slug', 'title', 'image')}, self.ttl)
+
+    def put_missing(self, slug):
+        self._store(slug, None, self.negative_ttl)
+
+    def invalidate(self, slug):
+        with self._lock:
+            if self._items.pop(slug, None) is not None:
+                self._dirty = True
+
+    def _store(self, slug, info, ttl):
+        with self._lock:
+            self._items[slug] = (time.time() + ttl, info)
+            self._items.move_to_end(slug)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._dirty = True
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_manga_cache(path, **kwargs):
+    """Один кэш на файл для всех мониторов процесса."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = MangaCache(path, **kwargs)
+            atexit.register(_caches[path].close)
+        return _caches[path]
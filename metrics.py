@@ -0,0 +1,337 @@
+"""
+Метрики в формате Prometheus без внешних зависимостей.
+
+    from metrics import HTTP_FETCH_SECONDS
+    with HTTP_FETCH_SECONDS.labels(endpoint='boost').time():
+        ...
+
+start_metrics_server(port) поднимает /metrics в фоновом потоке.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Секунды: от миллисекунд разбора до минут задержки доставки
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        # Метрика без меток ведёт себя как свой единственный "ребёнок"
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {self.value}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', bound)])} {cumulative}")
+        cumulative += counts[-1]
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', '+Inf')])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {total}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def add_collector(self, fn):
+        """fn() вызывается перед каждой выдачей — обновить снимаемые значения."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for fn in collectors:
+            fn()
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------------------------------------------------------
+# Метрики монитора
+# ---------------------------------------------------------------------------
+
+HTTP_FETCH_SECONDS = Histogram(
+    'mangabuff_http_fetch_seconds', "Время HTTP-запроса к mangabuff.ru", ['endpoint'],
+)
+PARSE_SECONDS = Histogram(
+    'mangabuff_parse_seconds', "Время разбора страницы", ['backend'],
+)
+DETECT_SECONDS = Histogram(
+    'mangabuff_detect_seconds', "Время определения изменений после получения данных",
+)
+POLL_BYTES = Histogram(
+    'mangabuff_poll_bytes', "Размер ответа страницы альянса за опрос", buckets=BYTES_BUCKETS,
+)
+POLL_BYTES_TOTAL = Counter(
+    'mangabuff_poll_bytes_total', "Скачано байт страниц альянса", ['alliance'],
+)
+POLLS_TOTAL = Counter(
+    'mangabuff_polls_total', "Опросы страницы альянса по исходу", ['alliance', 'result'],
+)
+RETRIES_TOTAL = Counter(
+    'mangabuff_retries_total', "Повторные запросы", ['endpoint'],
+)
+RELOGINS_TOTAL = Counter(
+    'mangabuff_relogins_total', "Проверки сессии и входы", ['result'],
+)
+SESSION_EXPIRIES_TOTAL = Counter(
+    'mangabuff_session_expiries_total', "Обнаруженные потери авторизации по признаку", ['reason'],
+)
+POLL_GAP_SECONDS = Gauge(
+    'mangabuff_poll_gap_seconds',
+    "Промежуток между двумя последними опросами — верхняя граница того, "
+    "сколько изменение могло провисеть на сайте незамеченным",
+    ['alliance'],
+)
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    'telegram_request_seconds', "Время запроса к Bot API", ['method'],
+)
+TELEGRAM_RESPONSES_TOTAL = Counter(
+    'telegram_responses_total', "Ответы Bot API по статусу", ['method', 'status'],
+)
+TELEGRAM_QUEUE_DEPTH = Gauge(
+    'telegram_queue_depth', "Заданий в очереди доставки", ['chat'],
+)
+SINK_EVENTS_TOTAL = Counter(
+    'sink_events_total', "События по приёмникам и исходу", ['sink', 'result'],
+)
+SINK_QUEUE_DEPTH = Gauge(
+    'sink_queue_depth', "Событий в очереди приёмника", ['sink'],
+)
+CLUSTER_LEADER = Gauge(
+    'cluster_leader', "1 — узел держит аренду ведущего", ['node'],
+)
+CLUSTER_EVENTS_TOTAL = Counter(
+    'cluster_events_total', "События кластера: записаны, дубли, доставлены", ['result'],
+)
+POLL_INTERVAL_SECONDS = Gauge(
+    'mangabuff_poll_interval_seconds', "Текущий адаптивный интервал опроса (без джиттера)", ['alliance'],
+)
+POLL_BACKOFF_SECONDS = Gauge(
+    'mangabuff_poll_backoff_seconds', "Задержка после ошибки опроса; 0 — ошибок нет", ['alliance'],
+)
+POLL_INTERVAL_ADJUSTMENTS_TOTAL = Counter(
+    'mangabuff_poll_interval_adjustments_total',
+    "Корректировки интервала по причине: changed, idle, change_rate, chance, "
+    "backoff, retry_after, recovered",
+    ['alliance', 'reason'],
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    'mangabuff_startup_phase_seconds', "Конец фазы старта, секунд от запуска", ['phase'],
+)
+SOURCE_FETCH_SECONDS = Histogram(
+    'mangabuff_source_fetch_seconds', "Опрос данных альянса по источнику (html, json)", ['source'],
+)
+SOURCE_FALLBACKS_TOTAL = Counter(
+    'mangabuff_source_fallbacks_total', "Откаты с JSON-источника на страницу по причине", ['reason'],
+)
+STREAM_FETCHES_TOTAL = Counter(
+    'mangabuff_stream_fetches_total',
+    "Потоковые чтения /boost: ранний выход с дочиткой или закрытием, полное чтение",
+    ['result'],
+)
+ARCHIVE_PAGES_TOTAL = Counter(
+    'page_archive_pages_total', "Образцы страниц в архиве: записаны, отброшены", ['kind', 'result'],
+)
+STAT_CHANGES_TOTAL = Counter(
+    'mangabuff_stat_changes_total',
+    "Изменения полей статистики: опубликованы (significant, batch), отложены (deferred)",
+    ['field', 'result'],
+)
+CIRCUIT_STATE = Gauge(
+    'mangabuff_circuit_state', "Предохранитель эндпоинта: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут",
+    ['endpoint'],
+)
+HEDGED_REQUESTS_TOTAL = Counter(
+    'mangabuff_hedged_requests_total', "Хедж-попытки: отправлены, ответили первыми", ['endpoint', 'result'],
+)
+HTTP_CONNECTIONS_OPENED = Gauge(
+    'http_connections_opened',
+    "Открыто соединений (с DNS и TLS) в пуле клиента; для http2 — открыто сейчас",
+    ['client', 'host'],
+)
+HTTP_REQUESTS_SENT = Gauge(
+    'http_requests_sent', "Отправлено запросов через пул клиента", ['client', 'host'],
+)
+CHANGE_TO_NOTIFY_SECONDS = Histogram(
+    'mangabuff_change_to_notify_seconds',
+    "От получения страницы с изменением до ответа Telegram",
+    ['kind'],
+)
+
+
+# ---------------------------------------------------------------------------
+# HTTP /metrics
+# ---------------------------------------------------------------------------
+
+def start_metrics_server(port, host='127.0.0.1', registry=None):
+    """Поднимает /metrics в фоновом потоке. Возвращает сервер."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -1,14 +1,38 @@
 import time
-import json
+import hashlib
+import logging
 import os
 import re
+import threading
 from datetime import datetime, date
 from urllib.parse import unquote
 import requests
-from bs4 import BeautifulSoup
 
+from changes import ChangeDetector, parse_thresholds
 from config import Config
+from executor import CircuitOpenError, open_executor
+from extractors import StreamFeed, extract_csrf, get_extractor
+from page_archive import open_archive
+from scheduler import AdaptiveScheduler, parse_retry_after
+import startup
+from session_health import SessionHealth, auth_flag, expiry_reason
+from sources import SourceSet
+from session_store import load_session, save_session
+from state_store import open_state
+from history_store import open_history
+from manga_cache import MISS, open_manga_cache
+from cluster import open_cluster
+from events import (
+    AuthLost, DayRollover, EventBus, MonitorStopped, Notice, StatsChanged, TitleChanged, add_sinks,
+)
+from exp_series import ExpSeries
+from logsetup import get_logger
+from metrics import (
+    DETECT_SECONDS, HTTP_FETCH_SECONDS, PARSE_SECONDS, POLL_BYTES, POLL_BYTES_TOTAL,
+    POLL_GAP_SECONDS, POLLS_TOTAL, RELOGINS_TOTAL, STREAM_FETCHES_TOTAL,
+)
 from telegram_bot import TelegramNotifier
+from transport import ACCEPT_ENCODING, make_session
 
 
 USER_AGENT = (
@@ -17,8 +41,45 @@ USER_AGENT = (
     "Chrome/145.0.0.0 Safari/537.36"
 )
 
-BASE_URL = "https://mangabuff.ru"
+BASE_URL = Config.MANGABUFF_BASE_URL
 REQUEST_TIMEOUT = 15
+# Кусок потокового чтения /boost: данные альянса — в первых ~8 КБ страницы
+STREAM_CHUNK = 4096
+
+
+# Маркеры блока альянса на странице /boost. Всё, что вне этого фрагмента
+# (CSRF-токены, счётчики, скрипты), меняется от запроса к запросу и не
+# должно влиять на хэш.
+_RELEVANT_MARKERS = (
+    b'card-show__',
+    b'alliance__level',
+    b'alliance__chance-change-manga',
+)
+# Потолок хвоста после последнего маркера, если закрывающий тег не найден
+_RELEVANT_TAIL = 512
+
+
+def _relevant_region_digest(content):
+    """Хэш фрагмента страницы с данными альянса или None, если маркеров нет."""
+    starts = [i for i in (content.find(m) for m in _RELEVANT_MARKERS) if i >= 0]
+    if len(starts) != len(_RELEVANT_MARKERS):
+        return None
+    # Фрагмент начинается с тега, в котором стоит первый маркер: атрибуты
+    # перед class (href="/manga/…" у карточки) тоже должны попасть в хэш
+    start = content.rfind(b'<', 0, min(starts))
+    if start < 0:
+        start = min(starts)
+    last = max(content.rfind(m) for m in _RELEVANT_MARKERS)
+    # Фрагмент заканчивается на закрывающем теге после последнего маркера,
+    # чтобы в хэш попало значение поля, но не соседние скрипты
+    end = content.find(b'</', last, last + _RELEVANT_TAIL)
+    if end < 0:
+        end = last + _RELEVANT_TAIL
+    return hashlib.blake2b(content[start:end], digest_size=16).digest()
+
+
+def alliance_boost_url(alliance_id):
+    return f"{BASE_URL}/alliances/{alliance_id}/boost"
 
 
 # ---------------------------------------------------------------------------
@@ -32,19 +93,18 @@ def _get_cookie(jar, name):
     return None
 
 
-def _extract_csrf(html):
-    soup = BeautifulSoup(html, "html.parser")
-    meta = soup.select_one('meta[name="csrf-token"]')
-    if meta:
-        t = meta.get("content", "").strip()
-        if t:
-            return t
-    inp = soup.find("input", {"name": "_token"})
-    if inp:
-        t = inp.get("value", "").strip()
-        if t:
-            return t
-    return None
+def _page_is_auth(html):
+    """Признак авторизации на любой странице сайта: window.isAuth / window.user_id."""
+    if "window.isAuth = 1" in html or "window.isAuth=1" in html:
+        return True
+    m = re.search(r'window\.user_id\s*=\s*(\d+)', html)
+    uid = m.group(1) if m else "0"
+    return bool(uid and uid != "0")
+
+
+def _unavailable(response):
+    """Сайт перегружен или лежит — ответ ничего не говорит об авторизации."""
+    return response.status_code >= 500 or response.status_code == 429
 
 
 def _apply_ajax_tokens(session):
@@ -62,7 +122,7 @@ def _nav_headers(referer=None, fetch_site="none"):
             "application/signed-exchange;v=b3;q=0.7"
         ),
         "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
+        "Accept-Encoding": ACCEPT_ENCODING,
         "Upgrade-Insecure-Requests": "1",
         "Sec-Ch-Ua": '"Not:A-Brand";v="99", "Google Chrome";v="145", "Chromium";v="145"',
         "Sec-Ch-Ua-Mobile": "?0",
@@ -83,76 +143,188 @@ def _nav_headers(referer=None, fetch_site="none"):
 # ---------------------------------------------------------------------------
 
 class MangaBuffMonitor:
-    def __init__(self):
+    """
+    Состояние и логика опроса одного альянса.
+
+    Несколько мониторов могут делить одну авторизованную сессию
+    (см. async_monitor.AsyncAllianceMonitor).
+    """
+
+    def __init__(self, alliance_id=None, session=None, telegram=None, log_prefix="", bus=None, health=None):
         self.config = Config()
-        self.telegram = TelegramNotifier(
-            self.config.TELEGRAM_BOT_TOKEN,
-            self.config.TELEGRAM_CHAT_ID,
+        self.alliance_id = str(alliance_id or self.config.ALLIANCE_IDS[0])
+        self.alliance_url = alliance_boost_url(self.alliance_id)
+        self.log_prefix = log_prefix
+
+        if telegram is None:
+            chat_id, topic_ids = self.config.alliance_route(self.alliance_id)
+            telegram = TelegramNotifier(
+                self.config.TELEGRAM_BOT_TOKEN,
+                chat_id,
+                topic_ids=topic_ids,
+                alliance_url=self.alliance_url,
+            )
+        self.telegram = telegram
+        # В кластерном режиме события идут через общий outbox, рассылает ведущий
+        self.cluster = open_cluster(self.config)
+        # Изменения уходят в приёмники через шину; общая шина — у AsyncAllianceMonitor
+        self.bus = bus if bus is not None else add_sinks(
+            self.cluster or EventBus(), self.config, {self.alliance_id: telegram}
         )
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": USER_AGENT})
+
+        if session is None:
+            session = make_session(
+                'mangabuff', self.config.HTTP_POOL_SIZE, http2=self.config.HTTP2,
+                headers={"User-Agent": USER_AGENT},
+            )
+        self.session = session
+        self._session_loaded = False
+        # Потеря авторизации — по каждому ответу, повторный вход — в фоне.
+        # При общей сессии (AsyncAllianceMonitor) и SessionHealth общий
+        if health is None:
+            health = SessionHealth(
+                session,
+                login=self.login,
+                probe=self._probe_session,
+                new_session=lambda: make_session('mangabuff', 2, headers={"User-Agent": USER_AGENT}),
+                on_swapped=self.save_session,
+                refresh_interval=self.config.SESSION_REFRESH_INTERVAL,
+                attempts=self.config.SESSION_RELOGIN_ATTEMPTS,
+                request_timeout=REQUEST_TIMEOUT,
+            )
+        self.health = health
 
         self.current_manga = None       # slug текущей манги
         self.current_manga_info = None  # dict с title/image
-
-        # Последние известные данные альянса для определения изменений
+        # Смена тайтла из опроса и фоновый стартовый анонс (FAST_START)
+        # публикуются под одним замком, чтобы устаревший анонс не обогнал новый тайтл
+        self._title_lock = threading.Lock()
+        self._announcer = None
+        # Об отказах во входе сообщаем один раз, а не каждый опрос
+        self._auth_lost_reported = False
+
+        # Последние опубликованные данные альянса — база для определения изменений
         self.last_page_data: dict = {}
+        # Данные предыдущего опроса — для планировщика (активность альянса)
+        self._last_polled: dict = {}
+        # Пороги значимости по полям и окно накопления мелких изменений
+        self.changes = ChangeDetector(
+            parse_thresholds(self.config.CHANGE_THRESHOLDS), self.config.CHANGE_BATCH_WINDOW
+        )
 
         # Трекинг прироста опыта за день
         self.today = date.today()
         self.exp_at_day_start = None
         self.last_known_exp = None
 
-        os.makedirs(self.config.LOG_DIR, exist_ok=True)
+        # Ряд (ts, опыт, уровень, шанс): темп, прогноз, агрегаты по часам/дням
+        series_path = None
+        if self.config.EXP_SERIES_DIR:
+            os.makedirs(self.config.EXP_SERIES_DIR, exist_ok=True)
+            series_path = os.path.join(self.config.EXP_SERIES_DIR, f"exp_{self.alliance_id}.bin")
+        self.exp_series = ExpSeries(series_path, capacity=self.config.EXP_SERIES_CAPACITY)
+
+        # Быстрый путь для неизменившейся страницы альянса
+        self._page_validators: dict = {}
+        self._page_digest = None
+        self._page_cache = None
+        self.page_stats = {'polls': 0, 'not_modified': 0, 'hash_hits': 0, 'parsed': 0, 'streamed': 0, 'bytes': 0}
+        self.extractor = get_extractor(self.config.EXTRACTOR)
+        self.manga_extractor = get_extractor('bs4', kind='manga')
+        # Образцы страниц с результатом разбора (PAGE_ARCHIVE_DIR, по умолчанию выключено)
+        self.archive = open_archive(self.config)
+        # Запросы к сайту: бюджет на вызов, предохранитель, хеджирование (общие на процесс)
+        self.executor = open_executor(self.config)
+        # Откуда берутся данные альянса: страница или найденный JSON-эндпоинт
+        self.sources = SourceSet(
+            self,
+            mode=self.config.DATA_SOURCE,
+            json_urls=self.config.DATA_SOURCE_JSON_URLS,
+            retry=self.config.DATA_SOURCE_RETRY,
+            budget=self.config.POLL_DEADLINE,
+        )
+        # Последняя разобранная страница — для поиска JSON-эндпоинта без повторного GET
+        self.last_page_html = None
+        self.last_fetch_error = None
+        # monotonic-время последнего ответа страницы альянса
+        self.last_fetch_at = None
+
+        self.manga_cache = open_manga_cache(
+            self.config.MANGA_CACHE_FILE,
+            ttl=self.config.MANGA_CACHE_TTL,
+            negative_ttl=self.config.MANGA_CACHE_NEGATIVE_TTL,
+            max_size=self.config.MANGA_CACHE_SIZE,
+        )
+
+        # Интервал опроса подстраивается под частоту изменений и ошибки
+        self.scheduler = AdaptiveScheduler(name=self.alliance_id)
+
+        # Снимок состояния для перезапуска без повторной рассылки
+        self.snapshots = open_state(self.config.STATE_FILE, self.config.STATE_SNAPSHOT_INTERVAL)
+
+        # Журнал настраивает main.py (logsetup.setup_logging) до создания мониторов
+        self.logger = get_logger('monitor')
+
+        if self.cluster:
+            self.cluster.register(self)
 
     # ------------------------------------------------------------------
     # Логирование
     # ------------------------------------------------------------------
 
-    def log(self, message, force=False):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_message = f"[{timestamp}] {message}"
-        print(log_message)
-        if force or any(m in message for m in ['✅', '❌', '🔔', '⚠️', '🔐', '🚀', '⏹️']):
-            with open(self.config.LOG_FILE, 'a', encoding='utf-8') as f:
-                f.write(log_message + '\n')
+    def log(self, message, level=logging.INFO):
+        self.logger.log(level, f"{self.log_prefix}{message}")
+
+    def progress(self, message):
+        """Строка прогресса: только в консоль, затирается следующей записью."""
+        self.logger.debug(f"{self.log_prefix}{message}", extra={'progress': True})
 
     # ------------------------------------------------------------------
     # Авторизация
     # ------------------------------------------------------------------
 
-    def login(self):
+    def login(self, session=None):
+        """
+        Полный вход. session — на какой сессии входить (по умолчанию рабочая;
+        фоновый вход SessionHealth передаёт чистую).
+        True — вошли, False — сайт отказал во входе, None — сайт недоступен
+        (сеть, 5xx, 429, страница без формы входа): это не повод считать
+        учётные данные негодными.
+        """
+        if session is None:
+            session = self.session
         try:
             self.log("🔐 Вход в аккаунт...")
 
             try:
-                r0 = self.session.get(BASE_URL, headers=_nav_headers(), timeout=REQUEST_TIMEOUT)
-                self.log(f"   [1] GET / → {r0.status_code}, куки: {[c.name for c in self.session.cookies]}")
+                r0 = session.get(BASE_URL, headers=_nav_headers(), timeout=REQUEST_TIMEOUT)
+                self.log(f"   [1] GET / → {r0.status_code}, куки: {[c.name for c in session.cookies]}", logging.DEBUG)
             except requests.RequestException as e:
-                self.log(f"   [1] GET / → ошибка: {e} (продолжаем)")
+                self.log(f"   [1] GET / → ошибка: {e} (продолжаем)", logging.DEBUG)
 
             try:
-                r_get = self.session.get(
+                r_get = session.get(
                     f"{BASE_URL}/login",
                     headers=_nav_headers(referer=f"{BASE_URL}/", fetch_site="same-origin"),
                     timeout=REQUEST_TIMEOUT,
                 )
             except requests.RequestException as e:
-                self.log(f"   [2] GET /login → ошибка: {e}")
-                return False
+                self.log(f"   [2] GET /login → ошибка: {e}", logging.DEBUG)
+                return None
 
-            self.log(f"   [2] GET /login → {r_get.status_code}")
+            self.log(f"   [2] GET /login → {r_get.status_code}", logging.DEBUG)
             if r_get.status_code != 200:
-                self.log(f"   ❌ Неожиданный статус: {r_get.status_code}")
-                return False
+                self.log(f"   ❌ Неожиданный статус: {r_get.status_code}", logging.ERROR)
+                return None if _unavailable(r_get) else False
 
-            csrf = _extract_csrf(r_get.text)
+            csrf = extract_csrf(r_get.text)
             if not csrf:
-                self.log("   ❌ CSRF-токен не найден")
-                return False
+                # Техработы или проверка браузера вместо формы входа
+                self.log("   ❌ CSRF-токен не найден", logging.ERROR)
+                return None
 
-            self.log(f"   CSRF: {csrf[:30]}...")
-            xsrf_raw = _get_cookie(self.session.cookies, "XSRF-TOKEN")
+            self.log(f"   CSRF: {csrf[:30]}...", logging.DEBUG)
+            xsrf_raw = _get_cookie(session.cookies, "XSRF-TOKEN")
             xsrf = unquote(xsrf_raw) if xsrf_raw else csrf
 
             ajax_headers = {
@@ -172,7 +344,7 @@ class MangaBuffMonitor:
             }
 
             try:
-                r_post = self.session.post(
+                r_post = session.post(
                     f"{BASE_URL}/login",
                     data={
                         "email": self.config.MANGABUFF_EMAIL,
@@ -184,219 +356,406 @@ class MangaBuffMonitor:
                     timeout=REQUEST_TIMEOUT,
                 )
             except requests.RequestException as e:
-                self.log(f"   [3] POST /login → ошибка: {e}")
-                return False
+                self.log(f"   [3] POST /login → ошибка: {e}", logging.DEBUG)
+                return None
 
-            self.log(f"   [3] POST /login → {r_post.status_code}, URL: {r_post.url}")
+            self.log(f"   [3] POST /login → {r_post.status_code}, URL: {r_post.url}", logging.DEBUG)
+            if _unavailable(r_post):
+                return None
             ct = r_post.headers.get("content-type", "")
 
             if "application/json" in ct:
                 try:
                     j = r_post.json()
-                    self.log(f"   JSON: {j}")
+                    self.log(f"   JSON: {j}", logging.DEBUG)
                 except Exception:
-                    self.log(f"   JSON parse error: {r_post.text[:200]}")
+                    self.log(f"   JSON parse error: {r_post.text[:200]}", logging.DEBUG)
                     return False
                 if j.get("errors") or j.get("message") == "Unauthenticated." or j.get("status") == "error":
-                    self.log(f"   ❌ Сервер: {j}")
+                    self.log(f"   ❌ Сервер: {j}", logging.ERROR)
                     return False
             else:
-                self.log(f"   Не JSON: {r_post.text[:300]}")
+                self.log(f"   Не JSON: {r_post.text[:300]}", logging.DEBUG)
 
             try:
-                r_main = self.session.get(BASE_URL, timeout=REQUEST_TIMEOUT)
-                if "window.isAuth = 1" in r_main.text or "window.isAuth=1" in r_main.text:
-                    self.log("   ✅ window.isAuth=1")
-                    is_auth = True
-                else:
-                    m = re.search(r'window\.user_id\s*=\s*(\d+)', r_main.text)
-                    uid = m.group(1) if m else "0"
-                    self.log(f"   window.user_id={uid}")
-                    is_auth = bool(uid and uid != "0")
-            except Exception as e:
-                self.log(f"   isAuth check error: {e}")
-                is_auth = False
+                r_main = session.get(BASE_URL, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                self.log(f"   isAuth check error: {e}", logging.DEBUG)
+                return None
+            if _unavailable(r_main):
+                return None
+            is_auth = _page_is_auth(r_main.text)
+            self.log(f"   isAuth: {is_auth}", logging.DEBUG)
 
             if not is_auth:
-                self.log("   ❌ Не авторизованы после POST /login")
+                self.log("   ❌ Не авторизованы после POST /login", logging.ERROR)
                 return False
 
-            _apply_ajax_tokens(self.session)
-            new_csrf = _extract_csrf(r_post.text if "text/html" in ct else r_main.text)
+            _apply_ajax_tokens(session)
+            new_csrf = extract_csrf(r_post.text if "text/html" in ct else r_main.text)
             if new_csrf:
-                self.session.headers.update({"X-CSRF-TOKEN": new_csrf})
-            self.session.headers.update({"X-Requested-With": "XMLHttpRequest"})
+                session.headers.update({"X-CSRF-TOKEN": new_csrf})
+            session.headers.update({"X-Requested-With": "XMLHttpRequest"})
 
             self.log("✅ Успешный вход")
+            if session is self.session:
+                self.save_session()
             return True
 
         except Exception as e:
-            self.log(f"❌ Ошибка при входе: {e}")
+            self.log(f"❌ Ошибка при входе: {e}", logging.ERROR)
             return False
 
+    def ensure_session(self):
+        """
+        Авторизация с минимумом запросов: сохранённые куки проверяются
+        одним GET /, полный вход (4 запроса) — только если проверка не прошла.
+        """
+        if not self._session_loaded:
+            self._session_loaded = True
+            if self.config.SESSION_FILE and load_session(
+                self.session, self.config.SESSION_FILE, account=self.config.MANGABUFF_EMAIL
+            ):
+                self.log("🔐 Найдена сохранённая сессия")
+
+        if _get_cookie(self.session.cookies, "XSRF-TOKEN") and self._probe_session():
+            self.log("✅ Сессия действительна, вход не нужен")
+            RELOGINS_TOTAL.labels('probe_ok').inc()
+            self.save_session()
+            return True
+
+        # Протухшие куки могут помешать входу — начинаем с чистой сессии
+        self.session.cookies.clear()
+        ok = self.login()
+        RELOGINS_TOTAL.labels('login_ok' if ok else 'login_failed').inc()
+        return ok
+
+    def _probe_session(self, session=None):
+        """
+        Один GET / — авторизованы ли текущие куки. Заодно обновляет токены.
+        False — только явный отказ: 401/419, редирект на /login или страница
+        с window.isAuth = 0. None — проверить не удалось: сеть, 5xx, 429,
+        страница без признака авторизации (техработы, проверка браузера).
+        """
+        if session is None:
+            session = self.session
+        try:
+            r = session.get(BASE_URL, headers=_nav_headers(), timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            self.log(f"   Проверка сессии → ошибка: {e}", logging.DEBUG)
+            return None
+        reason = expiry_reason(r)
+        if reason:
+            self.log(f"   Проверка сессии → {r.status_code}, не авторизованы ({reason})", logging.DEBUG)
+            return False
+        if r.status_code != 200 or not _page_is_auth(r.text):
+            self.log(f"   Проверка сессии → {r.status_code}, признака авторизации нет", logging.DEBUG)
+            return None
+
+        _apply_ajax_tokens(session)
+        csrf = extract_csrf(r.text)
+        if csrf:
+            session.headers.update({"X-CSRF-TOKEN": csrf})
+        session.headers.update({"X-Requested-With": "XMLHttpRequest"})
+        return True
+
+    def save_session(self):
+        if not self.config.SESSION_FILE:
+            return
+        try:
+            save_session(self.session, self.config.SESSION_FILE, account=self.config.MANGABUFF_EMAIL)
+        except OSError as e:
+            self.log(f"⚠️ Не удалось сохранить сессию: {e}", logging.WARNING)
+
     # ------------------------------------------------------------------
     # Парсинг страницы альянса
     # ------------------------------------------------------------------
 
-    def _parse_number(self, text):
-        if not text:
-            return None
-        cleaned = re.sub(r'[^\d]', '', text.strip())
-        return int(cleaned) if cleaned else None
+    def _parse_alliance_page(self, response, html=None):
+        """Разбор HTML страницы /boost → dict или None."""
+        return self._extract_recorded('alliance', self.extractor, response, self.alliance_url, html)
+
+    def _extract_recorded(self, kind, extractor, response, url, html=None):
+        """
+        extractor.extract(html or response.text) с записью страницы и
+        результата в архив (если он включён). Ошибка разбора тоже
+        записывается и пробрасывается дальше.
+        """
+        if html is None:
+            html = response.text
+        if self.archive is None:
+            return extractor.extract(html)
+        try:
+            record = extractor.extract(html)
+        except Exception as e:
+            self.archive.record(
+                kind, url, response, extractor.name, None, error=f"{type(e).__name__}: {e}", html=html
+            )
+            raise
+        self.archive.record(kind, url, response, extractor.name, record, html=html)
+        return record
+
+    def _read_streamed(self, response):
+        """
+        Читает тело /boost кусками и разбирает по мере получения
+        (extractors.StreamFeed). Как только все поля пришли, чтение
+        прекращается: остаток не больше STREAM_DRAIN_BYTES дочитывается
+        без разбора, чтобы соединение вернулось в пул живым, иначе
+        соединение закрывается. Возвращает (feed, прочитано байт).
+        """
+        feed = StreamFeed(self.extractor, response.encoding or 'utf-8')
+        chunks = response.iter_content(STREAM_CHUNK)
+        read = 0
+        try:
+            for chunk in chunks:
+                read += len(chunk)
+                if feed.feed(chunk):
+                    break
+            else:
+                feed.finish()
+                STREAM_FETCHES_TOTAL.labels('full').inc()
+                return feed, read
+
+            self.page_stats['streamed'] += 1
+            length = response.headers.get('Content-Length')
+            tell = getattr(response.raw, 'tell', None)
+            remaining = int(length) - tell() if length and length.isdigit() and tell else None
+            if remaining is not None and remaining <= self.config.STREAM_DRAIN_BYTES:
+                for chunk in chunks:
+                    read += len(chunk)
+                STREAM_FETCHES_TOTAL.labels('early_drained').inc()
+            else:
+                STREAM_FETCHES_TOTAL.labels('early_closed').inc()
+            return feed, read
+        finally:
+            response.close()
+
+    def _mark_fetch(self, size):
+        """Учёт ответа: байты и промежуток между опросами."""
+        now = time.monotonic()
+        if self.last_fetch_at is not None:
+            POLL_GAP_SECONDS.labels(self.alliance_id).set(now - self.last_fetch_at)
+        self.last_fetch_at = now
+        self.page_stats['bytes'] += size
+        POLL_BYTES.observe(size)
+        POLL_BYTES_TOTAL.labels(self.alliance_id).inc(size)
+
+    def _count_poll(self, result):
+        POLLS_TOTAL.labels(self.alliance_id, result).inc()
+
+    def _fail_http(self, response):
+        if response.status_code >= 500:
+            self.log(f"⚠️ Ошибка сервера {response.status_code}", logging.WARNING)
+        else:
+            self.log(f"⚠️ Статус {response.status_code}", logging.WARNING)
+        self.last_fetch_error = {
+            'kind': f"http_{response.status_code}",
+            'retry_after': parse_retry_after(response.headers.get('Retry-After')),
+        }
+        self._count_poll(self.last_fetch_error['kind'])
+
+    def _get(self, url, timeout, **kwargs):
+        """Одна попытка GET рабочей сессией — send() для исполнителя запросов."""
+        with self.health.request():
+            return self.session.get(url, timeout=timeout, **kwargs)
+
+    def _fail_circuit(self, error):
+        self.log(f"⚡ {error}", logging.WARNING)
+        self.last_fetch_error = {'kind': 'circuit_open', 'retry_after': error.retry_in}
+        self._count_poll('circuit_open')
+
+    def _fail_network(self, kind, error):
+        self.log(f"⚠️ {'Таймаут' if kind == 'timeout' else 'Сеть'}: {error}", logging.WARNING)
+        self.last_fetch_error = {'kind': kind, 'retry_after': None}
+        self._count_poll(kind)
 
     def get_alliance_page_data(self):
         """
         Возвращает dict:
           slug, level, exp_current, exp_total, chance
-        """
-        max_retries = 3
-        retry_delay = 5
 
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(self.config.ALLIANCE_URL, timeout=15)
-
-                if response.status_code in (500, 503):
-                    self.log(f"⚠️ Ошибка сервера {response.status_code} (попытка {attempt+1}/{max_retries})", force=True)
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    return None
-
-                if response.status_code != 200:
-                    self.log(f"⚠️ Статус {response.status_code} (попытка {attempt+1}/{max_retries})", force=True)
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    return None
-
-                soup = BeautifulSoup(response.text, 'html.parser')
-                result = {}
-
-                # Slug манги
-                manga_link = soup.find('a', class_='card-show__placeholder')
-                if manga_link:
-                    href = manga_link.get('href', '')
-                    if href.startswith('/manga/'):
-                        result['slug'] = href.replace('/manga/', '')
-
-                if 'slug' not in result:
-                    poster = soup.find('div', class_='card-show__header')
-                    if poster:
-                        style = poster.get('style', '')
-                        if 'background-image: url(' in style:
-                            try:
-                                img_url = style.split("url('")[1].split("'")[0]
-                                result['slug'] = img_url.split('/posters/')[-1].replace('.jpg', '')
-                            except Exception:
-                                pass
-
-                # Уровень
-                lv = soup.find('div', class_='alliance__level-value')
-                if lv:
-                    m = re.search(r'\d+', lv.text)
-                    result['level'] = m.group(0) if m else None
-
-                # Текущий опыт
-                exp_elem = soup.find('div', class_='alliance__level-exp')
-                if exp_elem:
-                    result['exp_current'] = self._parse_number(exp_elem.text)
-
-                # Опыт до следующего уровня
-                tot_elem = soup.find('div', class_='alliance__level-total-exp')
-                if tot_elem:
-                    result['exp_total'] = self._parse_number(tot_elem.text)
-
-                # Шанс смены манги
-                chance_elem = soup.find('span', class_='alliance__chance-change-manga')
-                if chance_elem:
-                    result['chance'] = chance_elem.text.strip()
-
-                return result or None
-
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                self.log(f"⚠️ Сеть: {e} (попытка {attempt+1}/{max_retries})", force=True)
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
+        Данные берутся из текущего источника (sources.SourceSet): страница
+        или JSON-эндпоинт. Повторов внутри нет: при ошибке возвращает None
+        и запоминает её в last_fetch_error — задержку до следующей попытки
+        выбирает планировщик (scheduler.AdaptiveScheduler).
+        """
+        data = self.sources.fetch()
+        if data is not None:
+            startup.mark('first_poll')
+        return data
+
+    def _fetch_html_page_data(self):
+        """Данные альянса со страницы /boost (источник html)."""
+        self.last_fetch_error = None
+        try:
+            self.page_stats['polls'] += 1
+            # Условный GET имеет смысл, только если есть что вернуть на 304
+            conditional = self._page_validators if self._page_cache is not None else None
+            stream = self.config.STREAM_FETCH
+            feed = None
+            with HTTP_FETCH_SECONDS.labels('boost').time():
+                response = self.executor.call(
+                    'boost',
+                    lambda timeout: self._get(self.alliance_url, timeout, headers=conditional, stream=stream),
+                    deadline=self.config.POLL_DEADLINE,
+                )
+                if stream and response.status_code == 200:
+                    feed, size = self._read_streamed(response)
+                    content = feed.content
+                else:
+                    content = response.content
+                    size = len(content)
+            self._mark_fetch(size)
+
+            # Протухшая сессия приходит как 200/302, а не как исключение
+            reason = self.health.check(response, content)
+            if reason:
+                self.log(f"🔐 Сессия истекла ({reason})", logging.WARNING)
+                self.last_fetch_error = {'kind': 'auth', 'retry_after': None}
+                self._count_poll('auth_expired')
                 return None
 
-            except Exception as e:
-                self.log(f"⚠️ Ошибка парсинга: {e}", force=True)
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
+            if response.status_code == 304 and self._page_cache is not None:
+                self.page_stats['not_modified'] += 1
+                self._count_poll('not_modified')
+                return dict(self._page_cache)
+
+            if response.status_code != 200:
+                self._fail_http(response)
                 return None
 
-        return None
+            # ETag / Last-Modified — на следующем тике отправим условный GET
+            self._page_validators = {
+                k: response.headers[h]
+                for k, h in (('If-None-Match', 'ETag'), ('If-Modified-Since', 'Last-Modified'))
+                if response.headers.get(h)
+            }
+
+            # Сервер условные запросы не поддерживает — сравниваем хэш
+            # значимого фрагмента страницы и не парсим её повторно
+            digest = _relevant_region_digest(content)
+            if digest is not None and digest == self._page_digest and self._page_cache is not None:
+                self.page_stats['hash_hits'] += 1
+                self._count_poll('hash_hit')
+                return dict(self._page_cache)
+
+            self.page_stats['parsed'] += 1
+            self._count_poll('parsed')
+            if feed is not None and feed.done:
+                # Уже разобрано по ходу чтения
+                result = feed.result
+                if self.archive is not None:
+                    self.archive.record(
+                        'alliance', self.alliance_url, response, self.extractor.name, result, html=feed.text
+                    )
+            else:
+                with PARSE_SECONDS.labels(self.extractor.name).time():
+                    result = self._parse_alliance_page(response, feed.text if feed is not None else None)
+            if result and self.sources.mode == 'auto':
+                self.last_page_html = feed.text if feed is not None else response.text
+            if result and digest is not None:
+                self._page_digest = digest
+                self._page_cache = result
+                return dict(result)
+            self._page_digest = None
+            self._page_cache = None
+            if not result and auth_flag(content) is None:
+                # Ни данных альянса, ни window.isAuth — техработы, проверка браузера
+                # или оборванный ответ, но не потеря сессии: её признаки проверены выше.
+                # Страница уже в архиве (если он включён) — с результатом None
+                self.log("⚠️ Ответ без данных альянса и признака авторизации", logging.WARNING)
+                self.last_fetch_error = {'kind': 'no_marker', 'retry_after': None}
+                self._count_poll('no_marker')
+            return result
+
+        except CircuitOpenError as e:
+            self._fail_circuit(e)
+            return None
+
+        except requests.exceptions.Timeout as e:
+            self._fail_network('timeout', e)
+            return None
+
+        except requests.exceptions.ConnectionError as e:
+            self._fail_network('network', e)
+            return None
+
+        except Exception as e:
+            self.log(f"⚠️ Ошибка парсинга: {e}", logging.WARNING)
+            self.last_fetch_error = {'kind': 'parse', 'retry_after': None}
+            self._count_poll('parse_error')
+            return None
 
     # ------------------------------------------------------------------
     # Детали манги
     # ------------------------------------------------------------------
 
     def get_manga_details(self, manga_slug):
-        max_retries = 3
-        retry_delay = 5
-
-        for attempt in range(max_retries):
-            try:
-                url = f"{BASE_URL}/manga/{manga_slug}"
-                response = self.session.get(url, timeout=15)
-
-                if response.status_code != 200:
-                    self.log(f"❌ Ошибка страницы манги: {response.status_code}", force=True)
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    return None
-
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                title = None
-                for cls in ('manga-mobile__name', 'manga__name'):
-                    elem = soup.find('h1', class_=cls)
-                    if elem:
-                        title = elem.text.strip()
-                        break
-                if not title:
-                    title = manga_slug
-
-                img_src = None
-                img_elem = soup.find('img', class_='manga-mobile__image')
-                if img_elem:
-                    img_src = img_elem.get('src')
-                if not img_src:
-                    wrapper = soup.find('div', class_='manga__img')
-                    if wrapper:
-                        img = wrapper.find('img')
-                        if img:
-                            img_src = img.get('src')
-                if img_src and img_src.startswith('/'):
-                    img_src = f"{BASE_URL}{img_src}"
-
-                self.log(f"✅ Детали манги: {title}", force=True)
-                return {
-                    'slug': manga_slug,
-                    'title': title,
-                    'image': img_src,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                }
-
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                self.log(f"⚠️ Сеть при получении деталей: {e} (попытка {attempt+1}/{max_retries})", force=True)
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
+        """
+        Детали манги: сначала кэш (manga_cache), затем страница /manga/{slug}.
+        None — деталей нет (в т.ч. запомненный 404).
+        """
+        cached = self.manga_cache.get(manga_slug)
+        if cached is not MISS:
+            if cached is None:
+                self.log(f"⚠️ Манга {manga_slug} недоступна (404, из кэша)", logging.WARNING)
                 return None
+            self.log(f"✅ Детали манги: {cached['title']} (кэш)")
+            return {**cached, 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
-            except Exception as e:
-                self.log(f"❌ Ошибка деталей: {e}", force=True)
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                return None
+        info = self._fetch_manga_details(manga_slug)
+        # Заголовок, совпавший со slug, и отсутствие картинки — скорее сбой
+        # разбора, чем настоящие данные; такое не кэшируем
+        if info and (info['image'] or info['title'] != manga_slug):
+            self.manga_cache.put(manga_slug, info)
+        return info
 
-        return None
+    def _fetch_manga_details(self, manga_slug):
+        """
+        Страница /manga/{slug}. Повторы (сеть, 5xx, 429) — в исполнителе
+        запросов, в пределах MANGA_FETCH_DEADLINE; сбой разбора не повторяется.
+        """
+        url = f"{BASE_URL}/manga/{manga_slug}"
+        try:
+            with HTTP_FETCH_SECONDS.labels('manga').time():
+                response = self.executor.call(
+                    'manga', lambda timeout: self._get(url, timeout),
+                    deadline=self.config.MANGA_FETCH_DEADLINE, attempts=self.config.MANGA_FETCH_ATTEMPTS,
+                )
+        except CircuitOpenError as e:
+            self.log(f"⚡ Детали манги не запрошены: {e}", logging.WARNING)
+            return None
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            self.log(f"⚠️ Сеть при получении деталей: {e}", logging.WARNING)
+            return None
+
+        if response.status_code == 404:
+            # Повторять бессмысленно — запоминаем и не спрашиваем до истечения TTL
+            self.log(f"❌ Страница манги не найдена: {manga_slug}", logging.ERROR)
+            self.manga_cache.put_missing(manga_slug)
+            return None
+
+        if response.status_code != 200:
+            self.log(f"❌ Ошибка страницы манги: {response.status_code}", logging.ERROR)
+            return None
+
+        try:
+            page = self._extract_recorded('manga', self.manga_extractor, response, url) or {}
+        except Exception as e:
+            self.log(f"❌ Ошибка деталей: {e}", logging.ERROR)
+            return None
+        title = page.get('title') or manga_slug
+        img_src = page.get('image')
+        if img_src and img_src.startswith('/'):
+            img_src = f"{BASE_URL}{img_src}"
+
+        self.log(f"✅ Детали манги: {title}")
+        return {
+            'slug': manga_slug,
+            'title': title,
+            'image': img_src,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
 
     # ------------------------------------------------------------------
     # Трекинг опыта
@@ -409,29 +768,84 @@ class MangaBuffMonitor:
         if today != self.today:
             self.today = today
             self.exp_at_day_start = exp_current
-            self.log(f"📅 Новый день, сброс прироста. Старт: {exp_current}")
+            self.log(f"📅 Новый день, сброс прироста. Старт: {exp_current}", logging.DEBUG)
+            self.bus.publish(DayRollover(self.alliance_id, today.isoformat(), exp_current))
         if self.exp_at_day_start is None:
             self.exp_at_day_start = exp_current
         self.last_known_exp = exp_current
 
     def get_exp_gain_today(self):
+        # Ряд опыта переживает перезапуск и учитывает смену уровня
+        gain = self.exp_series.gain_today()
+        if gain is not None:
+            return gain
         if self.last_known_exp is None or self.exp_at_day_start is None:
             return None
         gain = self.last_known_exp - self.exp_at_day_start
         return gain if gain >= 0 else None
 
+    def _exp_fields(self):
+        """Прирост и темп на момент события — подпись по ним строит приёмник."""
+        return {
+            'exp_gain_today': self.get_exp_gain_today(),
+            'exp_stats': self.exp_series.summary(),
+        }
+
     # ------------------------------------------------------------------
-    # Определение изменений в данных альянса
+    # Общее состояние (кластерный режим)
     # ------------------------------------------------------------------
 
-    def _stats_changed(self, new_data: dict) -> bool:
-        """Вернёт True, если опыт или шанс изменились относительно last_page_data."""
-        if not self.last_page_data:
+    def export_state(self):
+        """Тайтл, последние данные страницы и учёт опыта — всё, что нужно другому узлу."""
+        return {
+            'current_manga': self.current_manga,
+            'current_manga_info': self.current_manga_info,
+            'last_page_data': self.last_page_data,
+            'today': self.today.isoformat(),
+            'exp_at_day_start': self.exp_at_day_start,
+            'last_known_exp': self.last_known_exp,
+        }
+
+    def restore_state(self, state):
+        self.current_manga = state.get('current_manga')
+        self.current_manga_info = state.get('current_manga_info')
+        self.last_page_data = state.get('last_page_data') or {}
+        if state.get('today'):
+            self.today = date.fromisoformat(state['today'])
+        self.exp_at_day_start = state.get('exp_at_day_start')
+        self.last_known_exp = state.get('last_known_exp')
+
+    def snapshot(self):
+        """Отдаёт состояние монитора и постов в снимок (файл пишет фоновый поток)."""
+        if self.snapshots:
+            self.snapshots.update(self.alliance_id, {
+                'monitor': self.export_state(),
+                'telegram': self.telegram.export_state(),
+            })
+
+    def _restore_snapshot(self):
+        saved = self.snapshots.get(self.alliance_id) if self.snapshots else None
+        if not saved:
             return False
-        for key in ('exp_current', 'exp_total', 'chance', 'level'):
-            if new_data.get(key) != self.last_page_data.get(key):
-                return True
-        return False
+        self.restore_state(saved.get('monitor') or {})
+        self.telegram.restore_state(saved.get('telegram') or {})
+        return bool(self.current_manga)
+
+    def next_poll_delay(self):
+        """Задержка до следующего опроса; в кластере — со сдвигом фазы узла."""
+        delay = self.scheduler.next_delay()
+        return self.cluster.align(delay) if self.cluster else delay
+
+    # ------------------------------------------------------------------
+    # Определение изменений в данных альянса
+    # ------------------------------------------------------------------
+
+    def _detect_changes(self, new_data: dict):
+        """
+        ChangeSet изменений статистики относительно last_page_data, если их
+        пора публиковать (changes.ChangeDetector), иначе None.
+        """
+        return self.changes.observe(self.last_page_data, new_data)
 
     # ------------------------------------------------------------------
     # История
@@ -439,24 +853,218 @@ class MangaBuffMonitor:
 
     def save_history(self, manga_info):
         try:
-            try:
-                with open(self.config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            except FileNotFoundError:
-                history = []
-            except json.JSONDecodeError:
-                history = []
+            store = open_history(
+                self.config.HISTORY_DB,
+                legacy_json=self.config.HISTORY_FILE,
+                keep_days=self.config.HISTORY_KEEP_DAYS,
+            )
+            store.append({**manga_info, 'alliance_id': self.alliance_id})
+            self.log("💾 История сохранена", logging.DEBUG)
+        except Exception as e:
+            self.log(f"⚠️ Ошибка истории: {e}", logging.WARNING)
 
-            history.append(manga_info)
-            if len(history) > 100:
-                history = history[-100:]
+    # ------------------------------------------------------------------
+    # Один шаг мониторинга
+    # ------------------------------------------------------------------
 
-            with open(self.config.HISTORY_FILE, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+    def announce_current(self):
+        """
+        Стартовое получение тайтла и рассылка. Возвращает page_data или None.
 
-            self.log(f"💾 История сохранена ({len(history)} записей)")
-        except Exception as e:
-            self.log(f"⚠️ Ошибка истории: {e}")
+        Если из снимка (или от узла кластера) известен тот же тайтл и его
+        посты, ничего не рассылается заново: подпись лишь обновляется, если
+        статистика успела измениться.
+        """
+        self.log("📚 Получаю данные альянса...", logging.DEBUG)
+        resumed = self._restore_snapshot()
+        if self.cluster:
+            resumed = self.cluster.pull(self) or resumed
+        page_data = self.get_alliance_page_data()
+
+        if page_data and page_data.get('slug'):
+            slug = page_data['slug']
+            previous = self.last_page_data
+            self._last_polled = page_data
+            self._update_exp_tracking(page_data.get('exp_current'))
+            self.exp_series.add(page_data)
+
+            self.log(
+                f"📚 Тайтл: {slug} | "
+                f"Опыт: {page_data.get('exp_current')}/{page_data.get('exp_total')} | "
+                f"Шанс: {page_data.get('chance')}%"
+            )
+
+            if (resumed and slug == self.current_manga and self.current_manga_info
+                    and self.telegram.active_message_ids):
+                self.log("♻️ Состояние восстановлено, продолжаю править текущий пост")
+                # Подпись могла устареть за время простоя — правим при любом изменении
+                deltas = self.changes.diff(previous, page_data) if previous else {}
+                self.last_page_data = page_data
+                if deltas:
+                    self.bus.publish(StatsChanged(
+                        self.alliance_id, slug, self.current_manga_info,
+                        page_data=page_data, previous=previous, deltas=deltas, reason='resume',
+                        **self._exp_fields(),
+                    ))
+            else:
+                previous_slug = self.current_manga if resumed else None
+                self.current_manga = slug
+                self.current_manga_info = None
+                self.last_page_data = page_data
+                if self.config.FAST_START:
+                    # Детали манги и пост — в фоне, опрос начинается сразу
+                    self._announcer = threading.Thread(
+                        target=self._announce_title, args=(slug, previous_slug, page_data),
+                        name=f"announce-{self.alliance_id}", daemon=True,
+                    )
+                    self._announcer.start()
+                else:
+                    self._announce_title(slug, previous_slug, page_data)
+
+            self.snapshot()
+            if self.cluster:
+                self.cluster.push(self)
+            return page_data
+
+        self.log("⚠️ Не удалось получить тайтл альянса", logging.WARNING)
+        self.bus.publish(Notice(self.alliance_id, text="⚠️ Не удалось получить тайтл альянса"))
+        return None
+
+    def _announce_title(self, slug, previous_slug, page_data):
+        """Стартовый пост: детали манги и TitleChanged, если тайтл за это время не сменился."""
+        manga_info = self.get_manga_details(slug)
+        with self._title_lock:
+            if self.current_manga != slug:
+                # Опрос уже заметил новый тайтл и разослал его сам
+                self.log(f"⏭️ Стартовый анонс {slug} устарел", logging.DEBUG)
+                return
+            self.current_manga_info = manga_info
+
+            if previous_slug and previous_slug != slug:
+                self.log(f"🔔 Тайтл сменился, пока монитор был остановлен: {previous_slug} → {slug}")
+                if manga_info:
+                    self.save_history(manga_info)
+            self.bus.publish(TitleChanged(
+                self.alliance_id, slug,
+                previous_slug=previous_slug, manga_info=manga_info, page_data=page_data,
+                startup=not previous_slug or previous_slug == slug,
+                **self._exp_fields(),
+            ))
+        startup.mark('announce')
+        if self._announcer is not None:
+            # Фоновый анонс: снимок и кластер — уже с деталями манги
+            self.log(f"📣 Стартовый пост готов через {startup.since_start() * 1000:.0f} мс от запуска")
+            self.snapshot()
+            if self.cluster:
+                self.cluster.push(self)
+
+    def check_once(self, check_count=0):
+        """
+        Один опрос страницы альянса: смена тайтла или тихое обновление подписи.
+        Сетевые ошибки (requests.RequestException) пробрасываются наверх.
+        """
+        if self.cluster:
+            # Изменение мог уже заметить другой узел
+            self.cluster.pull(self)
+        page_data = self.get_alliance_page_data()
+
+        if not page_data:
+            if self.last_fetch_error and self.last_fetch_error['kind'] == 'auth':
+                # Вход идёт в фоне: следующий опрос — сразу после него, без отсрочки
+                self.health.wait_ready(self.config.SESSION_LOGIN_WAIT)
+            elif self.last_fetch_error:
+                self.scheduler.on_error(
+                    self.last_fetch_error['kind'], self.last_fetch_error['retry_after']
+                )
+            else:
+                # Страница пришла, но без данных — не долбим её чаще обычного
+                self.scheduler.on_success(changed=False)
+            if check_count % 60 == 0 or check_count == 1:
+                self.log("⚠️ Нет данных альянса", logging.WARNING)
+            return None
+
+        previous = self.last_page_data
+
+        self._update_exp_tracking(page_data.get('exp_current'))
+        self.exp_series.add(page_data)
+        new_slug = page_data.get('slug')
+
+        with DETECT_SECONDS.time():
+            title_changed = bool(new_slug) and new_slug != self.current_manga
+            change_set = None if title_changed else self._detect_changes(page_data)
+        observed_at = self.last_fetch_at
+
+        # --- Смена тайтла ---
+        if title_changed:
+            self.log(f"🔔 СМЕНА ТАЙТЛА: {self.current_manga} → {new_slug}")
+
+            manga_info = self.get_manga_details(new_slug)
+            self.changes.reset()
+
+            with self._title_lock:
+                self.current_manga_info = manga_info
+                self.bus.publish(TitleChanged(
+                    self.alliance_id, new_slug,
+                    previous_slug=self.current_manga, manga_info=manga_info, page_data=page_data,
+                    observed_at=observed_at, **self._exp_fields(),
+                ))
+                self.current_manga = new_slug
+                self.last_page_data = page_data
+            if manga_info:
+                self.save_history(manga_info)
+                self.log("✅ Уведомление поставлено в очередь")
+
+        # --- Значимо изменились опыт/шанс/уровень → тихое редактирование ---
+        elif change_set and self.current_manga_info:
+            self.last_page_data = page_data
+            self.bus.publish(StatsChanged(
+                self.alliance_id, self.current_manga, self.current_manga_info,
+                page_data=page_data, previous=previous,
+                deltas=change_set.deltas, reason=change_set.reason,
+                observed_at=observed_at, **self._exp_fields(),
+            ))
+
+        # Планировщику важна любая активность, а не только опубликованная
+        changed = any(
+            page_data.get(key) != self._last_polled.get(key)
+            for key in ('slug', 'exp_current', 'exp_total', 'chance', 'level')
+        )
+        self._last_polled = page_data
+        self._schedule_after_success(changed, page_data.get('chance'))
+        self.snapshot()
+        if self.cluster:
+            self.cluster.push(self)
+        if startup.mark('first_check'):
+            self.log(f"🚀 Старт: {startup.report()}")
+        return page_data
+
+    def watch_auth(self):
+        """
+        Сообщает о смене health.lost. Опрос при этом не останавливается:
+        вход повторяется в фоне, и после него мониторинг продолжится сам.
+        """
+        lost = self.health.lost
+        if lost == self._auth_lost_reported:
+            return
+        self._auth_lost_reported = lost
+        if lost:
+            self.log("❌ Переавторизация не удаётся, вход повторяется в фоне", logging.ERROR)
+            self.bus.publish(AuthLost(self.alliance_id, reason="вход отклонён", fatal=False))
+        else:
+            self.log("✅ Авторизация восстановлена")
+            self.bus.publish(Notice(self.alliance_id, text="✅ Авторизация восстановлена, мониторинг продолжается"))
+
+    def _telegram_status(self):
+        st = self.telegram.stats()
+        p50 = f"{st['latency_p50']:.2f} с" if st['latency_p50'] is not None else "—"
+        return f"TG очередь {st['queue_depth']}, p50 {p50}"
+
+    def _schedule_after_success(self, changed, chance):
+        before = self.scheduler.interval
+        self.scheduler.on_success(changed, chance)
+        after = self.scheduler.interval
+        if after != before:
+            self.log(f"⏱️ Интервал {before:.1f} → {after:.1f} с: {', '.join(self.scheduler.reasons)}", logging.DEBUG)
 
     # ------------------------------------------------------------------
     # Основной цикл
@@ -467,40 +1075,18 @@ class MangaBuffMonitor:
             self.log("🔧 Проверка конфигурации...")
             self.config.validate()
 
-            if not self.login():
-                self.log("❌ Не удалось авторизоваться")
+            if not self.ensure_session():
+                self.log("❌ Не удалось авторизоваться", logging.ERROR)
                 return
+            startup.mark('session')
+            self.health.start()
 
-            self.log("📚 Получаю данные альянса...")
-            page_data = self.get_alliance_page_data()
-
-            if page_data and page_data.get('slug'):
-                self.current_manga = page_data['slug']
-                self.last_page_data = page_data
-                self._update_exp_tracking(page_data.get('exp_current'))
-
-                self.log(
-                    f"📚 Тайтл: {self.current_manga} | "
-                    f"Опыт: {page_data.get('exp_current')}/{page_data.get('exp_total')} | "
-                    f"Шанс: {page_data.get('chance')}%"
-                )
-
-                manga_info = self.get_manga_details(self.current_manga)
-                self.current_manga_info = manga_info
-
-                if manga_info:
-                    caption = self.telegram.format_manga_caption(
-                        manga_info, page_data, self.get_exp_gain_today(), is_startup=True
-                    )
-                    if manga_info['image']:
-                        self.telegram.send_photo_to_all_topics(manga_info['image'], caption)
-                    else:
-                        self.telegram.send_message_to_all_topics(caption)
-            else:
-                self.log("⚠️ Не удалось получить тайтл альянса")
-                self.telegram.send_message_to_all_topics("⚠️ Не удалось получить тайтл альянса")
+            self.announce_current()
 
-            self.log(f"👀 Интервал: {self.config.CHECK_INTERVAL} сек | Ctrl+C для остановки", force=True)
+            self.log(
+                f"👀 Интервал: {self.scheduler.min_interval:g}–{self.scheduler.max_interval:g} сек "
+                f"(адаптивный) | Ctrl+C для остановки"
+            )
 
             check_count = 0
             while True:
@@ -508,92 +1094,65 @@ class MangaBuffMonitor:
                     check_count += 1
 
                     if check_count % 60 == 0:
-                        self.log(f"🔍 #{check_count} тайтл: {self.current_manga}", force=True)
+                        self.log(
+                            f"🔍 #{check_count} тайтл: {self.current_manga} | "
+                            f"разобрано {self.page_stats['parsed']}/{self.page_stats['polls']} | "
+                            f"интервал {self.scheduler.describe()} | "
+                            f"{self._telegram_status()}"
+                        )
                     else:
-                        print(f"\r🔍 Проверка #{check_count}... ", end='', flush=True)
-
-                    page_data = self.get_alliance_page_data()
-
-                    if page_data:
-                        self._update_exp_tracking(page_data.get('exp_current'))
-                        new_slug = page_data.get('slug')
-
-                        # --- Смена тайтла ---
-                        if new_slug and new_slug != self.current_manga:
-                            print()
-                            self.log(f"🔔 СМЕНА ТАЙТЛА: {self.current_manga} → {new_slug}", force=True)
-
-                            manga_info = self.get_manga_details(new_slug)
-                            self.current_manga_info = manga_info
-
-                            if manga_info:
-                                caption = self.telegram.format_manga_caption(
-                                    manga_info, page_data, self.get_exp_gain_today(), is_startup=False
-                                )
-                                if manga_info['image']:
-                                    self.telegram.send_photo_to_all_topics(manga_info['image'], caption)
-                                else:
-                                    self.telegram.send_message_to_all_topics(caption)
-
-                                self.save_history(manga_info)
-                                self.log("✅ Уведомление отправлено", force=True)
-                            else:
-                                self.telegram.send_message_to_all_topics(
-                                    f"🔔 <b>Смена тайтла!</b>\n\n{new_slug}\n(детали недоступны)"
-                                )
-
-                            self.current_manga = new_slug
-                            self.last_page_data = page_data
-
-                        # --- Изменились опыт/шанс → тихое редактирование ---
-                        elif self._stats_changed(page_data) and self.current_manga_info:
-                            self.last_page_data = page_data
-                            caption = self.telegram.format_manga_caption(
-                                self.current_manga_info,
-                                page_data,
-                                self.get_exp_gain_today(),
-                                is_startup=False,
-                            )
-                            self.telegram.update_caption_in_all_topics(caption)
-
-                        else:
-                            # Ничего не изменилось
-                            pass
+                        self.progress(f"🔍 Проверка #{check_count}... ")
 
-                    else:
-                        if check_count % 60 == 0 or check_count == 1:
-                            self.log("⚠️ Нет данных альянса", force=True)
+                    self.check_once(check_count)
+                    self.watch_auth()
 
-                    time.sleep(self.config.CHECK_INTERVAL)
+                    time.sleep(self.next_poll_delay())
 
                 except KeyboardInterrupt:
-                    print()
                     self.log("⏹️ Остановка...")
-                    self.telegram.send_message_to_all_topics("⏹️ Мониторинг остановлен")
+                    self.bus.publish(MonitorStopped(self.alliance_id))
                     break
 
                 except requests.exceptions.RequestException as e:
-                    self.log(f"⚠️ Ошибка сети: {e}")
-                    time.sleep(30)
-                    self.log("🔐 Переавторизация...")
-                    if not self.login():
-                        self.log("❌ Переавторизация не удалась")
-                        self.telegram.send_message_to_all_topics("❌ Ошибка сети. Мониторинг остановлен.")
-                        break
+                    # Сеть — не повод входить заново: сессию проверяет SessionHealth
+                    self.log(f"⚠️ Ошибка сети: {e}", logging.WARNING)
+                    self.scheduler.on_error('network')
+                    time.sleep(self.scheduler.next_delay())
 
                 except Exception as e:
-                    self.log(f"⚠️ Непредвиденная ошибка: {e}")
+                    self.log(f"⚠️ Непредвиденная ошибка: {e}", logging.WARNING)
                     import traceback
-                    self.log(traceback.format_exc())
-                    time.sleep(5)
+                    self.log(traceback.format_exc(), logging.ERROR)
+                    self.scheduler.on_error('exception')
+                    time.sleep(self.scheduler.next_delay())
 
         except ValueError as e:
-            self.log(f"❌ Конфигурация: {e}")
+            self.log(f"❌ Конфигурация: {e}", logging.ERROR)
 
         except Exception as e:
-            self.log(f"❌ Критическая ошибка: {e}")
+            self.log(f"❌ Критическая ошибка: {e}", logging.ERROR)
             import traceback
-            self.log(traceback.format_exc())
+            self.log(traceback.format_exc(), logging.ERROR)
 
         finally:
-            self.log("✅ Мониторинг завершён")
\ No newline at end of file
+            self.health.close()
+            self.save_session()
+            self.exp_series.close()
+            self.bus.flush()
+            if not self.telegram.flush():
+                self.log("⚠️ Не все уведомления доставлены до выхода", logging.WARNING)
+            self.bus.close()
+            if self.snapshots:
+                # message_id последних постов — уже после доставки
+                self.snapshot()
+                self.snapshots.close()
+            if self.archive:
+                self.archive.close()
+            report = self.sources.report()
+            if report:
+                self.log(f"📊 Источники: {report}")
+            report = self.executor.report()
+            if report:
+                self.log(f"📊 Запросы: {report}")
+            self.executor.close()
+            self.log("✅ Мониторинг завершён")
@@ -0,0 +1,176 @@
+"""
+Архив сырых страниц MangaBuff для офлайн-проверки парсеров.
+
+Каждая разобранная страница (альянс — только когда изменилась, манга —
+при каждом запросе) пишется вместе с тем, что из неё извлёк бэкенд, или
+с текстом ошибки разбора. bench/replay_archive.py прогоняет по архиву
+любой экстрактор и сверяет результат с записанным.
+
+Формат: сегменты pages-<время>-<pid>.jsonl.gz в PAGE_ARCHIVE_DIR, строка
+JSON на страницу:
+  {"format": 1, "schema": <extractors.SCHEMA_VERSION>, "ts", "kind",
+   "url", "status", "extractor", "record", "error", "html"}
+Пачка строк дописывается отдельным gzip-членом, поэтому оборванная
+последняя запись при падении процесса не портит остальные. Сегмент
+закрывается по размеру, хранятся последние max_files.
+
+Опрос только кладёт запись в ограниченную очередь; сжатие и диск — в
+фоновом потоке. Переполнение очереди не тормозит опрос, а отбрасывает
+образец (метрика page_archive_pages_total{result="dropped"}).
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+from extractors import SCHEMA_VERSION
+from logsetup import get_logger
+from metrics import ARCHIVE_PAGES_TOTAL
+
+log = get_logger('archive')
+
+ARCHIVE_FORMAT = 1
+SEGMENT_GLOB = 'pages-*.jsonl.gz'
+
+
+class PageArchive:
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024, max_files=20,
+                 queue_size=1000, flush_interval=5.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._path = None
+        self._stop = threading.Event()
+        self.stats = {'written': 0, 'dropped': 0, 'segments': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="page-archive", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, url, response, extractor, record, error=None, html=None):
+        """
+        Ставит образец в очередь на запись; не блокирует.
+        html — разобранный текст, если это не весь response.text (потоковое чтение).
+        """
+        entry = {
+            'format': ARCHIVE_FORMAT,
+            'schema': SCHEMA_VERSION,
+            'ts': round(time.time(), 3),
+            'kind': kind,
+            'url': url,
+            'status': response.status_code,
+            'extractor': extractor,
+            'record': record,
+            'error': error,
+            'html': response.text if html is None else html,
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            ARCHIVE_PAGES_TOTAL.labels(kind, 'dropped').inc()
+
+    # ------------------------------------------------------------------
+    # Фоновая запись
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._write_pending()
+        self._write_pending()
+
+    def _write_pending(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        data = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in batch).encode('utf-8')
+        try:
+            path = self._segment()
+            with open(path, 'ab') as f:
+                f.write(gzip.compress(data))
+        except OSError as e:
+            log.warning(f"⚠️ Архив страниц: не записано {len(batch)} образцов: {e}")
+            for entry in batch:
+                ARCHIVE_PAGES_TOTAL.labels(entry['kind'], 'error').inc()
+            return
+        self.stats['written'] += len(batch)
+        for entry in batch:
+            ARCHIVE_PAGES_TOTAL.labels(entry['kind'], 'written').inc()
+
+    def _segment(self):
+        """Текущий сегмент; при превышении max_bytes — новый, лишние старые удаляются."""
+        if self._path is not None and os.path.exists(self._path) \
+                and os.path.getsize(self._path) < self.max_bytes:
+            return self._path
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._path = os.path.join(self.directory, f"pages-{stamp}-{os.getpid()}.jsonl.gz")
+        self.stats['segments'] += 1
+        for old in segments(self.directory)[:-max(self.max_files - 1, 0) or None]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        return self._path
+
+    def close(self):
+        """Дописывает очередь и останавливает поток."""
+        self._stop.set()
+        self._thread.join(10)
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+def segments(directory):
+    """Сегменты архива от старых к новым."""
+    return sorted(glob.glob(os.path.join(directory, SEGMENT_GLOB)), key=os.path.getmtime)
+
+
+def read_archive(paths):
+    """
+    Записи архива по каталогам и/или файлам сегментов, по порядку.
+    Оборванный хвост сегмента (процесс упал при записи) пропускается.
+    """
+    for path in paths:
+        files = segments(path) if os.path.isdir(path) else [path]
+        for name in files:
+            try:
+                with gzip.open(name, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+                log.warning(f"⚠️ {name}: повреждённый хвост ({e}), остаток пропущен")
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(config):
+    """Один архив на процесс для всех мониторов; None — архив выключен."""
+    directory = config.PAGE_ARCHIVE_DIR
+    if not directory:
+        return None
+    with _archives_lock:
+        if directory not in _archives:
+            _archives[directory] = PageArchive(
+                directory,
+                max_bytes=config.PAGE_ARCHIVE_MAX_BYTES,
+                max_files=config.PAGE_ARCHIVE_FILES,
+            )
+            atexit.register(_archives[directory].close)
+        return _archives[directory]
@@ -0,0 +1,113 @@
+"""
+Кэш file_id постеров Telegram по slug манги.
+
+После первой отправки фото по URL Telegram возвращает file_id — его
+можно отправлять в другие темы и при повторном появлении тайтла,
+не заставляя Telegram заново скачивать картинку. file_id действителен
+только для того бота, который его получил, поэтому файл кэша
+привязан к id бота.
+
+put() только меняет память; файл пишет фоновый поток не чаще раза
+в interval секунд, последние изменения — close().
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from logsetup import get_logger
+
+log = get_logger('poster_cache')
+
+
+class PosterCache:
+    def __init__(self, path, max_size=500, bot_id=None, interval=5.0):
+        self.path = path
+        self.max_size = max_size
+        self.bot_id = bot_id
+        self.interval = interval
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._load()
+        self._thread = None
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="poster-cache-writer", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return
+        if data.get('bot_id') != self.bot_id:
+            return
+        for slug, file_id in data.get('items', []):
+            self._items[slug] = file_id
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """Пишет файл, если с прошлой записи кэш менялся (вне блокировки)."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return False
+            data = {'bot_id': self.bot_id, 'items': list(self._items.items())}
+            self._dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            log.warning(f"⚠️ Кэш постеров не сохранён: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def close(self):
+        """Останавливает поток записи и дописывает последние изменения."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        self.save()
+
+    def get(self, slug):
+        if not slug:
+            return None
+        with self._lock:
+            file_id = self._items.get(slug)
+            if file_id is not None:
+                self._items.move_to_end(slug)
+            return file_id
+
+    def put(self, slug, file_id):
+        if not slug or not file_id:
+            return
+        with self._lock:
+            if self._items.get(slug) == file_id:
+                self._items.move_to_end(slug)
+                return
+            self._items[slug] = file_id
+            self._items.move_to_end(slug)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._dirty = True
+
+    def invalidate(self, slug):
+        with self._lock:
+            if self._items.pop(slug, None) is not None:
+                self._dirty = True
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,200 @@
+"""
+Адаптивный интервал опроса страницы альянса.
+
+  - данные меняются или шанс смены высокий → опрашиваем чаще (до min)
+  - страница долго не меняется → интервал плавно растёт (до max)
+  - средний промежуток между изменениями ограничивает интервал сверху
+  - 5xx/429/таймауты → экспоненциальная задержка с джиттером,
+    Retry-After от сервера — нижняя граница задержки
+
+Причины последней корректировки доступны в reasons, текущее состояние
+строкой — describe() (идёт в периодическую строку статуса монитора).
+С name (id альянса) интервал и задержка после ошибок экспортируются
+в метрики, корректировки считаются по коду причины.
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from config import Config
+from metrics import POLL_BACKOFF_SECONDS, POLL_INTERVAL_ADJUSTMENTS_TOTAL, POLL_INTERVAL_SECONDS
+
+# Retry-After соблюдается и сверх backoff_max; потолок — только от заведомо
+# ошибочных значений (дата через год и т.п.)
+RETRY_AFTER_MAX = 3600.0
+
+
+def parse_retry_after(value):
+    """Retry-After: секунды или HTTP-дата → секунды (float) или None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _parse_chance(chance):
+    if chance is None:
+        return None
+    try:
+        return float(str(chance).replace(',', '.').strip().rstrip('%'))
+    except ValueError:
+        return None
+
+
+class AdaptiveScheduler:
+    def __init__(
+        self,
+        min_interval=None,
+        max_interval=None,
+        backoff_max=None,
+        jitter=None,
+        idle_after=None,
+        relax_factor=None,
+        chance_fast=None,
+        name=None,
+    ):
+        cfg = Config
+        self.name = name
+        self.min_interval = float(min_interval if min_interval is not None else cfg.POLL_MIN_INTERVAL)
+        self.max_interval = float(max_interval if max_interval is not None else cfg.POLL_MAX_INTERVAL)
+        self.max_interval = max(self.max_interval, self.min_interval)
+        self.backoff_max = float(backoff_max if backoff_max is not None else cfg.POLL_BACKOFF_MAX)
+        self.jitter = float(jitter if jitter is not None else cfg.POLL_JITTER)
+        self.idle_after = int(idle_after if idle_after is not None else cfg.POLL_IDLE_AFTER)
+        self.relax_factor = float(relax_factor if relax_factor is not None else cfg.POLL_RELAX_FACTOR)
+        self.chance_fast = float(chance_fast if chance_fast is not None else cfg.POLL_CHANCE_FAST)
+
+        self.interval = self.min_interval   # эффективный интервал без джиттера
+        self.reasons = ["старт"]
+        self.idle_streak = 0
+        self.error_streak = 0
+        self.last_delay = self.min_interval
+
+        # EWMA промежутка между изменениями (сек)
+        self.change_gap = None
+        self._last_change_at = None
+        self._backoff_delay = None
+        if name is not None:
+            POLL_INTERVAL_SECONDS.labels(name).set(self.interval)
+            POLL_BACKOFF_SECONDS.labels(name).set(0)
+
+    # ------------------------------------------------------------------
+    # Результаты опросов
+    # ------------------------------------------------------------------
+
+    def on_success(self, changed, chance=None):
+        """Успешный опрос. changed — изменились ли слаг/опыт/шанс."""
+        codes = []
+        reasons = ["ошибки прекратились"] if self.error_streak else []
+        self.error_streak = 0
+        if self._backoff_delay is not None:
+            self._backoff_delay = None
+            self._count(['recovered'])
+            if self.name is not None:
+                POLL_BACKOFF_SECONDS.labels(self.name).set(0)
+        now = time.monotonic()
+
+        if changed:
+            if self._last_change_at is not None:
+                gap = now - self._last_change_at
+                self.change_gap = gap if self.change_gap is None else 0.7 * self.change_gap + 0.3 * gap
+            self._last_change_at = now
+            self.idle_streak = 0
+            interval = self.min_interval
+            codes.append('changed')
+            reasons.append("изменились данные")
+        else:
+            self.idle_streak += 1
+            interval = self.interval
+            if self.idle_streak >= self.idle_after:
+                interval = min(interval * self.relax_factor, self.max_interval)
+                self.idle_streak = 0
+                codes.append('idle')
+                reasons.append(f"нет изменений {self.idle_after} опросов")
+
+        # Изменения идут часто — не даём интервалу уйти выше четверти
+        # среднего промежутка между ними
+        if self.change_gap is not None:
+            ceiling = max(self.min_interval, self.change_gap / 4)
+            if interval > ceiling:
+                interval = ceiling
+                codes.append('change_rate')
+                reasons.append(f"изменения в среднем раз в {self.change_gap:.0f} с")
+
+        chance_value = _parse_chance(chance)
+        if chance_value is not None and chance_value >= self.chance_fast and interval > self.min_interval:
+            interval = self.min_interval
+            codes.append('chance')
+            reasons.append(f"шанс смены {chance_value:g}%")
+
+        self._set_interval(interval, reasons, codes)
+
+    def on_error(self, kind, retry_after=None):
+        """
+        Неудачный опрос: kind — 'http_503', 'timeout', 'network' и т.п.
+        retry_after — секунды из заголовка Retry-After.
+        """
+        self.error_streak += 1
+        base = min(self.min_interval * (2 ** self.error_streak), self.backoff_max)
+        # "Equal jitter": половина фиксирована, половина случайна
+        delay = base / 2 + random.uniform(0, base / 2)
+        code = 'backoff'
+        reasons = [f"{kind}: ошибка #{self.error_streak}, задержка {delay:.1f} с"]
+        if retry_after is not None and retry_after > delay:
+            delay = min(retry_after, RETRY_AFTER_MAX)
+            code = 'retry_after'
+            reasons = [f"{kind}: Retry-After {retry_after:.0f} с"]
+        self._backoff_delay = delay
+        self.reasons = reasons
+        self._count([code])
+        if self.name is not None:
+            POLL_BACKOFF_SECONDS.labels(self.name).set(delay)
+
+    # ------------------------------------------------------------------
+    # Расписание
+    # ------------------------------------------------------------------
+
+    def next_delay(self):
+        """Сколько ждать до следующего опроса (с джиттером)."""
+        if self._backoff_delay is not None:
+            delay = self._backoff_delay
+        else:
+            spread = self.interval * self.jitter
+            delay = max(0.0, self.interval + random.uniform(-spread, spread))
+        self.last_delay = delay
+        return delay
+
+    def describe(self):
+        """'3.0 с (изменились данные)' или 'пауза 12.4 с после ошибок (http_503: …)'."""
+        reasons = ', '.join(self.reasons)
+        if self._backoff_delay is not None:
+            return f"пауза {self._backoff_delay:.1f} с после ошибок ({reasons})"
+        return f"{self.interval:.1f} с ({reasons})"
+
+    def _count(self, codes):
+        if self.name is None:
+            return
+        for code in codes:
+            POLL_INTERVAL_ADJUSTMENTS_TOTAL.labels(self.name, code).inc()
+
+    def _set_interval(self, interval, reasons, codes=()):
+        if reasons:
+            self.reasons = reasons
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        if interval != self.interval:
+            self._count(codes)
+            if self.name is not None:
+                POLL_INTERVAL_SECONDS.labels(self.name).set(interval)
+        self.interval = interval
@@ -0,0 +1,228 @@
+"""
+Здоровье авторизованной сессии MangaBuff.
+
+Протухшая сессия не бросает исключений: сайт отвечает редиректом на
+/login, 401/419 (CSRF-токен не совпал) или обычной страницей с
+window.isAuth = 0. expiry_reason() распознаёт это по каждому ответу.
+
+SessionHealth держит сессию живой без пауз в опросе:
+  - фоновый поток раз в refresh_interval проверяет сессию одним GET /
+    и обновляет CSRF/XSRF-токены (_probe_session + _apply_ajax_tokens);
+  - при потере авторизации вход выполняется в фоне на отдельной чистой
+    сессии, а затем куки и токены одним шагом подменяются в рабочей.
+    Опрос всё это время продолжается и ждёт не дольше самого входа.
+
+Недоступность сайта (сеть, 5xx, 429, техработы) — не потеря сессии:
+проверка и вход возвращают None, и такие попытки не засчитываются.
+lost ставится после attempts явных отказов во входе подряд; вход при
+этом не прекращается, а повторяется реже (до retry_max секунд).
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from logsetup import get_logger
+from metrics import RELOGINS_TOTAL, SESSION_EXPIRIES_TOTAL
+from session_store import SESSION_HEADERS
+
+log = get_logger('session')
+
+_AUTH_FLAG_RE = re.compile(rb'window\.isAuth\s*=\s*(\d)')
+
+
+def _is_login_url(url):
+    return bool(url) and urlsplit(url).path.rstrip('/') == '/login'
+
+
+def auth_flag(content):
+    """window.isAuth со страницы: 1, 0 или None (маркера нет)."""
+    m = _AUTH_FLAG_RE.search(content)
+    return int(m.group(1)) if m else None
+
+
+def expiry_reason(response, content=None):
+    """
+    Причина, по которой ответ говорит о потерянной сессии, или None.
+    content — уже прочитанная часть тела (потоковое чтение), иначе response.content.
+    """
+    if response.status_code in (401, 419):
+        # 419 — Laravel: CSRF-токен не совпал / страница устарела
+        return f"http_{response.status_code}"
+    if _is_login_url(response.url) or any(_is_login_url(r.headers.get('Location')) for r in response.history):
+        return 'redirect'
+    if response.status_code in (301, 302, 303) and _is_login_url(response.headers.get('Location')):
+        return 'redirect'
+    if response.status_code == 200 and 'html' in response.headers.get('Content-Type', 'text/html'):
+        if auth_flag(response.content if content is None else content) == 0:
+            return 'not_auth'
+    return None
+
+
+class SessionHealth:
+    """
+    session     — рабочая requests.Session (общая для опросов)
+    login       — login(session): полный вход на переданной сессии; True — вошли,
+                  False — отказ, None — сайт недоступен
+    probe       — probe(session) → bool: авторизованы ли куки, с обновлением токенов;
+                  None — проверить не удалось (сеть, 5xx, техработы)
+    new_session — фабрика чистой сессии для входа в фоне
+    on_swapped  — вызывается после подмены (например, сохранить сессию на диск)
+    """
+
+    def __init__(self, session, login, probe, new_session, on_swapped=None,
+                 refresh_interval=600.0, attempts=3, request_timeout=15, retry_max=300.0):
+        self.session = session
+        self._login = login
+        self._probe = probe
+        self._new_session = new_session
+        self._on_swapped = on_swapped
+        self.refresh_interval = refresh_interval
+        self.attempts = attempts
+        self.request_timeout = request_timeout
+        self.retry_max = retry_max
+
+        self.generation = 0         # растёт с каждой подменой сессии
+        self.lost = False           # сайт отказал во входе attempts раз подряд (вход повторяется)
+        self._ready = threading.Event()
+        self._ready.set()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._swapping = False
+        self._relogin = None
+        self._stop = threading.Event()
+        self._refresher = None
+
+    # ------------------------------------------------------------------
+    # Запросы на рабочей сессии
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def request(self):
+        """
+        Обёртка запроса рабочей сессией: подмена куки ждёт, пока запросы
+        в полёте завершатся, иначе их Set-Cookie попали бы в новую банку.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._swapping)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def check(self, response, content=None):
+        """Проверяет ответ; при потере сессии запускает вход в фоне. Возвращает причину."""
+        reason = expiry_reason(response, content)
+        if reason:
+            self.report_expired(reason)
+        return reason
+
+    def report_expired(self, reason):
+        SESSION_EXPIRIES_TOTAL.labels(reason).inc()
+        with self._cond:
+            if self._relogin is not None and self._relogin.is_alive():
+                return
+            self._ready.clear()
+            self._relogin = threading.Thread(
+                target=self._relogin_loop, args=(reason,), name="session-relogin", daemon=True
+            )
+            self._relogin.start()
+
+    def wait_ready(self, timeout=None):
+        """Ждёт окончания фонового входа. True — сессия (снова) рабочая."""
+        self._ready.wait(timeout)
+        return self._ready.is_set()
+
+    @property
+    def relogging(self):
+        return not self._ready.is_set()
+
+    # ------------------------------------------------------------------
+    # Фоновый вход и подмена
+    # ------------------------------------------------------------------
+
+    def _relogin_loop(self, reason):
+        log.warning(f"🔐 Сессия потеряна ({reason}), вход в фоне...")
+        try:
+            attempt = 0
+            rejected = 0
+            while not self._stop.is_set():
+                attempt += 1
+                fresh = self._new_session()
+                # Нужны только куки и заголовки fresh — сама сессия с пулом
+                # соединений закрывается при любом исходе
+                try:
+                    ok = self._login(fresh)
+                    if ok:
+                        self._swap(fresh)
+                except Exception as e:
+                    log.error(f"❌ Ошибка входа: {e}")
+                    ok = None
+                finally:
+                    fresh.close()
+                if ok:
+                    RELOGINS_TOTAL.labels('background_ok').inc()
+                    if self.lost:
+                        log.info("✅ Вход снова удался")
+                    self.lost = False
+                    log.info(f"✅ Сессия восстановлена (попытка {attempt})")
+                    return
+                if ok is None:
+                    RELOGINS_TOTAL.labels('background_unavailable').inc()
+                else:
+                    RELOGINS_TOTAL.labels('background_failed').inc()
+                    rejected += 1
+                    if rejected >= self.attempts and not self.lost:
+                        self.lost = True
+                        log.error(f"❌ Вход отклонён {rejected} раз подряд, повторяю реже")
+                self._stop.wait(min(2 ** attempt, self.retry_max))
+        finally:
+            self._ready.set()
+
+    def _swap(self, fresh):
+        with self._cond:
+            self._swapping = True
+            self._cond.wait_for(lambda: self._in_flight == 0, self.request_timeout)
+            try:
+                self.session.cookies = fresh.cookies
+                for name in SESSION_HEADERS:
+                    if name in fresh.headers:
+                        self.session.headers[name] = fresh.headers[name]
+                self.generation += 1
+            finally:
+                self._swapping = False
+                self._cond.notify_all()
+        if self._on_swapped is not None:
+            self._on_swapped()
+
+    # ------------------------------------------------------------------
+    # Плановое обновление токенов
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.refresh_interval <= 0 or self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="session-refresh", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            if self.relogging:
+                continue
+            try:
+                with self.request():
+                    ok = self._probe(self.session)
+            except Exception as e:
+                log.warning(f"⚠️ Проверка сессии: {e}")
+                continue
+            if ok:
+                RELOGINS_TOTAL.labels('refresh_ok').inc()
+            elif ok is not None:
+                self.report_expired('probe')
+
+    def close(self):
+        self._stop.set()
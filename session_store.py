@@ -0,0 +1,93 @@
+"""
+Сохранение авторизованной сессии MangaBuff на диск.
+
+Хранит куки и AJAX-заголовки (X-CSRF-TOKEN, X-XSRF-TOKEN,
+X-Requested-With), чтобы после перезапуска не проходить вход заново,
+а проверить сессию одним запросом.
+"""
+
+import json
+import os
+import time
+
+from requests.cookies import create_cookie
+
+# Заголовки, которые login() выставляет сессии после входа
+SESSION_HEADERS = ("X-CSRF-TOKEN", "X-XSRF-TOKEN", "X-Requested-With")
+
+SESSION_FORMAT = 1
+
+
+def save_session(session, path, account=None):
+    """Атомарно пишет куки и токены сессии в path (права 0600)."""
+    cookies = [
+        {
+            "name": c.name,
+            "value": c.value,
+            "domain": c.domain,
+            "path": c.path,
+            "expires": c.expires,
+            "secure": c.secure,
+            "rest": {"HttpOnly": None} if c.has_nonstandard_attr("HttpOnly") else {},
+        }
+        for c in session.cookies
+    ]
+    data = {
+        "format": SESSION_FORMAT,
+        "account": account,
+        "saved_at": int(time.time()),
+        "cookies": cookies,
+        "headers": {h: session.headers[h] for h in SESSION_HEADERS if h in session.headers},
+    }
+
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_session(session, path, account=None):
+    """
+    Загружает сохранённую сессию в session. Вернёт False, если файла нет,
+    он повреждён, принадлежит другому аккаунту или все куки истекли.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return False
+
+    if data.get("format") != SESSION_FORMAT or data.get("account") != account:
+        return False
+
+    now = time.time()
+    loaded = 0
+    for c in data.get("cookies", []):
+        if c.get("expires") is not None and c["expires"] < now:
+            continue
+        session.cookies.set_cookie(create_cookie(
+            c["name"],
+            c["value"],
+            domain=c.get("domain", ""),
+            path=c.get("path", "/"),
+            expires=c.get("expires"),
+            secure=c.get("secure", False),
+            rest=c.get("rest") or {},
+        ))
+        loaded += 1
+
+    if not loaded:
+        return False
+
+    session.headers.update(data.get("headers", {}))
+    return True
+
+
+def clear_session(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,356 @@
+"""
+Источники данных альянса для опроса.
+
+  html — страница /alliances/{id}/boost: условный GET, хэш фрагмента,
+         потоковое чтение, экстракторы (MangaBuffMonitor._fetch_html_page_data)
+  json — XHR-эндпоинт сайта. Запрос идёт с теми же AJAX-заголовками,
+         что ставит login() (X-Requested-With, X-CSRF-TOKEN), ответ —
+         небольшой JSON вместо страницы целиком и без разбора HTML
+
+DATA_SOURCE=html — только страница (по умолчанию). DATA_SOURCE=auto —
+поиск JSON-эндпоинта: кандидаты из DATA_SOURCE_JSON_URLS и адреса
+чтения данных альянса (/alliances/{id}/data, /api/.../alliances/{id} —
+см. _READ_ONLY_PATH), найденные в последней разобранной странице (при
+STREAM_FETCH — в её прочитанной части). Остальные ссылки альянса
+(вступить, выйти и т.п.) не запрашиваются. Кандидат принимается, только
+если его JSON даёт все поля альянса и они совпадают с данными этого же
+опроса. Поиск идёт в фоновом потоке с общим бюджетом времени на все
+кандидаты, опрос его не ждёт: найденный источник подключается со
+следующего тика. Если JSON перестал
+отвечать в ожидаемом виде, опрос в тот же тик уходит на страницу, а
+поиск повторяется через DATA_SOURCE_RETRY секунд. Сеть, 5xx, 429 и
+потеря сессии — не повод менять источник: страница упала бы так же.
+
+Для каждого источника считаются задержка и размер ответа;
+SourceSet.report() — сравнение для журнала.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import requests
+
+from executor import CircuitOpenError
+from extractors import ALLIANCE_FIELDS, level_from_text, parse_number
+from logsetup import get_logger
+from metrics import HTTP_FETCH_SECONDS, SOURCE_FALLBACKS_TOTAL, SOURCE_FETCH_SECONDS
+
+log = get_logger('sources')
+
+MODES = ('html', 'auto')
+# Сколько последних опросов хранится для p50/p95 задержки
+STATS_WINDOW = 200
+JSON_HEADERS = {'Accept': 'application/json, text/plain, */*'}
+
+# Поле альянса → ключи JSON, по убыванию приоритета
+_JSON_KEYS = {
+    'level': ('level', 'lvl'),
+    'exp_current': ('exp_current', 'current_exp', 'exp', 'experience'),
+    'exp_total': ('exp_total', 'total_exp', 'next_level_exp', 'max_exp', 'exp_max'),
+    'chance': ('chance_change_manga', 'change_chance', 'chance'),
+}
+_JSON_TYPES = {
+    'level': lambda v: level_from_text(str(v)),
+    'exp_current': lambda v: parse_number(str(v)),
+    'exp_total': lambda v: parse_number(str(v)),
+    'chance': lambda v: str(v).strip(),
+}
+
+
+# ---------------------------------------------------------------------------
+# JSON → запись альянса
+# ---------------------------------------------------------------------------
+
+def _walk(data, parent=''):
+    """(ключ-родитель, ключ, значение) обходом в ширину: поля верхнего уровня — первыми."""
+    queue = deque([(parent, data)])
+    while queue:
+        parent, node = queue.popleft()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                yield parent, str(key).lower(), value
+                if isinstance(value, (dict, list)):
+                    queue.append((str(key).lower(), value))
+        elif isinstance(node, list):
+            for value in node:
+                queue.append((parent, value))
+
+
+def map_json(data):
+    """
+    Запись альянса в тех же типах, что у экстракторов страницы, или None.
+    slug берётся только у манги (manga.slug, manga_slug) — не у самого альянса.
+    """
+    found = {}
+    for parent, key, value in _walk(data):
+        if isinstance(value, (dict, list)) or value is None:
+            continue
+        if 'slug' not in found and (key == 'manga_slug' or (key == 'slug' and 'manga' in parent)):
+            found['slug'] = str(value)
+            continue
+        for field, keys in _JSON_KEYS.items():
+            if key in keys:
+                rank = keys.index(key)
+                if field not in found or rank < found[field][0]:
+                    found[field] = (rank, value)
+    if not found:
+        return None
+    record = {'slug': found['slug']} if 'slug' in found else {}
+    for field in _JSON_KEYS:
+        if field in found:
+            record[field] = _JSON_TYPES[field](found[field][1])
+    return record
+
+
+def _complete(record):
+    return bool(record) and all(record.get(f) is not None for f in ALLIANCE_FIELDS)
+
+
+def _matches(record, reference):
+    """
+    JSON сверяется с разбором страницы: типы всех полей и значения тех,
+    что не успевают измениться между двумя запросами (опыт и шанс — успевают).
+    """
+    if not _complete(record) or not _complete(reference):
+        return False
+    if any(type(record[f]) is not type(reference[f]) for f in ALLIANCE_FIELDS):
+        return False
+    return all(record[f] == reference[f] for f in ('slug', 'level', 'exp_total'))
+
+
+# Найденный в странице адрес пробуется, только если это заведомо чтение
+# данных: /alliances/{id}/data, /alliances/{id}/boost/stats, /api/v1/alliances/{id}
+# и т.п. Прочие ссылки альянса (вступить, выйти, исключить участника) — действия,
+# их нельзя запрашивать фоновым поиском от имени залогиненной сессии.
+_READ_ONLY_PATH = (
+    r'(?:/api(?:/v\d+)?/alliances/{id}(?:/boost)?(?:/{tail})?'
+    r'|/alliances/{id}(?:/boost)?/{tail})(?:\.json)?/?'
+)
+_READ_ONLY_TAILS = r'(?:data|info|stats|state)'
+
+
+def discover_endpoints(html, alliance_id, configured=()):
+    """
+    Кандидаты JSON-эндпоинта: сначала из настроек, затем найденные в странице
+    адреса альянса, подходящие под _READ_ONLY_PATH.
+    """
+    candidates = [template.format(id=alliance_id) for template in configured]
+    page_re = re.compile(
+        r'''["'](?:https?://[^/"']+)?(/[^"'\s<>]*?alliances/''' + re.escape(str(alliance_id))
+        + r'''(?:/[^"'\s<>]*)?)["']'''
+    )
+    read_only = re.compile(_READ_ONLY_PATH.format(id=re.escape(str(alliance_id)), tail=_READ_ONLY_TAILS))
+    for m in page_re.finditer(html):
+        path = m.group(1)
+        if read_only.fullmatch(path):
+            candidates.append(path)
+    return list(dict.fromkeys(candidates))
+
+
+# ---------------------------------------------------------------------------
+# Источники
+# ---------------------------------------------------------------------------
+
+class SourceStats:
+    def __init__(self, name):
+        self.name = name
+        self.polls = 0
+        self.failures = 0
+        self.bytes = 0
+        self.timings = deque(maxlen=STATS_WINDOW)
+
+    def add(self, seconds, size, ok):
+        self.polls += 1
+        self.bytes += size
+        self.failures += not ok
+        self.timings.append(seconds)
+        SOURCE_FETCH_SECONDS.labels(self.name).observe(seconds)
+
+    def _percentile_ms(self, q):
+        timings = sorted(self.timings)
+        return timings[min(len(timings) - 1, int(len(timings) * q))] * 1000 if timings else None
+
+    def summary(self):
+        return {
+            'polls': self.polls,
+            'failures': self.failures,
+            'p50_ms': self._percentile_ms(0.5),
+            'p95_ms': self._percentile_ms(0.95),
+            'kb_per_poll': self.bytes / self.polls / 1024 if self.polls else None,
+        }
+
+
+class HtmlSource:
+    name = 'html'
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    def fetch(self):
+        return self.monitor._fetch_html_page_data()
+
+
+class JsonSource:
+    """Опрос одного найденного JSON-эндпоинта. broken — ответ перестал подходить."""
+
+    name = 'json'
+
+    def __init__(self, monitor, path):
+        self.monitor = monitor
+        self.path = path
+        self.url = f"{monitor.config.MANGABUFF_BASE_URL}{path}"
+        self.broken = None
+
+    def request(self, deadline=None):
+        m = self.monitor
+        if deadline is None:
+            deadline = m.config.POLL_DEADLINE
+        with HTTP_FETCH_SECONDS.labels('boost_json').time():
+            return m.executor.call(
+                'boost_json',
+                lambda timeout: m._get(
+                    self.url, timeout, headers={**JSON_HEADERS, 'Referer': m.alliance_url},
+                    allow_redirects=False,
+                ),
+                deadline=deadline,
+            )
+
+    def fetch(self):
+        m = self.monitor
+        m.last_fetch_error = None
+        self.broken = None
+        m.page_stats['polls'] += 1
+        try:
+            response = self.request()
+            m._mark_fetch(len(response.content))
+            if m.health.check(response):
+                m.last_fetch_error = {'kind': 'auth', 'retry_after': None}
+                m._count_poll('auth_expired')
+                return None
+            if response.status_code >= 500 or response.status_code == 429:
+                m._fail_http(response)
+                return None
+            if response.status_code != 200:
+                self.broken = f"http_{response.status_code}"
+                return None
+            try:
+                record = map_json(response.json())
+            except ValueError:
+                record = None
+            if not _complete(record):
+                self.broken = 'fields'
+                return None
+            m._count_poll('json')
+            return record
+        except CircuitOpenError as e:
+            m._fail_circuit(e)
+            return None
+        except requests.exceptions.Timeout as e:
+            m._fail_network('timeout', e)
+            return None
+        except requests.exceptions.ConnectionError as e:
+            m._fail_network('network', e)
+            return None
+
+
+class SourceSet:
+    """Текущий источник с откатом на страницу и статистикой по источникам."""
+
+    def __init__(self, monitor, mode='html', json_urls=(), retry=3600.0, budget=15.0):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный источник данных: {mode} (есть: {', '.join(MODES)})")
+        self.monitor = monitor
+        self.mode = mode
+        self.json_urls = tuple(json_urls)
+        self.retry = retry
+        # Секунд на весь поиск JSON-эндпоинта, на все кандидаты вместе
+        self.budget = budget
+        self.html = HtmlSource(monitor)
+        self.json = None
+        self._next_discovery = 0.0
+        self._discovery = None      # фоновый поток поиска
+        self._found = None          # найденный источник, подключается в fetch()
+        self.stats = {'html': SourceStats('html'), 'json': SourceStats('json')}
+
+    def _timed(self, source):
+        m = self.monitor
+        before = m.page_stats['bytes']
+        start = time.perf_counter()
+        data = source.fetch()
+        self.stats[source.name].add(time.perf_counter() - start, m.page_stats['bytes'] - before, data is not None)
+        return data
+
+    def fetch(self):
+        if self._found is not None:
+            self.json, self._found = self._found, None
+        if self.json is not None:
+            data = self._timed(self.json)
+            if data is not None or not self.json.broken:
+                return data
+            SOURCE_FALLBACKS_TOTAL.labels(self.json.broken).inc()
+            self.monitor.log(f"⚠️ JSON-источник {self.json.path}: {self.json.broken}, опрос страницы")
+            self.json = None
+            self._next_discovery = time.monotonic() + self.retry
+
+        data = self._timed(self.html)
+        if (self.mode == 'auto' and data is not None and time.monotonic() >= self._next_discovery
+                and self.monitor.last_page_html is not None
+                and (self._discovery is None or not self._discovery.is_alive())):
+            self._next_discovery = time.monotonic() + self.retry
+            self._discovery = threading.Thread(
+                target=self._discover_in_background, args=(self.monitor.last_page_html, dict(data)),
+                name=f"source-discovery-{self.monitor.alliance_id}", daemon=True,
+            )
+            self._discovery.start()
+        return data
+
+    def _discover_in_background(self, html, reference):
+        self._found = self.discover(html, reference)
+
+    def discover(self, html, reference):
+        """
+        Ищет JSON-эндпоинт, совпадающий с reference — данными, разобранными
+        из html. Все кандидаты вместе — не дольше budget секунд. Ошибки
+        поиска только логируются.
+        """
+        m = self.monitor
+        deadline_at = time.monotonic() + self.budget
+        try:
+            for path in discover_endpoints(html, m.alliance_id, self.json_urls):
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    m.log("ℹ️ Поиск JSON-источника: бюджет времени исчерпан", logging.DEBUG)
+                    break
+                source = JsonSource(m, path)
+                response = source.request(deadline=remaining)
+                if response.status_code != 200 or 'json' not in response.headers.get('Content-Type', ''):
+                    continue
+                try:
+                    record = map_json(response.json())
+                except ValueError:
+                    continue
+                if _matches(record, reference):
+                    m.log(f"⚡ Найден JSON-источник: {path} ({len(response.content)} Б "
+                          f"вместо {len(html.encode('utf-8'))} Б страницы)")
+                    return source
+        except requests.exceptions.RequestException as e:
+            log.warning(f"⚠️ Поиск JSON-источника: {e}")
+        m.log("ℹ️ JSON-источник не найден, опрос страницы", logging.DEBUG)
+        return None
+
+    def report(self):
+        """Строка сравнения источников для журнала или None, если опросов не было."""
+        parts = []
+        for name, stats in self.stats.items():
+            s = stats.summary()
+            if not s['polls']:
+                continue
+            parts.append(
+                f"{name}: {s['polls']} опросов, p50 {s['p50_ms']:.0f} мс, p95 {s['p95_ms']:.0f} мс, "
+                f"{s['kb_per_poll']:.1f} КБ/опрос, сбоев {s['failures']}"
+            )
+        return "; ".join(parts) or None
+
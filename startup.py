@@ -0,0 +1,74 @@
+"""
+Замеры старта процесса: от запуска main.py до первого успешного опроса.
+
+main.py импортирует этот модуль первым — отсчёт идёт с этого момента.
+Фазы отмечаются по мере прохождения (mark); повторная отметка той же
+фазы игнорируется, поэтому вызывать mark можно с горячего пути.
+
+  import_config, import_monitor, import_async — импорты (тяжёлые модули,
+                 например bs4 и asyncio, грузятся только когда нужны)
+  init         — мониторы созданы
+  session      — сессия проверена или выполнен вход
+  first_poll   — первые данные альянса получены
+  first_check  — первый опрос в основном цикле
+  announce     — стартовый пост поставлен в очередь (при FAST_START — в фоне,
+                 параллельно с первыми опросами)
+
+Подробности по отдельным модулям: python -X importtime main.py
+"""
+
+import threading
+import time
+
+from metrics import STARTUP_PHASE_SECONDS
+
+_T0 = time.perf_counter()
+
+PHASES = {
+    'import_config': "импорт config",
+    'import_monitor': "импорт monitor",
+    'import_async': "импорт async_monitor",
+    'init': "инициализация",
+    'session': "сессия",
+    'first_poll': "первые данные",
+    'first_check': "первый опрос цикла",
+    'announce': "анонс",
+}
+
+_marks = {}         # фаза → секунды от старта
+_lock = threading.Lock()
+
+
+def mark(phase):
+    """Отмечает конец фазы. True — отмечено сейчас (в первый раз)."""
+    if phase in _marks:
+        return False
+    with _lock:
+        if phase in _marks:
+            return False
+        _marks[phase] = elapsed = time.perf_counter() - _T0
+    STARTUP_PHASE_SECONDS.labels(phase).set(elapsed)
+    return True
+
+
+def since_start():
+    return time.perf_counter() - _T0
+
+
+def report():
+    """
+    'импорт config 20 мс → … → первый опрос цикла 35 мс (итого 410 мс)'
+    по отмеченным фазам; анонс идёт параллельно и сюда не входит.
+    """
+    with _lock:
+        marks = sorted(_marks.items(), key=lambda item: item[1])
+    parts = []
+    previous = 0.0
+    for phase, at in marks:
+        if phase == 'announce':
+            continue
+        parts.append(f"{PHASES.get(phase, phase)} {(at - previous) * 1000:.0f} мс")
+        previous = at
+    if not parts:
+        return None
+    return f"{' → '.join(parts)} (итого {previous * 1000:.0f} мс)"
@@ -0,0 +1,121 @@
+"""
+Снимок состояния мониторов для быстрого перезапуска.
+
+Хранит по альянсам то, что иначе теряется при рестарте: текущий slug и
+детали манги, последние данные страницы, учёт опыта за день и message_id
+постов в Telegram. После перезапуска монитор продолжает править старый
+пост, а не рассылает тайтл заново.
+
+Опрос только отдаёт состояние (update — сравнение строки и присваивание);
+файл пишет фоновый поток, не чаще раза в interval секунд и только если
+что-то изменилось. Запись атомарная: временный файл, fsync, os.replace.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from logsetup import get_logger
+
+log = get_logger('state')
+
+STATE_FORMAT = 1
+
+
+class StateSnapshots:
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._states = {}       # alliance_id → состояние
+        self._encoded = {}      # alliance_id → JSON для сравнения
+        self._dirty = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._load()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            log.warning(f"⚠️ Снимок состояния не прочитан: {e}")
+            return
+        if data.get('format') != STATE_FORMAT:
+            return
+        self._states = data.get('alliances', {})
+        self._encoded = {
+            k: json.dumps(v, ensure_ascii=False, sort_keys=True) for k, v in self._states.items()
+        }
+
+    def get(self, alliance_id):
+        with self._lock:
+            return self._states.get(str(alliance_id))
+
+    def update(self, alliance_id, state):
+        """Запоминает состояние альянса; файл перепишется, только если оно изменилось."""
+        encoded = json.dumps(state, ensure_ascii=False, sort_keys=True)
+        key = str(alliance_id)
+        with self._lock:
+            if self._encoded.get(key) == encoded:
+                return
+            self._states[key] = state
+            self._encoded[key] = encoded
+            self._dirty = True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.write()
+
+    def write(self):
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {'format': STATE_FORMAT, 'saved_at': int(time.time()), 'alliances': dict(self._states)}
+            self._dirty = False
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            log.warning(f"⚠️ Снимок состояния не сохранён: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def close(self):
+        """Останавливает поток и дописывает последние изменения."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(5)
+        self.write()
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def open_state(path, interval=5.0):
+    """Один файл снимка на процесс для всех мониторов; None — снимки выключены."""
+    if not path:
+        return None
+    with _snapshots_lock:
+        if path not in _snapshots:
+            _snapshots[path] = StateSnapshots(path, interval=interval)
+            atexit.register(_snapshots[path].close)
+        return _snapshots[path]
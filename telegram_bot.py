@@ -1,5 +1,18 @@
-import requests
-from datetime import datetime
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from captions import caption_key, render_caption
+from config import Config
+from metrics import (
+    CHANGE_TO_NOTIFY_SECONDS, TELEGRAM_QUEUE_DEPTH, TELEGRAM_REQUEST_SECONDS, TELEGRAM_RESPONSES_TOTAL,
+)
+from logsetup import get_logger
+from poster_cache import PosterCache
+from transport import make_session
 
 
 # Темы для рассылки.
@@ -7,26 +20,141 @@ from datetime import datetime
 # int  = конкретная тема по ID
 TOPIC_IDS = [None, 3]
 
+# Сколько раз повторять запрос после 429 Too Many Requests
+MAX_RATE_LIMIT_RETRIES = 3
+
+log = get_logger('telegram')
+
+
+# ---------------------------------------------------------------------------
+# Общие ресурсы доставки (на все уведомители процесса)
+# ---------------------------------------------------------------------------
+
+_shared_lock = threading.Lock()
+_shared_http = None
+_shared_pool = None
+_shared_posters = {}
+
+
+def _http_session():
+    """Общая сессия с пулом keep-alive соединений к api.telegram.org."""
+    global _shared_http
+    with _shared_lock:
+        if _shared_http is None:
+            _shared_http = make_session('telegram', Config.TELEGRAM_POOL_SIZE, http2=Config.HTTP2)
+        return _shared_http
+
+
+def _fanout_pool():
+    """Потоки для параллельной отправки в несколько тем."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ThreadPoolExecutor(
+                max_workers=Config.TELEGRAM_POOL_SIZE, thread_name_prefix="tg-send"
+            )
+        return _shared_pool
+
+
+def _poster_cache(bot_token):
+    """Кэш file_id постеров — один на бота."""
+    bot_id = (bot_token or '').split(':')[0]
+    with _shared_lock:
+        if bot_id not in _shared_posters:
+            _shared_posters[bot_id] = PosterCache(
+                Config.POSTER_CACHE_FILE, max_size=Config.POSTER_CACHE_SIZE, bot_id=bot_id
+            )
+            atexit.register(_shared_posters[bot_id].close)
+        return _shared_posters[bot_id]
+
 
 class TelegramNotifier:
-    def __init__(self, bot_token, chat_id):
+    """
+    Уведомления в Telegram.
+
+    Публичные send_*/update_* не блокируют вызывающий поток: задания
+    ставятся в очередь и выполняются фоновым потоком по порядку, каждая
+    рассылка — параллельно во все темы. Непрочитанные правки подписи
+    схлопываются: отправляется только последняя.
+
+    Правка не отправляется, если видимая подпись сообщения не изменилась
+    (отличается только время), и не чаще edit_min_interval секунд на
+    сообщение: изменения внутри интервала уходят одной отложенной правкой
+    в его конце.
+    """
+
+    def __init__(self, bot_token, chat_id, topic_ids=None, alliance_url=None, background=None,
+                 edit_min_interval=None):
         self.bot_token = bot_token
         self.chat_id = chat_id
-        self.api_url = f"https://api.telegram.org/bot{bot_token}"
+        self.api_url = f"{Config.TELEGRAM_API_URL}/bot{bot_token}"
+
+        # Темы и ссылка на альянс — свои у каждого альянса
+        self.topic_ids = list(topic_ids) if topic_ids is not None else list(TOPIC_IDS)
+        self.alliance_url = alliance_url or Config.ALLIANCE_URL
 
         # Хранит message_id последнего отправленного сообщения для каждой темы
         # Ключ: topic_id (None или int), значение: message_id
         self.active_message_ids: dict = {}
 
+        # Очередь доставки
+        self.background = Config.TELEGRAM_BACKGROUND if background is None else background
+        self._queue = queue.Queue(maxsize=Config.TELEGRAM_QUEUE_SIZE)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        # Схлопывание правок: поколение = номер рассылки фото.
+        # Правка, поставленная до новой рассылки, устаревает вместе с ней.
+        self._generation = 0
+        self._pending_edit = None       # (generation, caption, parse_mode, observed_at)
+        self._edit_lock = threading.Lock()
+
+        # Последняя подпись по message_id: (caption_key, monotonic-время отправки)
+        self._sent_captions: dict = {}
+        self.edit_min_interval = (
+            Config.TELEGRAM_EDIT_MIN_INTERVAL if edit_min_interval is None else edit_min_interval
+        )
+        self._edit_timer = None
+
+        # Метрики доставки
+        self._latencies = deque(maxlen=256)
+        self.delivery_stats = {
+            'sent': 0, 'failed': 0, 'coalesced': 0, 'superseded': 0,
+            'rate_limited': 0, 'dropped': 0, 'unchanged': 0, 'deferred': 0,
+        }
+
     # ------------------------------------------------------------------
     # Низкоуровневые методы
     # ------------------------------------------------------------------
 
+    def _post(self, method, data):
+        """
+        POST к Bot API через общий пул. На 429 ждёт retry_after и повторяет.
+        """
+        response = None
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            with TELEGRAM_REQUEST_SECONDS.labels(method).time():
+                response = _http_session().post(f"{self.api_url}/{method}", data=data, timeout=10)
+            TELEGRAM_RESPONSES_TOTAL.labels(method, response.status_code).inc()
+            if response.status_code != 429:
+                return response
+            self.delivery_stats['rate_limited'] += 1
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            except ValueError:
+                retry_after = 1
+            log.warning(f"⏳ {method}: 429, ждём {retry_after} с")
+            time.sleep(retry_after)
+        return response
+
     def _send_photo(self, photo_url, caption, parse_mode="HTML", message_thread_id=None):
-        """Отправляет фото, возвращает message_id или None."""
+        """
+        Отправляет фото (URL или file_id), возвращает (message_id, file_id)
+        или (None, None).
+        """
         try:
             if photo_url and photo_url.startswith('/'):
-                photo_url = f"https://mangabuff.ru{photo_url}"
+                photo_url = f"{Config.MANGABUFF_BASE_URL}{photo_url}"
 
             data = {
                 "chat_id": self.chat_id,
@@ -37,20 +165,24 @@ class TelegramNotifier:
             if message_thread_id is not None:
                 data["message_thread_id"] = message_thread_id
 
-            response = requests.post(f"{self.api_url}/sendPhoto", data=data, timeout=10)
+            response = self._post("sendPhoto", data)
             label = f"тема {message_thread_id}" if message_thread_id is not None else "General"
 
             if response.status_code == 200:
-                msg_id = response.json().get("result", {}).get("message_id")
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Фото отправлено ({label}), msg_id={msg_id}")
-                return msg_id
+                result = response.json().get("result", {})
+                msg_id = result.get("message_id")
+                # Последний размер — самый крупный, его и переиспользуем
+                sizes = result.get("photo") or []
+                file_id = sizes[-1].get("file_id") if sizes else None
+                log.info(f"✅ Фото отправлено ({label}), msg_id={msg_id}")
+                return msg_id, file_id
             else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ sendPhoto ({label}): {response.text}")
-                return None
+                log.error(f"❌ sendPhoto ({label}): {response.text}")
+                return None, None
 
         except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Ошибка отправки фото: {e}")
-            return None
+            log.error(f"❌ Ошибка отправки фото: {e}")
+            return None, None
 
     def _send_message(self, text, parse_mode="HTML", message_thread_id=None):
         """Отправляет текстовое сообщение, возвращает message_id или None."""
@@ -63,13 +195,13 @@ class TelegramNotifier:
             if message_thread_id is not None:
                 data["message_thread_id"] = message_thread_id
 
-            response = requests.post(f"{self.api_url}/sendMessage", data=data, timeout=10)
+            response = self._post("sendMessage", data)
             if response.status_code == 200:
                 return response.json().get("result", {}).get("message_id")
             return None
 
         except Exception as e:
-            print(f"Ошибка отправки сообщения: {e}")
+            log.error(f"❌ Ошибка отправки сообщения: {e}")
             return None
 
     def _edit_caption(self, message_id, caption, parse_mode="HTML"):
@@ -81,7 +213,7 @@ class TelegramNotifier:
                 "caption": caption,
                 "parse_mode": parse_mode,
             }
-            response = requests.post(f"{self.api_url}/editMessageCaption", data=data, timeout=10)
+            response = self._post("editMessageCaption", data)
             if response.status_code == 200:
                 return True
             else:
@@ -90,91 +222,297 @@ class TelegramNotifier:
                 err = response.json().get("description", "")
                 if "message is not modified" in err:
                     return True
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ editCaption: {err}")
+                log.warning(f"⚠️ editCaption: {err}")
                 return False
         except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Ошибка редактирования: {e}")
+            log.error(f"❌ Ошибка редактирования: {e}")
             return False
 
     # ------------------------------------------------------------------
-    # Публичные методы
+    # Рассылка (выполняется в фоновом потоке)
     # ------------------------------------------------------------------
 
-    def send_photo_to_all_topics(self, photo_url, caption, parse_mode="HTML"):
-        """Отправляет фото во все темы, сохраняет message_id."""
-        self.active_message_ids.clear()
-        for topic_id in TOPIC_IDS:
-            msg_id = self._send_photo(photo_url, caption, parse_mode, message_thread_id=topic_id)
-            if msg_id:
-                self.active_message_ids[topic_id] = msg_id
+    def _fanout(self, fn, *args, topics=None):
+        """Вызывает fn(*args, topic_id) для тем параллельно → {topic_id: результат}."""
+        topics = self.topic_ids if topics is None else topics
+        if len(topics) <= 1:
+            return {topic_id: fn(*args, topic_id) for topic_id in topics}
+        pool = _fanout_pool()
+        futures = {topic_id: pool.submit(fn, *args, topic_id) for topic_id in topics}
+        return {topic_id: f.result() for topic_id, f in futures.items()}
 
-    def send_message_to_all_topics(self, text, parse_mode="HTML"):
-        """Отправляет текст во все темы."""
-        for topic_id in TOPIC_IDS:
-            self._send_message(text, parse_mode, message_thread_id=topic_id)
+    def _deliver_photo(self, photo_url, caption, parse_mode, slug=None):
+        """
+        Фото во все темы. Картинка загружается в Telegram один раз:
+        первая тема получает URL, остальные — file_id из ответа.
+        Известный по slug file_id используется сразу для всех тем.
+        """
+        def send(photo, topic_id):
+            return self._send_photo(photo, caption, parse_mode, message_thread_id=topic_id)
+
+        cache = _poster_cache(self.bot_token)
+        results = {}
+        pending = list(self.topic_ids)
+        file_id = cache.get(slug)
+
+        # Вторая попытка — если сохранённый file_id оказался недействительным
+        for _ in range(2):
+            if file_id is None and pending:
+                first = pending.pop(0)
+                results[first] = send(photo_url, first)
+                file_id = results[first][1]
+                cache.put(slug, file_id)
+            if not pending:
+                break
+            if not file_id:
+                # Telegram не вернул file_id — остальным темам тоже URL
+                results.update(self._fanout(send, photo_url, topics=pending))
+                break
+            results.update(self._fanout(send, file_id, topics=pending))
+            pending = [t for t in pending if not results[t][0]]
+            if not pending:
+                break
+            cache.invalidate(slug)
+            file_id = None
 
-    def update_caption_in_all_topics(self, caption, parse_mode="HTML"):
+        self.active_message_ids = {t: r[0] for t, r in results.items() if r[0]}
+        sent = (caption_key(caption), time.monotonic())
+        with self._edit_lock:
+            # Подписи старых постов больше не правятся
+            self._sent_captions = {m: sent for m in self.active_message_ids.values()}
+        return {t: r[0] for t, r in results.items()}
+
+    def _deliver_message(self, text, parse_mode):
+        return self._fanout(
+            lambda txt, pm, topic_id: self._send_message(txt, pm, message_thread_id=topic_id),
+            text, parse_mode,
+        )
+
+    def _deliver_pending_edit(self, generation, force=False):
         """
-        Тихо редактирует подпись во всех активных сообщениях.
-        Если message_id не сохранён — ничего не делает.
+        Правка подписи во всех постах. Посты, где видимая подпись та же,
+        пропускаются; если какой-то пост правили меньше edit_min_interval
+        назад, правка откладывается до конца интервала (force — не ждать).
         """
-        if not self.active_message_ids:
-            return
+        with self._edit_lock:
+            pending = self._pending_edit
+            if pending is None or pending[0] != generation:
+                return {}
+            if generation != self._generation:
+                # После правки уже поставлено новое фото — подпись старого не важна
+                self._pending_edit = None
+                self.delivery_stats['superseded'] += 1
+                return {}
+
+            _, caption, parse_mode, observed_at = pending
+            key = caption_key(caption)
+            now = time.monotonic()
+            targets, wait = {}, 0.0
+            for topic_id, msg_id in self.active_message_ids.items():
+                last = self._sent_captions.get(msg_id)
+                if last is not None and last[0] == key:
+                    continue
+                targets[topic_id] = msg_id
+                if last is not None and not force:
+                    wait = max(wait, last[1] + self.edit_min_interval - now)
 
-        for topic_id, msg_id in self.active_message_ids.items():
-            label = f"тема {topic_id}" if topic_id is not None else "General"
+            if targets and wait > 0:
+                # Правка остаётся в _pending_edit: новые подписи её заменят, уйдёт последняя
+                self._schedule_edit(generation, wait, observed_at)
+                return {}
+            self._pending_edit = None
+            if not targets:
+                if self.active_message_ids:
+                    self.delivery_stats['unchanged'] += 1
+                return {}
+
+        def edit(msg_id, label):
             ok = self._edit_caption(msg_id, caption, parse_mode)
             if ok:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] 📝 Подпись обновлена ({label})")
+                with self._edit_lock:
+                    self._sent_captions[msg_id] = (key, time.monotonic())
+                log.debug(f"📝 Подпись обновлена ({label})")
+            return ok
+
+        pool = _fanout_pool()
+        futures = {
+            topic_id: pool.submit(edit, msg_id, f"тема {topic_id}" if topic_id is not None else "General")
+            for topic_id, msg_id in targets.items()
+        }
+        return {topic_id: f.result() for topic_id, f in futures.items()}
+
+    def _schedule_edit(self, generation, delay, observed_at):
+        """Отложенная правка в конце интервала (вызывается под _edit_lock)."""
+        if self._edit_timer is not None and self._edit_timer.is_alive():
+            return
+        self.delivery_stats['deferred'] += 1
+        self._edit_timer = threading.Timer(
+            delay, self._submit, args=(self._deliver_pending_edit, generation),
+            kwargs={'observed': ('stats', observed_at)},
+        )
+        self._edit_timer.daemon = True
+        self._edit_timer.start()
 
     # ------------------------------------------------------------------
-    # Форматирование
+    # Очередь
     # ------------------------------------------------------------------
 
-    def format_manga_caption(self, manga_info, page_data=None, exp_gain_today=None, is_startup=False):
+    def _submit(self, fn, *args, observed=None):
         """
-        Подпись к фото манги.
+        observed — (kind, monotonic-время получения страницы с изменением)
+        для метрики "от изменения до уведомления".
+        """
+        job = (time.monotonic(), fn, args, observed)
+        if not self.background:
+            self._run_job(job)
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.delivery_stats['dropped'] += 1
+            log.warning("⚠️ Очередь Telegram переполнена, задание отброшено")
+        TELEGRAM_QUEUE_DEPTH.labels(self.chat_id).set(self._queue.qsize())
 
-        manga_info     — dict: title, slug, image, timestamp
-        page_data      — dict: level, exp_current, exp_total, chance
-        exp_gain_today — int или None
-        is_startup     — True если стартовое сообщение
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._worker_loop, name="tg-delivery", daemon=True)
+                self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run_job(job)
+            finally:
+                self._queue.task_done()
+                TELEGRAM_QUEUE_DEPTH.labels(self.chat_id).set(self._queue.qsize())
+
+    def _run_job(self, job):
+        enqueued_at, fn, args, observed = job
+        try:
+            results = fn(*args)
+        except Exception as e:
+            self.delivery_stats['failed'] += 1
+            log.error(f"❌ Ошибка доставки: {e}")
+            return
+        for ok in results.values():
+            self.delivery_stats['sent' if ok else 'failed'] += 1
+        if results:
+            done = time.monotonic()
+            self._latencies.append(done - enqueued_at)
+            if observed and observed[1] is not None and any(results.values()):
+                CHANGE_TO_NOTIFY_SECONDS.labels(observed[0]).observe(done - observed[1])
+
+    def flush(self, timeout=30):
+        """Ждёт доставки всего, что стоит в очереди (например, перед выходом)."""
+        with self._edit_lock:
+            timer, self._edit_timer = self._edit_timer, None
+            deferred = self._pending_edit if timer is not None and timer.is_alive() else None
+        if timer is not None:
+            timer.cancel()
+        if deferred is not None:
+            # Отложенную правку не ждём до конца интервала — отправляем сейчас
+            self._submit(self._deliver_pending_edit, deferred[0], True, observed=('stats', deferred[3]))
+        if not self.background or self._worker is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Глубина очереди, счётчики и задержка доставки (сек, от постановки до ответа API)."""
+        lat = sorted(self._latencies)
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 3) if lat else None
+
+        return {
+            'queue_depth': self.queue_depth(),
+            **self.delivery_stats,
+            'latency_p50': pct(0.5),
+            'latency_p95': pct(0.95),
+            'latency_max': round(lat[-1], 3) if lat else None,
+        }
+
+    # ------------------------------------------------------------------
+    # Публичные методы
+    # ------------------------------------------------------------------
+
+    def send_photo_to_all_topics(self, photo_url, caption, parse_mode="HTML", slug=None, observed_at=None):
+        """
+        Отправляет фото во все темы, сохраняет message_id.
+        slug — ключ кэша file_id постера.
         """
-        title = manga_info.get('title', '—')
-        slug  = manga_info.get('slug', '')
+        with self._edit_lock:
+            self._generation += 1
+        self._submit(
+            self._deliver_photo, photo_url, caption, parse_mode, slug, observed=('title', observed_at)
+        )
 
-        # Название копируемое + пустая строка после
-        lines = [
-            f"📚 <code>{title}</code>",
-            "",
-        ]
+    def send_message_to_all_topics(self, text, parse_mode="HTML", observed_at=None):
+        """Отправляет текст во все темы."""
+        self._submit(self._deliver_message, text, parse_mode, observed=('title', observed_at))
 
-        if page_data:
-            exp_cur = page_data.get('exp_current')
-            exp_tot = page_data.get('exp_total')
-            chance  = page_data.get('chance')
+    def update_caption_in_all_topics(self, caption, parse_mode="HTML", observed_at=None):
+        """
+        Тихо редактирует подпись во всех активных сообщениях.
+        Если message_id не сохранён — ничего не делает. Если предыдущая
+        правка ещё в очереди, её подпись просто заменяется на новую.
+        """
+        with self._edit_lock:
+            generation = self._generation
+            if self._pending_edit is not None and self._pending_edit[0] == generation:
+                # Время изменения оставляем от первой правки — её ждали дольше всех
+                first_observed = self._pending_edit[3]
+                self._pending_edit = (generation, caption, parse_mode, first_observed)
+                self.delivery_stats['coalesced'] += 1
+                return
+            self._pending_edit = (generation, caption, parse_mode, observed_at)
+        self._submit(self._deliver_pending_edit, generation, observed=('stats', observed_at))
 
-            if exp_cur is not None and exp_tot is not None:
-                cur_fmt = f"{exp_cur:,}".replace(",", " ")
-                tot_fmt = f"{exp_tot:,}".replace(",", " ")
-                lines.append(f"⭐ Опыт: {cur_fmt} / {tot_fmt}")
-            elif exp_cur is not None:
-                lines.append(f"⭐ Опыт: {f'{exp_cur:,}'.replace(',', ' ')}")
+    # ------------------------------------------------------------------
+    # Общее состояние (кластерный режим)
+    # ------------------------------------------------------------------
 
-            if chance is not None:
-                lines.append(f"🎲 Шанс смены: {chance}%")
+    def export_state(self):
+        """
+        message_id постов по темам (ключ None — General, поэтому список пар)
+        и последняя видимая подпись каждого поста.
+        """
+        with self._edit_lock:
+            captions = [[m, sent[0]] for m, sent in self._sent_captions.items()]
+        return {
+            'active_message_ids': [[t, m] for t, m in self.active_message_ids.items()],
+            'captions': captions,
+        }
 
-        lines.append("")
-        # Ссылка скрыта под текстом
-        lines.append(f'🔗 <a href="https://mangabuff.ru/alliances/10/boost">Перейти к вкладке альянса</a>')
-        lines.append("")
+    def restore_state(self, state):
+        self.active_message_ids = {t: m for t, m in state.get('active_message_ids', [])}
+        with self._edit_lock:
+            # Время правки неизвестно — интервал после перезапуска не ждём
+            self._sent_captions = {m: (key, float('-inf')) for m, key in state.get('captions', [])}
 
-        lines.append(f"🕐 {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}")
+    # ------------------------------------------------------------------
+    # Форматирование
+    # ------------------------------------------------------------------
 
-        if exp_gain_today is not None:
-            gain_fmt = f"{exp_gain_today:,}".replace(",", " ")
-            lines.append(f"📈 Прирост за сегодня: +{gain_fmt} опыта")
-        else:
-            lines.append(f"📈 Прирост за сегодня: —")
+    def format_manga_caption(self, manga_info, page_data=None, exp_gain_today=None, is_startup=False,
+                             exp_stats=None):
+        """
+        Подпись к фото манги (шаблон — captions.CaptionTemplate).
 
-        return "\n".join(lines)
\ No newline at end of file
+        manga_info     — dict: title, slug, image, timestamp
+        page_data      — dict: level, exp_current, exp_total, chance
+        exp_gain_today — int или None
+        is_startup     — True если стартовое сообщение
+        exp_stats      — dict из ExpSeries.summary(): rate_per_hour, eta_seconds
+        """
+        return render_caption(manga_info, self.alliance_url, page_data, exp_gain_today, exp_stats)
@@ -0,0 +1,49 @@
+"""
+Кэши манги и постеров: put() не пишет файл, запись — фоном и в close().
+
+    python -m pytest tests
+"""
+
+import json
+import time
+
+from manga_cache import MISS, MangaCache
+from poster_cache import PosterCache
+
+
+def test_manga_cache_writes_on_close(tmp_path):
+    path = tmp_path / 'manga_cache.json'
+    cache = MangaCache(str(path), interval=3600)
+    cache.put('berserk', {'slug': 'berserk', 'title': 'Берсерк', 'image': '/img/berserk.jpg'})
+    cache.put_missing('gone')
+    assert not path.exists()
+    cache.close()
+
+    reopened = MangaCache(str(path), interval=3600)
+    assert reopened.get('berserk')['title'] == 'Берсерк'
+    assert reopened.get('gone') is None
+    assert reopened.get('unknown') is MISS
+    reopened.close()
+
+
+def test_manga_cache_background_flush(tmp_path):
+    path = tmp_path / 'manga_cache.json'
+    cache = MangaCache(str(path), interval=0.05)
+    cache.put('berserk', {'slug': 'berserk', 'title': 'Берсерк'})
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert json.loads(path.read_text(encoding='utf-8'))['items'][0][0] == 'berserk'
+    cache.close()
+
+
+def test_poster_cache_writes_on_close(tmp_path):
+    path = tmp_path / 'poster_cache.json'
+    cache = PosterCache(str(path), bot_id='1', interval=3600)
+    cache.put('berserk', 'file-id-1')
+    assert not path.exists()
+    cache.close()
+
+    reopened = PosterCache(str(path), bot_id='1', interval=3600)
+    assert reopened.get('berserk') == 'file-id-1'
+    reopened.close()
@@ -0,0 +1,37 @@
+"""
+Настройки (config.Config). Config читается при импорте, поэтому каждая
+проверка запускается в отдельном интерпретаторе со своим окружением.
+
+    python -m pytest tests
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = '''
+from config import Config
+assert Config.ALLIANCE_IDS == [], Config.ALLIANCE_IDS
+assert Config.ALLIANCE_URL is None
+try:
+    Config.validate()
+except ValueError as e:
+    print(e)
+'''
+
+
+def test_empty_alliance_ids_reported_by_validate():
+    env = {
+        **os.environ,
+        'ALLIANCE_IDS': ' , ',
+        'MANGABUFF_EMAIL': 'user@example.com',
+        'MANGABUFF_PASSWORD': 'secret',
+        'TELEGRAM_BOT_TOKEN': '1:token',
+        'TELEGRAM_CHAT_ID': '-100',
+    }
+    result = subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert 'ALLIANCE_IDS' in result.stdout
@@ -0,0 +1,75 @@
+"""
+Очередь приёмника (events.SinkWorker): переполнение не теряет смену тайтла.
+
+    python -m pytest tests
+"""
+
+import threading
+
+import pytest
+
+from events import AuthLost, DayRollover, Sink, SinkWorker, StatsChanged, TitleChanged
+
+
+class GatedSink(Sink):
+    """Приёмник, который держит первое событие, пока не откроют gate."""
+
+    name = 'gated'
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.handled = []
+
+    def handle(self, event):
+        self.started.set()
+        self.gate.wait(5)
+        self.handled.append(event)
+
+
+def _stats(alliance_id):
+    return StatsChanged(alliance_id, slug='one-piece', manga_info=None)
+
+
+@pytest.fixture
+def busy_worker(request):
+    policy = request.param
+    sink = GatedSink()
+    worker = SinkWorker(sink, max_size=3, policy=policy, block_timeout=0.01)
+    # Первое событие забирает поток приёмника — дальше очередь только копится
+    worker.offer(DayRollover('0', day='2026-10-18'))
+    assert sink.started.wait(5)
+    yield worker, sink
+    sink.gate.set()
+    worker.close()
+
+
+@pytest.mark.parametrize('busy_worker', ['drop_oldest', 'drop_new', 'block'], indirect=True)
+def test_title_change_survives_full_queue(busy_worker):
+    worker, sink = busy_worker
+    title = TitleChanged('1', slug='berserk', previous_slug='one-piece')
+    worker.offer(title)
+    for i in range(2, 10):
+        worker.offer(_stats(str(i)))
+    assert worker.depth() == 3
+    assert worker.offer(AuthLost('1', reason='expired')) is True
+
+    sink.gate.set()
+    assert worker.flush(5)
+    handled = [type(e) for e in sink.handled]
+    assert title in sink.handled
+    assert AuthLost in handled
+    assert worker.stats['dropped'] > 0
+
+
+@pytest.mark.parametrize('busy_worker', ['drop_oldest'], indirect=True)
+def test_essential_events_exceed_capacity_rather_than_drop(busy_worker):
+    worker, sink = busy_worker
+    titles = [TitleChanged(str(i), slug=f'manga-{i}') for i in range(5)]
+    for title in titles:
+        assert worker.offer(title) is True
+    assert worker.offer(_stats('9')) is False
+
+    sink.gate.set()
+    assert worker.flush(5)
+    assert [e for e in sink.handled if isinstance(e, TitleChanged)] == titles
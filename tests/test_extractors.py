@@ -0,0 +1,90 @@
+"""
+Сверка бэкендов разбора страницы альянса (и CSRF-токена) с bs4
+на фикстурах bench/fixtures.
+
+    python -m pytest tests
+"""
+
+import glob
+import os
+
+import pytest
+
+from extractors import (
+    ALLIANCE_FIELDS, BeautifulSoupExtractor, FallbackExtractor, RegexExtractor, StreamFeed,
+    extract_csrf, make_soup,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench', 'fixtures')
+FIXTURES = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _complete(record):
+    return bool(record) and all(record.get(f) is not None for f in ALLIANCE_FIELDS)
+
+
+@pytest.fixture(params=FIXTURES, ids=os.path.basename)
+def page(request):
+    return _read(request.param)
+
+
+def test_fixtures_present():
+    assert FIXTURES, f"нет фикстур в {FIXTURES_DIR}"
+    assert any(_complete(BeautifulSoupExtractor().extract(_read(p).decode('utf-8'))) for p in FIXTURES)
+
+
+@pytest.mark.parametrize('backend', [RegexExtractor, FallbackExtractor], ids=lambda cls: cls.name)
+def test_backend_matches_bs4(page, backend):
+    html = page.decode('utf-8')
+    assert backend().extract(html) == BeautifulSoupExtractor().extract(html)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+@pytest.mark.parametrize('backend', [BeautifulSoupExtractor, RegexExtractor, FallbackExtractor],
+                         ids=lambda cls: cls.name)
+def test_stream_feed_matches_bs4(page, backend, chunk_size):
+    expected = BeautifulSoupExtractor().extract(page.decode('utf-8'))
+    feed = StreamFeed(backend(), 'utf-8')
+    stopped_at = None
+    for offset in range(0, len(page), chunk_size):
+        if feed.feed(page[offset:offset + chunk_size]):
+            stopped_at = offset + chunk_size
+            break
+    else:
+        feed.finish()
+
+    if feed.done:
+        # Ранний выход: разбор префикса совпадает с разбором всей страницы
+        assert feed.result == expected
+        assert feed.content == page[:stopped_at]
+    else:
+        # Поля не собрались в префиксе — страница читается до конца и разбирается целиком
+        assert feed.text == page.decode('utf-8')
+        assert backend().extract(feed.text) == expected
+
+
+def test_stream_feed_stops_early():
+    page = _read(os.path.join(FIXTURES_DIR, 'boost_basic.html'))
+    feed = StreamFeed(RegexExtractor(), 'utf-8')
+    read = 0
+    for offset in range(0, len(page), 512):
+        read += 512
+        if feed.feed(page[offset:offset + 512]):
+            break
+    assert feed.done and read < len(page)
+
+
+def test_extract_csrf_matches_bs4():
+    for path in FIXTURES:
+        html = _read(path).decode('utf-8')
+        soup = make_soup(html)
+        meta = soup.select_one('meta[name="csrf-token"]')
+        tag = soup.find('input', {'name': '_token'})
+        expected = (meta and meta.get('content', '').strip()) or (tag and tag.get('value', '').strip()) or None
+        assert extract_csrf(html) == expected, os.path.basename(path)
+    assert extract_csrf('<input data-name="_token" value="x"><meta content=\'t1\' name="csrf-token">') == 't1'
@@ -0,0 +1,32 @@
+"""
+Хэш фрагмента страницы альянса (monitor._relevant_region_digest).
+
+    python -m pytest tests
+"""
+
+import os
+
+from monitor import _relevant_region_digest
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench', 'fixtures')
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def test_digest_ignores_changes_outside_alliance_block():
+    page = _read('boost_basic.html')
+    touched = page.replace(b'</body>', b'<script>window.t = 1;</script></body>')
+    assert touched != page
+    assert _relevant_region_digest(touched) == _relevant_region_digest(page)
+
+
+def test_digest_changes_with_slug_before_class():
+    # href стоит перед class="… card-show__placeholder" — он тоже в хэше
+    page = _read('boost_nested_markup.html')
+    swapped = page.replace(b'/manga/kimetsu-no-yaiba', b'/manga/berserk')
+    assert swapped != page
+    assert _relevant_region_digest(page) is not None
+    assert _relevant_region_digest(swapped) != _relevant_region_digest(page)
@@ -0,0 +1,30 @@
+"""
+Адаптивный интервал опроса (scheduler.AdaptiveScheduler).
+
+    python -m pytest tests
+"""
+
+from scheduler import RETRY_AFTER_MAX, AdaptiveScheduler
+
+
+def _scheduler():
+    return AdaptiveScheduler(min_interval=1, max_interval=10, backoff_max=2, jitter=0)
+
+
+def test_retry_after_is_a_lower_bound_beyond_backoff_max():
+    scheduler = _scheduler()
+    scheduler.on_error('http_429', retry_after=60)
+    assert scheduler.next_delay() == 60
+
+
+def test_retry_after_has_sanity_cap():
+    scheduler = _scheduler()
+    scheduler.on_error('http_503', retry_after=10 * RETRY_AFTER_MAX)
+    assert scheduler.next_delay() == RETRY_AFTER_MAX
+
+
+def test_backoff_without_retry_after_stays_under_backoff_max():
+    scheduler = _scheduler()
+    for _ in range(5):
+        scheduler.on_error('timeout')
+        assert scheduler.next_delay() <= 2
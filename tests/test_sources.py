@@ -0,0 +1,27 @@
+"""
+Поиск JSON-эндпоинта альянса (sources.discover_endpoints).
+
+    python -m pytest tests
+"""
+
+from sources import discover_endpoints
+
+PAGE = '''
+<a href="/alliances/10/leave">Выйти</a>
+<form action="/alliances/10/kick/5" method="post"></form>
+<a href="/alliances/10/join">Вступить</a>
+<a href="/alliances/10/boost">Буст</a>
+<img src="/alliances/10/logo.png">
+<div data-url="/alliances/10/boost/data"></div>
+<div data-api="https://mangabuff.ru/api/v1/alliances/10"></div>
+<div data-url="/alliances/100/data"></div>
+'''
+
+
+def test_discover_takes_only_read_only_paths():
+    assert discover_endpoints(PAGE, 10) == ['/alliances/10/boost/data', '/api/v1/alliances/10']
+
+
+def test_discover_puts_configured_templates_first():
+    found = discover_endpoints(PAGE, 10, ['/api/alliances/{id}/boost', '/alliances/{id}/boost/data'])
+    assert found == ['/api/alliances/10/boost', '/alliances/10/boost/data', '/api/v1/alliances/10']
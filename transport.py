@@ -0,0 +1,207 @@
+"""
+Общий HTTP-транспорт для mangabuff.ru и Bot API.
+
+make_session() возвращает requests.Session с явно заданным пулом
+keep-alive соединений. Соединение (а с ним DNS-запрос и TLS-рукопожатие)
+открывается один раз и переиспользуется, пока сервер его не закроет.
+
+Сжатие: Accept-Encoding содержит только то, что умеет распаковать
+urllib3 в этом окружении — br появляется при установленном brotli,
+zstd — при zstandard.
+
+HTTP/2 (HTTP2=true) работает через httpx, если установлены httpx и h2;
+иначе остаётся HTTP/1.1 с тем же пулом.
+
+Метрики переиспользования (открыто соединений / отправлено запросов по
+хостам) снимаются из пулов urllib3 при каждом запросе /metrics.
+"""
+
+import importlib.util
+import threading
+import weakref
+from email.message import Message
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import DEFAULT_ACCEPT_ENCODING, get_encoding_from_headers
+
+from logsetup import get_logger
+from metrics import HTTP_CONNECTIONS_OPENED, HTTP_REQUESTS_SENT, REGISTRY
+
+log = get_logger('transport')
+
+# То, что реально распакуется (urllib3 учитывает brotli/zstandard)
+ACCEPT_ENCODING = DEFAULT_ACCEPT_ENCODING
+
+# Заголовки соединения HTTP/1.1, запрещённые в HTTP/2
+_HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade'}
+
+_clients = []       # (имя, weakref на Session)
+_clients_lock = threading.Lock()
+
+
+def http2_available():
+    return all(importlib.util.find_spec(m) is not None for m in ('httpx', 'h2'))
+
+
+# ---------------------------------------------------------------------------
+# HTTP/2 через httpx
+# ---------------------------------------------------------------------------
+
+class _RawShim:
+    """
+    Заглушка response.raw: requests берёт из неё Set-Cookie
+    (через _original_response.msg) и вызывает close()/release_conn().
+    """
+
+    def __init__(self, set_cookies):
+        msg = Message()
+        for value in set_cookies:
+            msg['Set-Cookie'] = value
+        self._original_response = self
+        self.msg = msg
+
+    def read(self, *args, **kwargs):
+        return b''
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class HTTPXAdapter(BaseAdapter):
+    """requests-адаптер поверх httpx.Client(http2=True) с общим пулом."""
+
+    def __init__(self, pool_size):
+        super().__init__()
+        import httpx
+        self._httpx = httpx
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=False,   # редиректы, как и раньше, ведёт requests.Session
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.num_requests = 0
+        self.http_versions = {}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        httpx = self._httpx
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        else:
+            timeout = httpx.Timeout(timeout)
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in _HOP_BY_HOP]
+        try:
+            r = self.client.request(
+                request.method, request.url, headers=headers, content=request.body, timeout=timeout,
+            )
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        self.num_requests += 1
+        self.http_versions[r.http_version] = self.http_versions.get(r.http_version, 0) + 1
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.reason = r.reason_phrase
+        headers = CaseInsensitiveDict()
+        for name, value in r.headers.multi_items():
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        # httpx уже распаковал и дочитал тело
+        response._content = r.content
+        response._content_consumed = True
+        response.raw = _RawShim(r.headers.get_list('set-cookie'))
+        extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def open_connections(self):
+        pool = getattr(getattr(self.client, '_transport', None), '_pool', None)
+        return len(getattr(pool, 'connections', ()) or ())
+
+    def close(self):
+        self.client.close()
+
+
+# ---------------------------------------------------------------------------
+# Сессии
+# ---------------------------------------------------------------------------
+
+def make_session(name, pool_size, http2=False, headers=None):
+    """
+    Session с пулом на pool_size соединений к каждому хосту.
+    name — метка клиента в метриках (mangabuff, telegram).
+    """
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    if headers:
+        session.headers.update(headers)
+
+    pooled = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+    session.mount('http://', pooled)
+    if http2 and http2_available():
+        # h2c (HTTP/2 без TLS) httpx не поддерживает — только https
+        session.mount('https://', HTTPXAdapter(pool_size))
+    else:
+        if http2:
+            log.warning("⚠️ HTTP/2 недоступен (нужны httpx и h2), используется HTTP/1.1")
+        session.mount('https://', pooled)
+
+    with _clients_lock:
+        _clients.append((name, weakref.ref(session)))
+    return session
+
+
+def pool_stats():
+    """{(клиент, хост): {'connections': открыто, 'requests': отправлено}}"""
+    stats = {}
+    with _clients_lock:
+        alive = [(name, ref()) for name, ref in _clients]
+        _clients[:] = [(name, weakref.ref(s)) for name, s in alive if s is not None]
+
+    for name, session in alive:
+        if session is None:
+            continue
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            if isinstance(adapter, HTTPXAdapter):
+                entry = stats.setdefault((name, 'http2'), {'connections': 0, 'requests': 0})
+                entry['connections'] += adapter.open_connections()
+                entry['requests'] += adapter.num_requests
+                continue
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                entry = stats.setdefault(
+                    (name, f"{key.key_host}:{key.key_port}"), {'connections': 0, 'requests': 0}
+                )
+                entry['connections'] += pool.num_connections
+                entry['requests'] += pool.num_requests
+    return stats
+
+
+def _collect():
+    for (name, host), entry in pool_stats().items():
+        HTTP_CONNECTIONS_OPENED.labels(name, host).set(entry['connections'])
+        HTTP_REQUESTS_SENT.labels(name, host).set(entry['requests'])
+
+
+REGISTRY.add_collector(_collect)